@@ -0,0 +1,204 @@
+# bulk_import.py
+# Bulk user onboarding and knowledge point score overrides from CSV / JSONL files.
+#
+#   python bulk_import.py users roster.csv            (columns: username, password)
+#   python bulk_import.py scores scores.jsonl --dry-run   (fields: username, topic, score)
+#
+# Rows are streamed, written with executemany in chunked transactions and re-running the
+# same file is safe: existing users are skipped (or updated with --update-passwords) and
+# score rows are upserts.
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from database import (
+    hash_password, get_user_ids_by_usernames, bulk_create_users, bulk_set_topic_scores
+)
+
+
+class RowError(ValueError):
+    pass
+
+
+def iter_records(path: str, fmt: str = None):
+    """Yield (line_no, dict) from a CSV or JSONL file without loading it into memory"""
+    fmt = fmt or ("csv" if path.lower().endswith(".csv") else "jsonl")
+    stream = sys.stdin if path == "-" else open(path, "r", encoding="utf-8-sig", newline="")
+    try:
+        if fmt == "csv":
+            for line_no, row in enumerate(csv.DictReader(stream), start=2):
+                yield line_no, {k.strip(): (v or "").strip() for k, v in row.items() if k}
+        else:
+            for line_no, line in enumerate(stream, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield line_no, json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield line_no, RowError(f"invalid JSON: {e}")
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def parse_user(record: dict) -> tuple:
+    username = str(record.get("username", "")).strip()
+    password = str(record.get("password", ""))
+    if not username:
+        raise RowError("username is empty")
+    if not password:
+        raise RowError(f"password is empty for '{username}'")
+    return username, password
+
+
+def parse_score(record: dict) -> tuple:
+    username = str(record.get("username", "")).strip()
+    topic = str(record.get("topic", "")).strip()
+    if not username or not topic:
+        raise RowError("username and topic are required")
+    try:
+        score = int(record.get("score"))
+    except (TypeError, ValueError):
+        raise RowError(f"score must be an integer, got {record.get('score')!r}")
+    if not 0 <= score <= 1000:
+        raise RowError(f"score {score} is outside 0-1000")
+    return username, topic, score
+
+
+def parsed_chunks(path: str, parser, chunk_size: int, stats: dict, fmt: str = None, progress: "Progress" = None):
+    """Validate rows and group them into chunks; invalid rows are reported and counted, not fatal"""
+    warn = progress.warn if progress is not None else print
+    records = iter_records(path, fmt)
+    while True:
+        chunk = []
+        consumed = 0
+        for line_no, record in islice(records, chunk_size):
+            consumed += 1
+            try:
+                if isinstance(record, Exception):
+                    raise record
+                if not isinstance(record, dict):
+                    raise RowError(f"expected a JSON object, got {type(record).__name__}")
+                chunk.append(parser(record))
+            except RowError as e:
+                stats["invalid"] += 1
+                warn(f"  ⚠️ line {line_no}: {e}")
+        stats["read"] += consumed
+        if chunk:
+            yield chunk
+        if consumed < chunk_size:
+            return
+
+
+class Progress:
+    """A progress line rewritten in place with \\r; warnings and the final report end it with a newline"""
+
+    def __init__(self, label: str):
+        self.label = label
+        self.start = time.monotonic()
+        self._line_open = False
+
+    def report(self, stats: dict, final: bool = False):
+        elapsed = max(time.monotonic() - self.start, 1e-6)
+        shown = ", ".join(f"{k} {v}" for k, v in stats.items())
+        end = "\n" if final else ""
+        print(f"\r{self.label}: {shown} ({stats['read'] / elapsed:.0f} rows/s)", end=end, flush=True)
+        self._line_open = not final
+
+    def warn(self, message: str):
+        # On a line of its own, so the next progress update does not overwrite it
+        self.end_line()
+        print(message, flush=True)
+
+    def end_line(self):
+        if self._line_open:
+            print(flush=True)
+            self._line_open = False
+
+
+def import_users(path: str, chunk_size: int = 500, workers: int = None, dry_run: bool = False,
+                 update_passwords: bool = False, fmt: str = None) -> dict:
+    stats = {"read": 0, "invalid": 0, "created": 0, "updated": 0, "skipped": 0}
+    progress = Progress("users" + (" [dry-run]" if dry_run else ""))
+    # bcrypt is deliberately slow, so hashing is spread over processes; DB writes stay in this process.
+    # A dry run hashes nothing and starts no processes.
+    pool = None if dry_run else ProcessPoolExecutor(max_workers=workers)
+    try:
+        for chunk in parsed_chunks(path, parse_user, chunk_size, stats, fmt, progress):
+            # Last occurrence wins if a username repeats inside the file
+            chunk = list({username: password for username, password in chunk}.items())
+            existing = get_user_ids_by_usernames([username for username, _ in chunk])
+            todo = chunk if update_passwords else [row for row in chunk if row[0] not in existing]
+            stats["skipped"] += len(chunk) - len(todo)
+
+            if not dry_run and todo:
+                hashes = pool.map(hash_password, [password for _, password in todo],
+                                  chunksize=max(1, len(todo) // (4 * (workers or os.cpu_count() or 1))))
+                bulk_create_users([(username, hashed) for (username, _), hashed in zip(todo, hashes)],
+                                  update_existing=update_passwords)
+            stats["updated"] += sum(1 for username, _ in todo if username in existing)
+            stats["created"] += sum(1 for username, _ in todo if username not in existing)
+            progress.report(stats)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        progress.report(stats, final=True)
+    return stats
+
+
+def import_scores(path: str, chunk_size: int = 1000, dry_run: bool = False, fmt: str = None) -> dict:
+    stats = {"read": 0, "invalid": 0, "written": 0, "unknown_user": 0}
+    progress = Progress("scores" + (" [dry-run]" if dry_run else ""))
+    try:
+        for chunk in parsed_chunks(path, parse_score, chunk_size, stats, fmt, progress):
+            user_ids = get_user_ids_by_usernames(list({username for username, _, _ in chunk}))
+            rows = {}
+            for username, topic, score in chunk:
+                if username not in user_ids:
+                    stats["unknown_user"] += 1
+                    continue
+                rows[(user_ids[username], topic)] = score
+            if not dry_run:
+                bulk_set_topic_scores([(uid, topic, score) for (uid, topic), score in rows.items()])
+            stats["written"] += len(rows)
+            progress.report(stats)
+    finally:
+        progress.report(stats, final=True)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk user import and knowledge point score override tool")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    users = sub.add_parser("users", help="Create users from a file with username,password")
+    users.add_argument("path", help="CSV or JSONL file, '-' for stdin")
+    users.add_argument("--chunk-size", type=int, default=500)
+    users.add_argument("--workers", type=int, default=None, help="Processes used for bcrypt hashing")
+    users.add_argument("--update-passwords", action="store_true", help="Re-hash and overwrite passwords of existing users")
+
+    scores = sub.add_parser("scores", help="Override scores from a file with username,topic,score")
+    scores.add_argument("path", help="CSV or JSONL file, '-' for stdin")
+    scores.add_argument("--chunk-size", type=int, default=1000)
+
+    for p in (users, scores):
+        p.add_argument("--format", choices=["csv", "jsonl"], default=None, help="Defaults to the file extension")
+        p.add_argument("--dry-run", action="store_true", help="Validate and report without writing")
+
+    args = parser.parse_args(argv)
+    if args.command == "users":
+        stats = import_users(args.path, args.chunk_size, args.workers, args.dry_run, args.update_passwords, args.format)
+    else:
+        stats = import_scores(args.path, args.chunk_size, args.dry_run, args.format)
+    print("✅ Done." if not stats["invalid"] else f"⚠️ Done with {stats['invalid']} invalid rows.")
+    return 0 if not stats["invalid"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
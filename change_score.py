@@ -1,42 +1,27 @@
 # update_score.py
 # change_score.py
-from database import get_db_connection
+from database import get_user_ids_by_usernames, get_topic_score, set_topic_score
 
 def set_user_topic_score(username: str, topic: str, new_score: int):
     """Manually modify the score of a specified user for a specified knowledge point"""
-    conn = get_db_connection()
     try:
-        with conn.cursor() as cursor:
-            # 1. Verify user exists and get id
-            cursor.execute("SELECT id FROM users WHERE username = %s", (username,))
-            user = cursor.fetchone()
-            
-            if not user:
-                print(f"❌ No record found for username '{username}'.")
-                return
-            
-            user_id = user['id']
-            
-            # 2. Get current score for this knowledge point (default 500 if not present)
-            cursor.execute("SELECT score FROM user_topic_scores WHERE user_id = %s AND topic = %s", (user_id, topic))
-            old_record = cursor.fetchone()
-            old_score = old_record['score'] if old_record else 500
-            
-            # 3. Insert or update new score
-            sql = """
-            INSERT INTO user_topic_scores (user_id, topic, score) 
-            VALUES (%s, %s, %s)
-            ON DUPLICATE KEY UPDATE score = VALUES(score)
-            """
-            cursor.execute(sql, (user_id, topic, new_score))
-            conn.commit()
-            
-            print(f"✅ Success! User '{username}' score for topic【{topic}】has been changed from {old_score} to {new_score}.")
+        # 1. Verify user exists and get id
+        user_id = get_user_ids_by_usernames([username]).get(username)
+        
+        if not user_id:
+            print(f"❌ No record found for username '{username}'.")
+            return
+        
+        # 2. Get current score for this knowledge point (default 500 if not present)
+        old_score = get_topic_score(user_id, topic)
+        
+        # 3. Insert or update new score
+        set_topic_score(user_id, topic, new_score)
+        
+        print(f"✅ Success! User '{username}' score for topic【{topic}】has been changed from {old_score} to {new_score}.")
             
     except Exception as e:
         print(f"❌ Error occurred while updating database: {e}")
-    finally:
-        conn.close()
 
 if __name__ == "__main__":
     print("=== 🛠️ Internal user knowledge point score modification tool ===")
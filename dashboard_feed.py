@@ -0,0 +1,183 @@
+# dashboard_feed.py
+# Live teacher dashboard: one shared in-memory snapshot, per-student deltas coalesced and pushed over SSE.
+import asyncio
+import json
+import threading
+import time
+
+from database import get_all_users_overview, get_average_score, get_user_info
+
+
+class Subscription:
+    def __init__(self, loop, snapshot, max_pending: int = 100):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=max_pending)
+        self.snapshot = snapshot
+        self.needs_resync = False
+
+    def _deliver(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Too slow to keep up: drop deltas and send a fresh snapshot instead
+            self.needs_resync = True
+
+
+class DashboardHub:
+    """Keeps the overview in memory while teachers are watching and applies answer events to it.
+
+    Students submitting at the same time are merged per user and broadcast once per flush interval,
+    so a whole room of teachers costs one aggregate query when the first one connects.
+    """
+
+    def __init__(self, load_overview=get_all_users_overview, load_average=get_average_score,
+                 load_user=get_user_info, flush_interval: float = 1.0):
+        self._load_overview = load_overview
+        self._load_average = load_average
+        self._load_user = load_user
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()   # One overview query at a time, taken before _lock, never inside it
+        self._rows = None          # user_id -> overview row, None while nobody is watching
+        self._pending = {}         # user_id -> merged delta since the last flush
+        self._subscribers = set()
+        self._flusher = None
+        self.stats = {"published": 0, "flushes": 0, "deltas_sent": 0, "snapshot_loads": 0}
+
+    # ---------- Subscribers ----------
+
+    def subscribe(self, loop) -> Subscription:
+        """Called from a worker thread: may run the one-off overview query, without blocking publishers"""
+        with self._load_lock:
+            while True:
+                with self._lock:
+                    if self._rows is not None:
+                        sub = Subscription(loop, self._snapshot_locked())
+                        self._subscribers.add(sub)
+                        if self._flusher is None or not self._flusher.is_alive():
+                            self._flusher = threading.Thread(target=self._flush_loop, name="dashboard-flush", daemon=True)
+                            self._flusher.start()
+                        return sub
+                rows = {row['id']: dict(row) for row in self._load_overview()}
+                with self._lock:
+                    # The last teacher may have left meanwhile, then the loop loads again
+                    if self._rows is None:
+                        self._rows = rows
+                        self.stats["snapshot_loads"] += 1
+
+    def unsubscribe(self, sub: Subscription):
+        with self._lock:
+            self._drop_locked(sub)
+
+    def _drop_locked(self, sub: Subscription):
+        self._subscribers.discard(sub)
+        if not self._subscribers:
+            # Nobody is watching, stop maintaining the snapshot instead of keeping it warm forever
+            self._rows = None
+            self._pending.clear()
+
+    def snapshot(self) -> list:
+        with self._lock:
+            return self._snapshot_locked() if self._rows is not None else None
+
+    def _snapshot_locked(self) -> list:
+        return sorted((dict(r) for r in self._rows.values()), key=lambda r: r['avg_score'], reverse=True)
+
+    # ---------- Publishers ----------
+
+    def publish_answer(self, user_id: int, topic: str, topic_score: int, is_correct: bool):
+        """Called from evaluate_student_answer; a no-op while no teacher is connected"""
+        with self._lock:
+            if self._rows is None:
+                return
+            self.stats["published"] += 1
+            delta = self._pending.setdefault(user_id, {"user_id": user_id, "answers": 0, "new_wrong": 0, "topic_scores": {}})
+            delta["answers"] += 1
+            delta["new_wrong"] += 0 if is_correct else 1
+            delta["topic_scores"][topic] = topic_score
+
+    # ---------- Flushing ----------
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            with self._lock:
+                if not self._subscribers:
+                    self._flusher = None
+                    return
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+
+        # Per-user lookups happen outside the lock, once per user per interval however often they submitted
+        resolved = []
+        for user_id, delta in pending.items():
+            try:
+                delta["avg_score"] = self._load_average(user_id)
+                info = None
+                with self._lock:
+                    known = self._rows is not None and user_id in self._rows
+                if not known:
+                    info = self._load_user(user_id)
+                delta["username"] = info["username"] if info else None
+            except Exception as e:
+                print(f"⚠️ Dashboard delta for user {user_id} dropped: {e}")
+                continue
+            resolved.append(delta)
+
+        with self._lock:
+            if self._rows is None:
+                return
+            for delta in resolved:
+                row = self._rows.get(delta["user_id"])
+                if row is None:
+                    row = self._rows[delta["user_id"]] = {
+                        "id": delta["user_id"], "username": delta["username"], "avg_score": 500, "wrong_count": 0
+                    }
+                row["avg_score"] = delta["avg_score"]
+                row["wrong_count"] += delta["new_wrong"]
+                delta["username"] = row["username"]
+                delta["wrong_count"] = row["wrong_count"]
+            self.stats["flushes"] += 1
+            self.stats["deltas_sent"] += len(resolved)
+            for sub in list(self._subscribers):
+                try:
+                    sub.loop.call_soon_threadsafe(sub._deliver, resolved)
+                except RuntimeError as e:
+                    # The subscriber's event loop is closed, its stream is gone without unsubscribing
+                    print(f"⚠️ Dropping dashboard subscriber: {e}")
+                    self._drop_locked(sub)
+
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+async def dashboard_events(hub: DashboardHub, is_disconnected, keepalive: float = 15.0):
+    """Async generator of SSE frames: the snapshot first, then coalesced delta batches"""
+    loop = asyncio.get_running_loop()
+    sub = await asyncio.to_thread(hub.subscribe, loop)
+    try:
+        yield sse_event("snapshot", sub.snapshot)
+        while not await is_disconnected():
+            if sub.needs_resync:
+                sub.needs_resync = False
+                while not sub.queue.empty():
+                    sub.queue.get_nowait()
+                yield sse_event("snapshot", hub.snapshot() or [])
+                continue
+            try:
+                batch = await asyncio.wait_for(sub.queue.get(), timeout=keepalive)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield sse_event("delta", batch)
+    finally:
+        hub.unsubscribe(sub)
+
+
+dashboard_hub = DashboardHub()
@@ -1,6 +1,15 @@
 # database.py
+# Storage facade: the functions below keep their historical signatures and delegate to the configured backend.
+#   DB_BACKEND=mysql  (default) MySQL server configured by DB_CONFIG, see storage_mysql.py
+#   DB_BACKEND=sqlite embedded SQLite file at SQLITE_PATH, see storage_sqlite.py
+import os
+import threading
+from collections import Counter
 import pymysql
-import bcrypt
+
+from misconception_digest import DigestCache
+from storage import Storage, hash_password, verify_password
+from tracing import traced
 
 DB_CONFIG = {
     'host': '127.0.0.1',      
@@ -11,208 +20,287 @@ DB_CONFIG = {
     'cursorclass': pymysql.cursors.DictCursor 
 }
 
-def get_db_connection():
-    return pymysql.connect(**DB_CONFIG)
+DB_BACKEND = os.getenv("DB_BACKEND", "mysql").lower()
+SQLITE_PATH = os.getenv("SQLITE_PATH", "ai_tutor.db")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
 
-def hash_password(password: str) -> str:
-    salt = bcrypt.gensalt()
-    hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
-    return hashed.decode('utf-8')
+# Wrong question inserts through a spooled write-behind buffer (write_behind.py) instead of one transaction each
+WRONG_QUESTION_WRITE_BEHIND = os.getenv("WRONG_QUESTION_WRITE_BEHIND", "0") == "1"
+WRITE_BEHIND_SPOOL_DIR = os.getenv("WRITE_BEHIND_SPOOL_DIR", "spool/wrong_questions")
+WRITE_BEHIND_BATCH = int(os.getenv("WRITE_BEHIND_BATCH", "200"))
+WRITE_BEHIND_INTERVAL = float(os.getenv("WRITE_BEHIND_INTERVAL", "1.0"))
 
-def verify_password(password: str, hashed: str) -> bool:
-    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+_storage = None
+_storage_lock = threading.Lock()
+_write_behind = None
+_digests = None
 
-def create_user(username, plain_password):
-    conn = get_db_connection()
+def open_storage(backend: str = DB_BACKEND) -> Storage:
+    if backend == "sqlite":
+        from storage_sqlite import SQLiteStorage
+        return SQLiteStorage(SQLITE_PATH)
+    if backend == "mysql":
+        from storage_mysql import MySQLStorage
+        return MySQLStorage(DB_CONFIG, pool_size=DB_POOL_SIZE)
+    raise ValueError(f"Unknown DB_BACKEND '{backend}', expected 'mysql' or 'sqlite'")
+
+def get_storage() -> Storage:
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = open_storage()
+    return _storage
+
+def set_storage(storage: Storage) -> Storage:
+    """Swap the active backend (tests, benchmarks); returns the previous one"""
+    global _storage, _digests
+    with _storage_lock:
+        previous, _storage = _storage, storage
+        _digests = None
+    return previous
+
+def get_write_behind():
+    """The wrong question write-behind buffer, started on first use; None when disabled"""
+    global _write_behind
+    if _write_behind is None and WRONG_QUESTION_WRITE_BEHIND:
+        with _storage_lock:
+            if _write_behind is None:
+                from write_behind import WrongQuestionWriteBehind
+                _write_behind = WrongQuestionWriteBehind(
+                    _write_wrong_question_batch, WRITE_BEHIND_SPOOL_DIR, max_batch=WRITE_BEHIND_BATCH, flush_interval=WRITE_BEHIND_INTERVAL)
+    return _write_behind
+
+def _write_wrong_question_batch(batch_id: str, rows: list) -> bool:
+    applied = get_storage().record_wrong_questions_batch(batch_id, rows)
+    # Digests of the buffered records were updated in memory only, they are saved along with the batch
+    _persist_digests()
+    return applied
+
+def set_write_behind(buffer):
+    """Swap the write-behind buffer (tests); returns the previous one"""
+    global _write_behind
+    with _storage_lock:
+        previous, _write_behind = _write_behind, buffer
+    return previous
+
+def start_write_behind() -> dict:
+    """Start the buffer and flush spool files left by a previous run"""
+    buffer = get_write_behind()
+    if buffer is None:
+        return {"enabled": False}
+    return {"enabled": True, "replayed_rows": buffer.flush()}
+
+def close_write_behind():
+    if _write_behind is not None:
+        _write_behind.close()
+
+def get_digest_cache() -> DigestCache:
+    global _digests
+    if _digests is None:
+        with _storage_lock:
+            if _digests is None:
+                _digests = DigestCache(get_storage)
+    return _digests
+
+def _warm_digests(user_id):
     try:
-        with conn.cursor() as cursor:
-            cursor.execute("SELECT id FROM users WHERE username = %s", (username,))
-            if cursor.fetchone():
-                return False, "Username already exists, please login directly or choose another username"
-            
-            sql = "INSERT INTO users (username, password_hash) VALUES (%s, %s)"
-            cursor.execute(sql, (username, hash_password(plain_password)))
-        conn.commit() 
-        return True, "Registration successful"
+        get_digest_cache().warm(user_id)
     except Exception as e:
-        return False, f"Registration failed: {e}"
-    finally:
-        conn.close()
+        print(f"⚠️ Failed to load misconception digests: {e}")
 
-def verify_user_login(username, plain_password):
-    conn = get_db_connection()
+def _fold_digests(rows: list, committed: bool):
     try:
-        with conn.cursor() as cursor:
-            sql = "SELECT id, password_hash FROM users WHERE username = %s"
-            cursor.execute(sql, (username,))
-            user = cursor.fetchone()
-            if user and verify_password(plain_password, user['password_hash']):
-                return user['id']
-        return None
-    finally:
-        conn.close()
+        get_digest_cache().record(rows, committed, persist=False)
+    except Exception as e:
+        print(f"⚠️ Failed to update misconception digest: {e}")
 
-def get_user_info(user_id: int) -> dict:
-    conn = get_db_connection()
+def _persist_digests():
     try:
-        with conn.cursor() as cursor:
-            cursor.execute("SELECT id, username FROM users WHERE id = %s", (user_id,))
-            return cursor.fetchone()
-    finally:
-        conn.close()
+        get_digest_cache().persist()
+    except Exception as e:
+        print(f"⚠️ Failed to save misconception digests, will retry with the next update: {e}")
+
+def get_db_connection():
+    """Raw pooled pymysql connection, for ad-hoc MySQL maintenance only"""
+    storage = get_storage()
+    if storage.name != "mysql":
+        raise RuntimeError(f"get_db_connection() needs the MySQL backend, DB_BACKEND is '{storage.name}'")
+    return storage.connection()
+
+def warm_pool(size: int = None) -> int:
+    """Pre-open connections so the first requests skip connection setup"""
+    return get_storage().warm_up(size)
+
+def ensure_schema():
+    get_storage().ensure_schema()
+
+def reset_all_data():
+    get_storage().reset_all_data()
+    get_digest_cache().clear()
+
+@traced("db.create_user")
+def create_user(username, plain_password):
+    return get_storage().create_user(username, plain_password)
+
+@traced("db.verify_user_login")
+def verify_user_login(username, plain_password):
+    return get_storage().verify_user_login(username, plain_password)
+
+@traced("db.get_user_info")
+def get_user_info(user_id: int) -> dict:
+    return get_storage().get_user_info(user_id)
 
 # ================= Knowledge Point Score System =================
 
+@traced("db.get_topic_score")
 def get_topic_score(user_id: int, topic: str) -> int:
-    conn = get_db_connection()
-    try:
-        with conn.cursor() as cursor:
-            sql = "SELECT score FROM user_topic_scores WHERE user_id = %s AND topic = %s"
-            cursor.execute(sql, (user_id, topic))
-            result = cursor.fetchone()
-            return result['score'] if result else 500
-    finally:
-        conn.close()
+    return get_storage().get_topic_score(user_id, topic)
 
+@traced("db.update_topic_score")
 def update_topic_score(user_id: int, topic: str, score_change: int) -> int:
-    conn = get_db_connection()
-    try:
-        with conn.cursor() as cursor:
-            sql_insert = "INSERT IGNORE INTO user_topic_scores (user_id, topic, score) VALUES (%s, %s, 500)"
-            cursor.execute(sql_insert, (user_id, topic))
-
-            sql_update = """
-            UPDATE user_topic_scores 
-            SET score = GREATEST(0, LEAST(1000, score + %s)) 
-            WHERE user_id = %s AND topic = %s
-            """
-            cursor.execute(sql_update, (score_change, user_id, topic))
-
-            sql_select = "SELECT score FROM user_topic_scores WHERE user_id = %s AND topic = %s"
-            cursor.execute(sql_select, (user_id, topic))
-            new_score = cursor.fetchone()['score']
-            
-        conn.commit()
-        return new_score
-    finally:
-        conn.close()
+    return get_storage().update_topic_score(user_id, topic, score_change)
 
+@traced("db.get_all_topic_scores")
 def get_all_topic_scores(user_id: int) -> dict:
-    conn = get_db_connection()
-    try:
-        with conn.cursor() as cursor:
-            sql = "SELECT topic, score FROM user_topic_scores WHERE user_id = %s"
-            cursor.execute(sql, (user_id,))
-            results = cursor.fetchall()
-            return {row['topic']: row['score'] for row in results}
-    finally:
-        conn.close()
+    return get_storage().get_all_topic_scores(user_id)
 
+@traced("db.get_average_score")
 def get_average_score(user_id: int) -> int:
-    conn = get_db_connection()
-    try:
-        with conn.cursor() as cursor:
-            sql = "SELECT AVG(score) as avg_score FROM user_topic_scores WHERE user_id = %s"
-            cursor.execute(sql, (user_id,))
-            result = cursor.fetchone()
-            return int(result['avg_score']) if result and result['avg_score'] is not None else 500
-    finally:
-        conn.close()
+    return get_storage().get_average_score(user_id)
 
 # ✨ New: Score override function to forcefully set initial difficulty
+@traced("db.set_topic_score")
 def set_topic_score(user_id: int, topic: str, score: int):
-    conn = get_db_connection()
-    try:
-        with conn.cursor() as cursor:
-            sql = """
-            INSERT INTO user_topic_scores (user_id, topic, score) 
-            VALUES (%s, %s, %s)
-            ON DUPLICATE KEY UPDATE score = VALUES(score)
-            """
-            cursor.execute(sql, (user_id, topic, score))
-        conn.commit()
-    finally:
-        conn.close()
+    return get_storage().set_topic_score(user_id, topic, score)
 
 # ================= Wrong Question System =================
 
+# With write-behind enabled the readers below merge the user's not yet flushed records (read-your-writes)
+
+@traced("db.record_wrong_question_to_db")
 def record_wrong_question_to_db(user_id: int, category: str, content: str, student_ans: str, correct_ans: str, root_cause: str, improvement: str):
-    conn = get_db_connection()
-    try:
-        with conn.cursor() as cursor:
-            sql = """
-            INSERT INTO wrong_questions 
-            (user_id, category, question_content, student_answer, correct_answer, root_cause, improvement) 
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-            """
-            cursor.execute(sql, (user_id, category, content, student_ans, correct_ans, root_cause, improvement))
-        conn.commit()
-    finally:
-        conn.close()
+    # Digests are loaded before the insert and folded only after it succeeded
+    row = (user_id, category, content, student_ans, correct_ans, root_cause, improvement)
+    _warm_digests(user_id)
+    buffer = get_write_behind()
+    if buffer is not None:
+        result = buffer.add(*row)
+        _fold_digests([row], committed=False)
+        return result
+    get_storage().record_wrong_question_to_db(*row)
+    _fold_digests([row], committed=True)
+    _persist_digests()
 
+@traced("db.record_quiz_results")
+def record_quiz_results(user_id: int, score_changes: list, wrong_rows: list) -> list:
+    """Score deltas and wrong questions of a submitted quiz in one transaction (not through the write-behind
+    buffer, the rows commit together with the scores); returns the score after each delta"""
+    _warm_digests(user_id)
+    scores = get_storage().record_quiz_results(user_id, score_changes, wrong_rows)
+    _fold_digests(wrong_rows, committed=True)
+    _persist_digests()
+    return scores
+
+@traced("db.get_user_weaknesses")
 def get_user_weaknesses(user_id: int) -> list:
-    conn = get_db_connection()
-    try:
-        with conn.cursor() as cursor:
-            sql = "SELECT DISTINCT category FROM wrong_questions WHERE user_id = %s"
-            cursor.execute(sql, (user_id,))
-            results = cursor.fetchall()
-            return [row['category'] for row in results]
-    finally:
-        conn.close()
+    buffer = get_write_behind()
+    if buffer is None:
+        return get_storage().get_user_weaknesses(user_id)
+    pending, weaknesses = buffer.read_through(lambda: get_storage().get_user_weaknesses(user_id), user_id)
+    for record in pending:
+        if record['category'] not in weaknesses:
+            weaknesses.append(record['category'])
+    return weaknesses
 
+@traced("db.get_wrong_questions_details")
 def get_wrong_questions_details(user_id: int) -> list:
-    conn = get_db_connection()
-    try:
-        with conn.cursor() as cursor:
-            sql = """
-            SELECT category, question_content, student_answer, correct_answer, root_cause, improvement
-            FROM wrong_questions 
-            WHERE user_id = %s 
-            ORDER BY id DESC
-            """
-            cursor.execute(sql, (user_id,))
-            return cursor.fetchall()
-    finally:
-        conn.close()
+    buffer = get_write_behind()
+    if buffer is None:
+        return get_storage().get_wrong_questions_details(user_id)
+    pending, rows = buffer.read_through(lambda: get_storage().get_wrong_questions_details(user_id), user_id)
+    fields = ('category', 'question_content', 'student_answer', 'correct_answer', 'root_cause', 'improvement')
+    return [{k: record[k] for k in fields} for record in reversed(pending)] + list(rows)
 
+@traced("db.get_wrong_questions_by_topic")
 def get_wrong_questions_by_topic(user_id: int, topic: str, limit: int = 3) -> list:
-    conn = get_db_connection()
-    try:
-        with conn.cursor() as cursor:
-            sql = """
-            SELECT question_content, student_answer, correct_answer 
-            FROM wrong_questions 
-            WHERE user_id = %s AND category LIKE %s
-            ORDER BY id DESC LIMIT %s
-            """
-            cursor.execute(sql, (user_id, f"%{topic}%", limit))
-            return cursor.fetchall()
-    finally:
-        conn.close()
+    buffer = get_write_behind()
+    if buffer is None:
+        return get_storage().get_wrong_questions_by_topic(user_id, topic, limit)
+    pending, rows = buffer.read_through(lambda: get_storage().get_wrong_questions_by_topic(user_id, topic, limit), user_id)
+    fields = ('question_content', 'student_answer', 'correct_answer')
+    matching = [{k: record[k] for k in fields} for record in reversed(pending)
+                if topic.lower() in (record['category'] or '').lower()]
+    return (matching + list(rows))[:limit]
+
+# ================= Misconception Digests (misconception_digest.py) =================
+
+@traced("db.get_topic_digests")
+def get_topic_digests(user_id: int, topic: str, limit: int = 2) -> list:
+    """Bounded summaries of the user's wrong answers on knowledge points matching `topic`"""
+    return get_digest_cache().for_topic(user_id, topic, limit)
+
+@traced("db.get_top_digests")
+def get_top_digests(user_id: int, limit: int = 8) -> list:
+    """The user's weakest knowledge points, most wrong answers first"""
+    return get_digest_cache().top(user_id, limit)
+
+# ================= Bulk Operations (bulk_import.py) =================
+
+def get_user_ids_by_usernames(usernames: list) -> dict:
+    return get_storage().get_user_ids_by_usernames(usernames)
+
+def bulk_create_users(rows: list, update_existing: bool = False) -> int:
+    """rows: [(username, password_hash)], written in one transaction. Returns affected row count."""
+    return get_storage().bulk_create_users(rows, update_existing)
+
+def bulk_set_topic_scores(rows: list) -> int:
+    """rows: [(user_id, topic, score)], upserted in one transaction. Returns affected row count."""
+    return get_storage().bulk_set_topic_scores(rows)
+
+# ================= Wrong Question Export / Archive =================
+
+def iter_wrong_questions(user_ids: list = None, batch_size: int = 1000):
+    """Stream wrong question rows (oldest first) in constant memory"""
+    if get_write_behind() is not None:
+        get_write_behind().flush()
+    return get_storage().iter_wrong_questions(user_ids, batch_size)
+
+def get_wrong_questions_older_than(cutoff, after_id: int = 0, limit: int = 1000) -> list:
+    return get_storage().get_wrong_questions_older_than(cutoff, after_id, limit)
+
+def count_wrong_questions_by_ids(ids: list) -> int:
+    return get_storage().count_wrong_questions_by_ids(ids)
+
+def archive_wrong_questions(ids: list, summary_rows: list):
+    """Fold archived rows into the summary and delete them from the hot table in one transaction.
+
+    summary_rows: [(user_id, category, count)]
+    """
+    return get_storage().archive_wrong_questions(ids, summary_rows)
+
+@traced("db.get_archived_category_counts")
+def get_archived_category_counts(user_id: int) -> dict:
+    return get_storage().get_archived_category_counts(user_id)
 
 # ================= Teacher Side / Admin Management =================
 
+@traced("db.get_all_users_overview")
 def get_all_users_overview() -> list:
-    conn = get_db_connection()
-    try:
-        with conn.cursor() as cursor:
-            # Combined query: get user ID, username, average score (default 500 if none), and total wrong question count
-            sql = """
-            SELECT 
-                u.id, 
-                u.username,
-                IFNULL(CAST(AVG(uts.score) AS SIGNED), 500) as avg_score,
-                (SELECT COUNT(*) FROM wrong_questions wq WHERE wq.user_id = u.id) as wrong_count
-            FROM users u
-            LEFT JOIN user_topic_scores uts ON u.id = uts.user_id
-            GROUP BY u.id, u.username
-            ORDER BY avg_score DESC
-            """
-            cursor.execute(sql)
-            return cursor.fetchall()
-    finally:
-        conn.close()
+    buffer = get_write_behind()
+    if buffer is None:
+        return get_storage().get_all_users_overview()
+    pending, rows = buffer.read_through(get_storage().get_all_users_overview)
+    pending_counts = Counter(record['user_id'] for record in pending)
+    for row in rows:
+        row['wrong_count'] += pending_counts.get(row['id'], 0)
+    return rows
 
 if __name__ == "__main__":
-    print("Database module ready.")
\ No newline at end of file
+    import sys
+    if sys.argv[1:] == ["init"]:
+        # Schema changes are a deploy step, run once; the API workers never issue DDL themselves
+        ensure_schema()
+        print(f"✅ Schema is up to date ({DB_BACKEND} backend).")
+    else:
+        print(f"Database module ready ({DB_BACKEND} backend). Run 'python database.py init' to create or upgrade the tables.")
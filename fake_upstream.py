@@ -0,0 +1,140 @@
+# fake_upstream.py
+# Fault-injecting local stand-ins for the DeepSeek (OpenAI-compatible) and Exa APIs.
+# Used by the tests and handy for reproducing slow / flaky upstream behaviour by hand.
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+
+class FaultPlan:
+    """Describes how an upstream misbehaves: extra latency, stalls and errors"""
+
+    def __init__(self, latency: float = 0.0, stall_rate: float = 0.0, stall_seconds: float = 30.0,
+                 error_rate: float = 0.0, slow_first: int = 0, seed: int = 0):
+        self.latency = latency
+        self.stall_rate = stall_rate          # Fraction of requests that hang for stall_seconds
+        self.stall_seconds = stall_seconds
+        self.error_rate = error_rate          # Fraction of requests answered with HTTP 500 / an exception
+        self.slow_first = slow_first          # The first N requests always stall (deterministic outliers)
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+
+    def next_fault(self) -> str:
+        with self._lock:
+            self.requests += 1
+            if self.requests <= self.slow_first:
+                return "stall"
+            roll = self._rng.random()
+        if roll < self.error_rate:
+            return "error"
+        if roll < self.error_rate + self.stall_rate:
+            return "stall"
+        return "ok"
+
+
+class FakeOpenAIServer:
+    """Minimal /v1/chat/completions server.
+
+    `responder(request_json) -> str` produces the assistant message content.
+    """
+
+    def __init__(self, responder=None, plan: FaultPlan = None, model: str = "fake-model"):
+        self.responder = responder or (lambda body: "{}")
+        self.plan = plan or FaultPlan()
+        self.model = model
+        self.received = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                server.received.append(body)
+
+                fault = server.plan.next_fault()
+                time.sleep(server.plan.latency)
+                if fault == "stall":
+                    time.sleep(server.plan.stall_seconds)
+                if fault == "error":
+                    self._send(500, {"error": {"message": "injected failure", "type": "server_error"}})
+                    return
+
+                content = server.responder(body)
+                self._send(200, {
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body.get("model", server.model),
+                    "choices": [{
+                        "index": 0,
+                        "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": content},
+                    }],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+                })
+
+            def _send(self, status, payload):
+                data = json.dumps(payload).encode("utf-8")
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client already gave up on this request (timeout / hedge winner)
+                    pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class FakeExa:
+    """In-process replacement for exa_py.Exa exposing search_and_contents()"""
+
+    def __init__(self, results=None, plan: FaultPlan = None):
+        self.results = results if results is not None else [
+            ("Fake Source", "Fake background knowledge about the requested topic."),
+        ]
+        self.plan = plan or FaultPlan()
+        self.queries = []
+
+    def search_and_contents(self, query, num_results=2, text=True, **kwargs):
+        self.queries.append(query)
+        fault = self.plan.next_fault()
+        time.sleep(self.plan.latency)
+        if fault == "stall":
+            time.sleep(self.plan.stall_seconds)
+        if fault == "error":
+            raise RuntimeError("injected Exa failure")
+        return SimpleNamespace(results=[
+            SimpleNamespace(title=title, text=text_, url=f"https://example.invalid/{i}")
+            for i, (title, text_) in enumerate(self.results[:num_results])
+        ])
@@ -0,0 +1,21 @@
+# file_lock.py
+# Advisory, non-blocking, process-wide exclusive locks on a file; released when the process exits.
+try:
+    import fcntl
+except ImportError:    # Windows
+    fcntl = None
+    import msvcrt
+
+
+def try_lock(path: str):
+    """Exclusive non-blocking lock on `path`: the open lock file (close it to release), or None if another process holds it"""
+    handle = open(path, "a+b")
+    try:
+        if fcntl is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        handle.close()
+        return None
+    return handle
@@ -0,0 +1,425 @@
+# knowledge_index.py
+# Local BM25 retrieval over ingested course notes and captured Exa results, as an offline tier ahead of Exa.
+#
+#   python knowledge_index.py ingest ./notes --index knowledge_index
+#   python knowledge_index.py search "Python Programming decorators" --index knowledge_index
+#
+# On disk the index is a list of immutable segments (one per add_documents call) plus manifest.json:
+#   seg-N.lex   term -> [postings offset, document frequency]   (JSON)
+#   seg-N.post  (doc, tf) uint32 pairs, memory-mapped
+#   seg-N.len   document lengths, uint32, memory-mapped
+#   seg-N.docs  JSONL documents, seg-N.doff their byte offsets (uint64), both memory-mapped
+#
+# One writer per index directory: the first process to open it holds writer.lock, later ones (other
+# workers, the CLI while the API runs) open it read-only and cannot add documents. Read-only instances
+# reload the segment list before a search whenever manifest.json was replaced.
+# Exa results are captured by a background thread (capture()), which also compacts once there are more
+# than MAX_SEGMENTS segments, so requests never pay for indexing.
+import argparse
+import hashlib
+import heapq
+import json
+import math
+import mmap
+import os
+import re
+import sys
+import threading
+import time
+from array import array
+from collections import Counter
+from dataclasses import dataclass
+
+from file_lock import try_lock
+
+TOKEN_RE = re.compile(r"[a-z0-9_]+|[㐀-鿿]+")
+STOPWORDS = {"a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "is", "it", "of",
+             "on", "or", "that", "the", "this", "to", "was", "with"}
+MAX_SEGMENTS = 8
+SEGMENT_SUFFIXES = (".lex", ".keys", ".post", ".len", ".docs", ".doff")
+
+
+def tokenize(text: str) -> list:
+    """Lowercased latin words, plus overlapping bigrams for CJK runs (no word segmentation available)"""
+    tokens = []
+    for match in TOKEN_RE.findall(text.lower()):
+        if match[0] >= "㐀":
+            tokens.extend(match[i:i + 2] for i in range(max(1, len(match) - 1)))
+        elif match not in STOPWORDS:
+            tokens.append(match)
+    return tokens
+
+
+def doc_key(doc: dict) -> str:
+    return doc.get("url") or hashlib.sha1((doc.get("title", "") + "\n" + doc.get("text", "")).encode("utf-8")).hexdigest()
+
+
+@dataclass
+class SearchHit:
+    title: str
+    text: str
+    score: float
+    coverage: float      # Share of distinct query terms found in this document
+    source: str = ""
+
+
+def _map(path: str):
+    """Memory-map a file read-only; returns None for empty files (mmap can't map 0 bytes)"""
+    if os.path.getsize(path) == 0:
+        return None
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class _Segment:
+    def __init__(self, directory: str, name: str):
+        self.name = name
+        base = os.path.join(directory, name)
+        with open(base + ".lex", "r", encoding="utf-8") as f:
+            self.lexicon = json.load(f)
+        with open(base + ".keys", "r", encoding="utf-8") as f:
+            self.keys = json.load(f)
+        self._post_map = _map(base + ".post")
+        self._len_map = _map(base + ".len")
+        self._docs_map = _map(base + ".docs")
+        self._doff_map = _map(base + ".doff")
+        self.postings = memoryview(self._post_map).cast("I") if self._post_map else memoryview(array("I"))
+        self.lengths = memoryview(self._len_map).cast("I") if self._len_map else memoryview(array("I"))
+        self.offsets = memoryview(self._doff_map).cast("Q") if self._doff_map else memoryview(array("Q"))
+        self.doc_count = len(self.lengths)
+        self.total_length = sum(self.lengths)
+
+    def document(self, doc_id: int) -> dict:
+        start = self.offsets[doc_id]
+        end = self.offsets[doc_id + 1] if doc_id + 1 < self.doc_count else len(self._docs_map)
+        return json.loads(self._docs_map[start:end])
+
+    def iter_documents(self):
+        for doc_id in range(self.doc_count):
+            yield self.document(doc_id)
+
+    @staticmethod
+    def write(directory: str, name: str, docs: list):
+        base = os.path.join(directory, name)
+        postings = {}
+        lengths = array("I")
+        offsets = array("Q")
+        position = 0
+        with open(base + ".docs", "wb") as docs_file:
+            for doc_id, doc in enumerate(docs):
+                terms = tokenize(" ".join((doc.get("tags", ""), doc.get("title", ""), doc.get("text", ""))))
+                lengths.append(len(terms))
+                for term, tf in Counter(terms).items():
+                    postings.setdefault(term, []).append((doc_id, tf))
+                line = (json.dumps(doc, ensure_ascii=False) + "\n").encode("utf-8")
+                offsets.append(position)
+                docs_file.write(line)
+                position += len(line)
+
+        flat = array("I")
+        lexicon = {}
+        for term in sorted(postings):
+            lexicon[term] = [len(flat) // 2, len(postings[term])]
+            for doc_id, tf in postings[term]:
+                flat.append(doc_id)
+                flat.append(tf)
+        for suffix, data in ((".post", flat), (".len", lengths), (".doff", offsets)):
+            with open(base + suffix, "wb") as f:
+                data.tofile(f)
+        with open(base + ".keys", "w", encoding="utf-8") as f:
+            json.dump([doc_key(doc) for doc in docs], f)
+        # The lexicon is written last: a segment without it is incomplete and never listed in the manifest
+        with open(base + ".lex", "w", encoding="utf-8") as f:
+            json.dump(lexicon, f, ensure_ascii=False)
+
+
+class KnowledgeIndex:
+    """BM25 (k1=1.5, b=0.75) over all segments, with corpus statistics computed across segments"""
+
+    k1 = 1.5
+    b = 0.75
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._write_lock = threading.Lock()
+        self._lock_file = try_lock(os.path.join(directory, "writer.lock"))
+        self._reload_lock = threading.Lock()
+        self._manifest_stamp = self._stat_manifest()
+        manifest, self._segments = self._load_segments()
+        self._next_id = manifest["next_id"]
+        self._keys = {key for seg in self._segments for key in seg.keys}
+        # Background capture queue
+        self._pending = []
+        self._capturing = False
+        self._capture_cond = threading.Condition()
+        self._capture_thread = None
+        if not self.read_only:
+            # Leftovers of compactions or of a crash in the middle of writing a segment
+            self.remove_unused_files()
+
+    @classmethod
+    def open(cls, directory: str) -> "KnowledgeIndex":
+        return cls(directory)
+
+    @property
+    def read_only(self) -> bool:
+        return self._lock_file is None
+
+    def close(self, timeout: float = 5.0):
+        """Finish queued captures and give up the writer lock"""
+        self.wait_captured(timeout)
+        with self._write_lock:
+            if self._lock_file is not None:
+                self._lock_file.close()
+                self._lock_file = None
+
+    def __len__(self):
+        return sum(seg.doc_count for seg in self._current_segments())
+
+    def _read_manifest(self) -> dict:
+        path = os.path.join(self.directory, "manifest.json")
+        if not os.path.exists(path):
+            return {"segments": [], "next_id": 1}
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _stat_manifest(self):
+        try:
+            stat = os.stat(os.path.join(self.directory, "manifest.json"))
+        except FileNotFoundError:
+            return None
+        # The manifest is replaced by rename, so a new inode marks a new version even within one mtime tick
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _load_segments(self, reuse: tuple = ()):
+        """(manifest, segments); segments already open in `reuse` are kept rather than mapped again"""
+        for attempt in range(5):
+            manifest = self._read_manifest()
+            opened = {seg.name: seg for seg in reuse}
+            try:
+                return manifest, tuple(opened.get(name) or _Segment(self.directory, name) for name in manifest["segments"])
+            except FileNotFoundError:
+                # The writer compacted these segments away between reading the manifest and opening them
+                if attempt == 4:
+                    raise
+                time.sleep(0.05)
+
+    def _write_manifest(self, names: list):
+        path = os.path.join(self.directory, "manifest.json")
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"segments": names, "next_id": self._next_id}, f)
+        os.replace(path + ".tmp", path)
+
+    # ---------- Writing ----------
+
+    def add_documents(self, docs: list) -> int:
+        """Index new documents ({title, text, tags?, source?, url?}) as one new segment; duplicates are skipped"""
+        with self._write_lock:
+            self._check_writable()
+            fresh = []
+            for doc in docs:
+                key = doc_key(doc)
+                if doc.get("text") and key not in self._keys:
+                    self._keys.add(key)
+                    fresh.append(doc)
+            if not fresh:
+                return 0
+            name = self._new_segment_name()
+            _Segment.write(self.directory, name, fresh)
+            self._publish(self._segments + (_Segment(self.directory, name),))
+            return len(fresh)
+
+    def capture(self, docs: list):
+        """Queue documents for add_documents on the background capture thread; returns immediately.
+        Documents queued while a capture is running are written together as one segment."""
+        if self.read_only:
+            return
+        with self._capture_cond:
+            self._pending.extend(docs)
+            if self._capture_thread is None:
+                self._capture_thread = threading.Thread(target=self._capture_loop, name="index-capture", daemon=True)
+                self._capture_thread.start()
+            self._capture_cond.notify_all()
+
+    def _capture_loop(self):
+        while True:
+            with self._capture_cond:
+                while not self._pending:
+                    self._capture_cond.wait()
+                docs, self._pending = self._pending, []
+                self._capturing = True
+            try:
+                self.add_documents(docs)
+                if len(self._segments) > MAX_SEGMENTS:
+                    self.compact()
+            except Exception as e:
+                print(f"⚠️ Failed to capture documents into the local index: {e}")
+            finally:
+                with self._capture_cond:
+                    self._capturing = False
+                    self._capture_cond.notify_all()
+
+    def wait_captured(self, timeout: float = None) -> bool:
+        """Block until every queued capture is indexed; False on timeout"""
+        with self._capture_cond:
+            return self._capture_cond.wait_for(lambda: not self._pending and not self._capturing, timeout)
+
+    def compact(self):
+        with self._write_lock:
+            self._check_writable()
+            self._compact_locked()
+
+    def _check_writable(self):
+        if self.read_only:
+            raise RuntimeError(f"Knowledge index '{self.directory}' is opened read-only, another process holds its writer lock")
+
+    def _compact_locked(self):
+        if len(self._segments) <= 1:
+            return
+        docs = [doc for seg in self._segments for doc in seg.iter_documents()]
+        name = self._new_segment_name()
+        _Segment.write(self.directory, name, docs)
+        replaced = self._segments
+        self._publish((_Segment(self.directory, name),))
+        # Readers still holding the previous snapshot keep their memory maps of the unlinked files;
+        # where a mapped file can't be removed (Windows) it is left for remove_unused_files() on the next open
+        for seg in replaced:
+            for suffix in SEGMENT_SUFFIXES:
+                try:
+                    os.remove(os.path.join(self.directory, seg.name + suffix))
+                except OSError:
+                    pass
+
+    def _new_segment_name(self) -> str:
+        name = f"seg-{self._next_id:06d}"
+        self._next_id += 1
+        return name
+
+    def _publish(self, segments: tuple):
+        self._write_manifest([seg.name for seg in segments])
+        self._segments = segments   # Atomic swap, readers keep whichever tuple they started with
+
+    def remove_unused_files(self):
+        with self._write_lock:
+            self._check_writable()
+            live = {seg.name for seg in self._segments}
+            for filename in os.listdir(self.directory):
+                if filename.startswith("seg-") and filename.split(".")[0] not in live:
+                    try:
+                        os.remove(os.path.join(self.directory, filename))
+                    except OSError:
+                        pass
+
+    # ---------- Reading ----------
+
+    def _current_segments(self) -> tuple:
+        """The segments to read; a read-only instance first picks up what the writer process published"""
+        if self.read_only:
+            stamp = self._stat_manifest()
+            if stamp != self._manifest_stamp:
+                with self._reload_lock:
+                    if stamp != self._manifest_stamp:
+                        try:
+                            _, self._segments = self._load_segments(self._segments)
+                            self._manifest_stamp = stamp
+                        except (OSError, ValueError) as e:
+                            print(f"⚠️ Failed to reload the local knowledge index, keeping the previous segments: {e}")
+        return self._segments
+
+    def search(self, query: str, k: int = 2) -> list:
+        segments = self._current_segments()
+        terms = list(dict.fromkeys(tokenize(query)))
+        total_docs = sum(seg.doc_count for seg in segments)
+        if not terms or not total_docs:
+            return []
+        avgdl = sum(seg.total_length for seg in segments) / total_docs
+
+        dfs = {term: sum(seg.lexicon[term][1] for seg in segments if term in seg.lexicon) for term in terms}
+        scores = {}
+        matched = Counter()
+        for seg_no, seg in enumerate(segments):
+            postings, lengths = seg.postings, seg.lengths
+            for term in terms:
+                entry = seg.lexicon.get(term)
+                if entry is None:
+                    continue
+                offset, df = entry
+                idf = math.log(1 + (total_docs - dfs[term] + 0.5) / (dfs[term] + 0.5))
+                for i in range(offset * 2, (offset + df) * 2, 2):
+                    doc_id, tf = postings[i], postings[i + 1]
+                    norm = self.k1 * (1 - self.b + self.b * lengths[doc_id] / avgdl)
+                    key = (seg_no, doc_id)
+                    scores[key] = scores.get(key, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+                    matched[key] += 1
+
+        hits = []
+        for (seg_no, doc_id), score in heapq.nlargest(k, scores.items(), key=lambda item: item[1]):
+            doc = segments[seg_no].document(doc_id)
+            hits.append(SearchHit(doc.get("title", ""), doc.get("text", ""), score,
+                                  matched[(seg_no, doc_id)] / len(terms), doc.get("source", "")))
+        return hits
+
+
+def format_context(hits: list, limit: int = 1000, label: str = "Content Summary") -> str:
+    """Same context block shape the Exa path produces"""
+    return "\n\n".join(f"Source: {hit.title}\n{label}: {hit.text[:limit]}" for hit in hits)
+
+
+# ================= Ingestion CLI =================
+
+def chunk_note(title: str, text: str, size: int = 1500) -> list:
+    """Split a note on blank lines into chunks of about `size` characters"""
+    chunks, current = [], ""
+    for paragraph in re.split(r"\n\s*\n", text):
+        if current and len(current) + len(paragraph) > size:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n\n{paragraph}".strip()
+    if current:
+        chunks.append(current)
+    return [{"title": title if len(chunks) == 1 else f"{title} ({i + 1}/{len(chunks)})", "text": chunk, "source": "notes"}
+            for i, chunk in enumerate(chunks)]
+
+def ingest_directory(index: KnowledgeIndex, path: str) -> int:
+    docs = []
+    for root, _, files in os.walk(path):
+        for filename in sorted(files):
+            if filename.lower().endswith((".md", ".txt")):
+                with open(os.path.join(root, filename), "r", encoding="utf-8") as f:
+                    docs.extend(chunk_note(os.path.splitext(filename)[0], f.read()))
+    return index.add_documents(docs)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local BM25 knowledge index")
+    parser.add_argument("--index", default=os.getenv("KNOWLEDGE_INDEX_DIR", "knowledge_index"))
+    sub = parser.add_subparsers(dest="command", required=True)
+    ingest = sub.add_parser("ingest", help="Index .md/.txt course notes from a directory")
+    ingest.add_argument("path")
+    search = sub.add_parser("search", help="Query the index")
+    search.add_argument("query")
+    search.add_argument("-k", type=int, default=3)
+    sub.add_parser("compact", help="Merge all segments into one")
+
+    args = parser.parse_args(argv)
+    index = KnowledgeIndex.open(args.index)
+    if args.command != "search" and index.read_only:
+        print(f"❌ {args.index} is being written by another process (e.g. the running API), stop it first.")
+        return 1
+    if args.command == "ingest":
+        print(f"✅ Indexed {ingest_directory(index, args.path)} new chunks, {len(index)} documents in total.")
+    elif args.command == "search":
+        start = time.perf_counter()
+        hits = index.search(args.query, args.k)
+        print(f"🔍 {len(hits)} hits in {(time.perf_counter() - start) * 1000:.2f} ms")
+        for hit in hits:
+            print(f"- [{hit.score:.2f}, coverage {hit.coverage:.0%}] {hit.title}")
+    else:
+        index.compact()
+        index.remove_unused_files()
+        print(f"✅ Compacted into {len(index._segments)} segment(s).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+# llm_scheduler.py
+# Central admission control for LLM calls: global concurrency cap, priority classes, per-user fair queuing.
+import threading
+import time
+from collections import OrderedDict, deque
+
+from resilience import LatencyTracker
+
+PRIORITY_INTERACTIVE = 0   # Answer feedback, a student is waiting on /api/submit
+PRIORITY_GENERATION = 1    # Question and topic generation
+PRIORITY_REVIEW = 2        # Phase reviews
+PRIORITY_PREFETCH = 3      # Background prefetch, first to be shed
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_GENERATION: "generation",
+    PRIORITY_REVIEW: "review",
+    PRIORITY_PREFETCH: "prefetch",
+}
+
+# Longest time a call may wait for a slot before it is shed
+DEFAULT_MAX_WAIT = {
+    PRIORITY_INTERACTIVE: 30.0,
+    PRIORITY_GENERATION: 20.0,
+    PRIORITY_REVIEW: 30.0,
+    PRIORITY_PREFETCH: 5.0,
+}
+
+
+class LLMOverloadedError(Exception):
+    """Raised when a call is shed because the LLM queue is too long"""
+
+
+class _Ticket:
+    __slots__ = ("priority", "user_id", "granted", "enqueued_at")
+
+    def __init__(self, priority, user_id):
+        self.priority = priority
+        self.user_id = user_id
+        self.granted = threading.Event()
+        self.enqueued_at = time.monotonic()
+
+
+class LLMScheduler:
+    """Callers block in run() until a slot is free. Higher priority classes are always served first;
+    inside a class, users take turns so one student's burst cannot starve the others."""
+
+    def __init__(self, max_concurrency: int = 8, max_wait: dict = None, max_queue: int = 200):
+        self.max_concurrency = max_concurrency
+        self.max_wait = {**DEFAULT_MAX_WAIT, **(max_wait or {})}
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._running = 0
+        self._queues = {p: OrderedDict() for p in PRIORITY_NAMES}   # priority -> user_id -> deque[_Ticket]
+        self._depth = {p: 0 for p in PRIORITY_NAMES}
+        self._wait_times = {p: LatencyTracker() for p in PRIORITY_NAMES}
+        self.stats = {p: {"admitted": 0, "shed": 0, "max_wait": 0.0} for p in PRIORITY_NAMES}
+
+    def run(self, priority: int, user_id, fn):
+        self.acquire(priority, user_id)
+        try:
+            return fn()
+        finally:
+            self.release()
+
+    def acquire(self, priority: int, user_id):
+        with self._lock:
+            if self._running < self.max_concurrency and not any(self._depth.values()):
+                self._running += 1
+                self._admitted(priority, 0.0)
+                return
+            if self._depth[priority] >= self.max_queue:
+                self.stats[priority]["shed"] += 1
+                raise LLMOverloadedError("The AI tutor is very busy right now, please retry in a moment")
+            ticket = _Ticket(priority, user_id)
+            self._queues[priority].setdefault(user_id, deque()).append(ticket)
+            self._depth[priority] += 1
+
+        if ticket.granted.wait(self.max_wait[priority]):
+            return
+        with self._lock:
+            if ticket.granted.is_set():
+                # Granted right as the wait timed out, keep the slot
+                return
+            user_queue = self._queues[priority][user_id]
+            user_queue.remove(ticket)
+            if not user_queue:
+                del self._queues[priority][user_id]
+            self._depth[priority] -= 1
+            self.stats[priority]["shed"] += 1
+        raise LLMOverloadedError("The AI tutor is very busy right now, please retry in a moment")
+
+    def try_acquire(self, priority: int, user_id) -> bool:
+        """Take a slot only if one is free right now and nobody is queued (hedged duplicate requests)"""
+        with self._lock:
+            if self._running < self.max_concurrency and not any(self._depth.values()):
+                self._running += 1
+                return True
+            return False
+
+    def release(self):
+        with self._lock:
+            self._running -= 1
+            self._grant_next_locked()
+
+    def _grant_next_locked(self):
+        while self._running < self.max_concurrency:
+            for priority in sorted(self._queues):
+                users = self._queues[priority]
+                if users:
+                    break
+            else:
+                return
+            user_id, user_queue = next(iter(users.items()))
+            ticket = user_queue.popleft()
+            if user_queue:
+                users.move_to_end(user_id)   # Round-robin between users of the same class
+            else:
+                del users[user_id]
+            self._depth[priority] -= 1
+            self._running += 1
+            self._admitted(priority, time.monotonic() - ticket.enqueued_at)
+            ticket.granted.set()
+
+    def _admitted(self, priority, waited):
+        self.stats[priority]["admitted"] += 1
+        self.stats[priority]["max_wait"] = max(self.stats[priority]["max_wait"], waited)
+        self._wait_times[priority].record(waited)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            classes = {}
+            for priority, name in PRIORITY_NAMES.items():
+                classes[name] = dict(self.stats[priority],
+                                     queued=self._depth[priority],
+                                     waiting_users=len(self._queues[priority]),
+                                     p95_wait=self._wait_times[priority].percentile(95))
+            return {"running": self._running, "max_concurrency": self.max_concurrency, "classes": classes}
@@ -1,16 +1,26 @@
 # llm_service.py
 import os
 import json
-import re
+import itertools
+import threading
 from pydantic import BaseModel, Field
 from typing import Dict, List, Optional
-from openai import OpenAI
 from exa_py import Exa  
+from dashboard_feed import dashboard_hub
+from knowledge_index import KnowledgeIndex, format_context
+from model_router import ModelRouter
+from llm_scheduler import (
+    LLMScheduler, LLMOverloadedError, PRIORITY_INTERACTIVE, PRIORITY_GENERATION, PRIORITY_REVIEW, PRIORITY_PREFETCH
+)
+from output_repair import RepairStats, parse_structured, repair_text, coerce_fields
+from resilience import CallPolicy, CircuitBreaker, ResilientCaller, RetryBudget
+from tracing import span, traced
 from database import (
     get_user_info, record_wrong_question_to_db, 
-    get_user_weaknesses, get_wrong_questions_by_topic, get_wrong_questions_details,
+    get_topic_digests, get_top_digests,
     get_topic_score, update_topic_score, get_average_score, set_topic_score
 )
+from misconception_digest import render_digest, render_digest_line
 
 class AnswerPayload(BaseModel):
     user_id: int   
@@ -49,30 +59,210 @@ class PhaseReviewResult(BaseModel):
 class TopicList(BaseModel):
     topics: List[str] = Field(description="5 core knowledge points/chapter names for this subject")
 
+# Per-call-site deadlines. Hedging is only enabled for generations that are safe to duplicate.
+CALL_POLICIES = {
+    "topics": CallPolicy(timeout=20.0, hedge=True, max_retries=1),
+    "question": CallPolicy(timeout=45.0, hedge=True),
+    "question_batch": CallPolicy(timeout=90.0, hedge=True),
+    "feedback": CallPolicy(timeout=15.0, hedge=True, max_retries=1),
+    "phase_review": CallPolicy(timeout=60.0),
+    "fixup": CallPolicy(timeout=20.0, max_retries=1),
+    # exa_py sends its requests without a timeout, so Exa runs on its own small pool
+    "exa_search": CallPolicy(timeout=8.0, breaker="exa", pool="exa"),
+    "exa_outline": CallPolicy(timeout=8.0, breaker="exa", pool="exa"),
+}
+EXA_POOL_SIZE = int(os.getenv("EXA_POOL_SIZE", "4"))
+
+# Scheduler priority class of every LLM call site
+SITE_PRIORITIES = {
+    "feedback": PRIORITY_INTERACTIVE,
+    "question": PRIORITY_GENERATION,
+    "question_batch": PRIORITY_GENERATION,
+    "topics": PRIORITY_GENERATION,
+    "phase_review": PRIORITY_REVIEW,
+    "fixup": PRIORITY_GENERATION,
+}
+# Sites with a local fallback answer: a student is waiting, so a fix-up round trip is not worth it
+NO_FIXUP_SITES = {"feedback"}
+
+# Model endpoints each call site may use: "default" is DEEPSEEK_API_KEY / BASE_URL / MODEL_NAME, more are
+# configured in LLM_ENDPOINTS as JSON ({"fast": {"base_url": ..., "api_key": ..., "model": ...}}).
+# Within a route the fastest healthy endpoint is used; names that are not configured are ignored,
+# so with only the default endpoint every site goes there. LLM_ROUTES (JSON) overrides single sites.
+MODEL_NAME = os.getenv("LLM_MODEL", "deepseek-chat")
+LLM_ENDPOINTS = os.getenv("LLM_ENDPOINTS", "")
+MODEL_ROUTES = {
+    "feedback": ["fast", "default"],
+    "fixup": ["fast", "default"],
+    "topics": ["fast", "default"],
+    "question": ["default", "strong"],
+    "question_batch": ["default", "strong"],
+    "phase_review": ["strong", "default"],
+}
+MODEL_ROUTES.update(json.loads(os.getenv("LLM_ROUTES", "{}")))
+
+# Questions generated per LLM call when refilling a user's prefetch pool (1 = no prefetching)
+QUESTION_BATCH_SIZE = int(os.getenv("QUESTION_BATCH_SIZE", "1"))
+
+# Local BM25 tier: "local_first" (local index, then Exa), "local_only" (never call Exa) or "exa_only"
+KNOWLEDGE_INDEX_DIR = os.getenv("KNOWLEDGE_INDEX_DIR", "")
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "local_first")
+# A local hit must contain this share of the query terms to be trusted instead of asking Exa
+LOCAL_MIN_COVERAGE = 0.75
+
+EXA_DEGRADED_CONTEXT = "(Due to network or quota issues, external knowledge could not be obtained; degraded to model internal knowledge)"
+
+def score_stage(score: int) -> int:
+    """0 = Basic Introduction, 1 = Advanced Improvement, 2 = Mastery Challenge"""
+    if score < 300:
+        return 0
+    return 1 if score < 700 else 2
+
 class AdaptiveLearningSystem:
-    def __init__(self, api_key, base_url=None):
-        self.client = OpenAI(api_key=api_key, base_url=base_url)
-        self.model_name = "deepseek-chat" 
-        
-        exa_api_key = os.getenv("EXA_API_KEY", "input your key here") 
+    def __init__(self, api_key, base_url=None, exa_client=None, policies=None, scheduler=None,
+                 knowledge_index=None, retrieval_mode=RETRIEVAL_MODE, router=None):
+        # Upstream clients and the local index are built on first use (or by warm_up()),
+        # so importing this module stays cheap for tooling and tests
+        self.router = router or ModelRouter.from_settings(api_key, base_url, MODEL_NAME, LLM_ENDPOINTS, MODEL_ROUTES)
+        self._exa_client = exa_client
+        self._exa_ready = exa_client is not None
+        self._knowledge_index = knowledge_index
+        self._index_ready = knowledge_index is not None or not KNOWLEDGE_INDEX_DIR
+        self._init_lock = threading.Lock()
+
+        self.resilience = ResilientCaller(
+            policies or CALL_POLICIES,
+            breakers={"exa": CircuitBreaker(failure_threshold=3, reset_timeout=30.0)},
+            retry_budget=RetryBudget(ratio=0.2),
+            pools={"exa": EXA_POOL_SIZE},
+        )
+        self.scheduler = scheduler or LLMScheduler(max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "8")))
+        self.retrieval_mode = retrieval_mode
+        self.repair_stats = RepairStats()
+
+    @property
+    def exa_client(self):
+        if not self._exa_ready:
+            with self._init_lock:
+                if not self._exa_ready:
+                    exa_api_key = os.getenv("EXA_API_KEY", "input your key here") 
+                    try:
+                        self._exa_client = Exa(exa_api_key)
+                    except Exception as e:
+                        print(f"⚠️ Exa client initialization failed, please check API KEY. Error message: {e}")
+                        self._exa_client = None
+                    self._exa_ready = True
+        return self._exa_client
+
+    @property
+    def knowledge_index(self):
+        if not self._index_ready:
+            with self._init_lock:
+                if not self._index_ready:
+                    try:
+                        self._knowledge_index = KnowledgeIndex.open(KNOWLEDGE_INDEX_DIR)
+                    except Exception as e:
+                        print(f"⚠️ Local knowledge index could not be opened, falling back to Exa only. Error message: {e}")
+                    self._index_ready = True
+        return self._knowledge_index
+
+    def warm_up(self):
+        """Build every lazily created client up front (called from the API startup warm-up)"""
+        return {"llm_clients": self.router.warm_up(), "exa_client": self.exa_client is not None,
+                "knowledge_index": self.knowledge_index is not None}
+
+    def _chat(self, site: str, prompt: str, temperature: float, user_id=None, priority=None) -> str:
+        """Run one JSON-mode completion once the scheduler admits it, under the call site's deadline / hedging policy,
+        on the fastest healthy endpoint of the site's route"""
+        def request(endpoint, timeout):
+            response = endpoint.client.chat.completions.create(
+                model=endpoint.model,
+                messages=[{"role": "user", "content": prompt}],
+                response_format={ "type": "json_object" },
+                temperature=temperature,
+                timeout=timeout
+            )
+            return response.choices[0].message.content
+
+        attempts = itertools.count()
+
+        def call(timeout):
+            # A hedge (or retry) goes to the next-ranked endpoint instead of piling onto the slow one
+            return self.router.call(site, request, timeout, offset=next(attempts))
+        if priority is None:
+            priority = SITE_PRIORITIES[site]
+        # Same as scheduler.run(), split so queueing and the upstream call show up as separate spans
+        with span(f"queue.{site}"):
+            self.scheduler.acquire(priority, user_id)
         try:
-            self.exa_client = Exa(exa_api_key)
-        except Exception as e:
-            print(f"⚠️ Exa client initialization failed, please check API KEY. Error message: {e}")
-            self.exa_client = None
+            with span(f"llm.{site}"):
+                # A hedge is one more upstream request, it only fires if it gets a slot of its own
+                return self.resilience.call(site, call, hedge_slot=lambda: self.scheduler.release
+                                            if self.scheduler.try_acquire(priority, user_id) else None)
+        finally:
+            self.scheduler.release()
+
+    def _parse(self, site: str, raw_content: str, model_cls, user_id=None):
+        """Repair locally first; if that is not enough, ask for a corrected copy of just this JSON"""
+        def fixup(broken: str, errors: str) -> str:
+            print(f"🩹 Sending fix-up request for {site} output: {errors[:200]}")
+            prompt = f"""
+            The following JSON does not satisfy the required schema. Fix it with minimal changes, keep all content, and output only the corrected JSON.
+            Errors: {errors}
+            Schema: {json.dumps(model_cls.model_json_schema(), ensure_ascii=False)}
+            JSON:
+            {broken}
+            """
+            return self._chat("fixup", prompt, temperature=0.0, user_id=user_id, priority=SITE_PRIORITIES[site])
+        with span(f"parse.{site}"):
+            return parse_structured(raw_content, model_cls, site, self.repair_stats,
+                                    fixup=None if site in NO_FIXUP_SITES else fixup)
+
+    def _search(self, site: str, query: str, num_results: int = 2):
+        with span(f"exa.{site}"):
+            return self.resilience.call(site, lambda timeout: self.exa_client.search_and_contents(
+                query,
+                num_results=num_results, 
+                text=True
+            ))
 
+    def _search_local(self, query: str, num_results: int = 2) -> list:
+        """Local hits good enough to skip Exa, or [] to fall through to the web"""
+        if self.knowledge_index is None or self.retrieval_mode == "exa_only":
+            return []
+        with span("index.search"):
+            hits = self.knowledge_index.search(query, k=num_results)
+        if self.retrieval_mode == "local_only":
+            return hits
+        good = [hit for hit in hits if hit.coverage >= LOCAL_MIN_COVERAGE]
+        return good if len(good) >= num_results else []
+
+    def _capture_exa_results(self, results, subject: str, topic: str = None):
+        """Grow the local index with what Exa returned, so the next lookup can stay offline"""
+        if self.knowledge_index is None:
+            return
+        # Tagged with what was asked for, web pages rarely repeat the subject name itself
+        docs = [{"title": r.title or "", "text": r.text or "", "tags": f"{subject} {topic or ''}".strip(),
+                 "url": getattr(r, "url", None), "source": "exa"}
+                for r in results]
+        # Indexed on the index's background thread, the request does not wait for it
+        self.knowledge_index.capture(docs)
+
+    @traced("retrieval.background")
     def retrieve_background_knowledge(self, subject: str, topic: str = None) -> str:
+        local_hits = self._search_local(f"{subject} {topic if topic else ''}")
+        if local_hits:
+            return format_context(local_hits)
+        if self.retrieval_mode == "local_only":
+            return EXA_DEGRADED_CONTEXT
         if not self.exa_client:
             return "(No valid Exa key configured, this question relies solely on model internal knowledge)"
             
         search_query = f"{subject} {topic if topic else ''} core knowledge classic questions"
         try:
             print(f"🔍 Retrieving via Exa: {search_query}")
-            search_response = self.exa_client.search_and_contents(
-                search_query,
-                num_results=2, 
-                text=True
-            )
+            search_response = self._search("exa_search", search_query)
+            self._capture_exa_results(search_response.results, subject, topic)
             
             context_pieces = []
             for result in search_response.results:
@@ -81,18 +271,19 @@ class AdaptiveLearningSystem:
             return "\n\n".join(context_pieces)
         except Exception as e:
             print(f"⚠️ Exa retrieval failed: {e}")
-            return "(Due to network or quota issues, external knowledge could not be obtained; degraded to model internal knowledge)"
+            return EXA_DEGRADED_CONTEXT
 
+    @traced("topics.generate")
     def generate_topics_for_subject(self, subject: str) -> list:
         context = ""
-        if self.exa_client:
+        local_hits = self._search_local(f"{subject} course outline chapters")
+        if local_hits:
+            context = format_context(local_hits, limit=600, label="Content")
+        elif self.exa_client and self.retrieval_mode != "local_only":
             try:
                 print(f"🔍 Retrieving outline for【{subject}】via Exa...")
-                search_response = self.exa_client.search_and_contents(
-                    f"{subject} course outline core topics chapter list",
-                    num_results=2, 
-                    text=True
-                )
+                search_response = self._search("exa_outline", f"{subject} course outline core topics chapter list")
+                self._capture_exa_results(search_response.results, subject, "course outline chapters")
                 context = "\n".join([f"Source: {r.title}\nContent: {r.text[:600]}" for r in search_response.results])
             except Exception as e:
                 print(f"⚠️ Exa outline retrieval failed: {e}")
@@ -107,88 +298,131 @@ class AdaptiveLearningSystem:
         {json.dumps(TopicList.model_json_schema(), ensure_ascii=False)}
         """
         try:
-            response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[{"role": "user", "content": prompt}],
-                response_format={ "type": "json_object" },
-                temperature=0.5
-            )
-            raw_content = response.choices[0].message.content
-            match = re.search(r'\{.*\}', raw_content, re.DOTALL)
-            clean_content = match.group(0) if match else raw_content.strip()
-            
-            validated_data = TopicList.model_validate_json(clean_content)
+            raw_content = self._chat("topics", prompt, temperature=0.5)
+            validated_data = self._parse("topics", raw_content, TopicList)
             return validated_data.topics
+        except LLMOverloadedError:
+            raise
         except Exception as e:
             print(f"Failed to parse knowledge points: {e}")
             return []
 
-    def generate_question(self, user_id, subject, topic=None, initial_score=None):
+    def resolve_score(self, user_id, topic=None, initial_score=None) -> int:
         if initial_score is not None:
-            score = initial_score
-        else:
-            score = get_topic_score(user_id, topic) if topic else get_average_score(user_id)
-        
+            return initial_score
+        return get_topic_score(user_id, topic) if topic else get_average_score(user_id)
+
+    def _question_context(self, user_id, subject, topic, score, count=1):
+        """Shared learner-situation block for single and batch generation (one Exa retrieval either way)"""
         # 👑 Optimized question generation prompt, strictly regulated difficulty levels
+        batch = count > 1
+        noun = f"{count} distinct" if batch else "a"
         if score < 300:
-            level_desc = f"The student's current score is {score}/1000, at the 【Basic Introduction】 stage. Please generate a simple, single-core concept basic question. Difficulty coefficient must be set to (1 or 2)."
+            level_desc = f"The student's current score is {score}/1000, at the 【Basic Introduction】 stage. Please generate {noun} simple, single-core concept basic question{'s' if batch else ''}. Difficulty coefficient must be set to (1 or 2)."
         elif score < 700:
-            level_desc = f"The student's current score is {score}/1000, at the 【Advanced Improvement】 stage. Please generate an intermediate-level question with some depth and requiring comprehensive analysis. Difficulty coefficient must be set to (3 or 4)."
+            level_desc = f"The student's current score is {score}/1000, at the 【Advanced Improvement】 stage. Please generate {noun} intermediate-level question{'s' if batch else ''} with some depth and requiring comprehensive analysis. Difficulty coefficient must be set to (3 or 4)."
         else:
-            level_desc = f"The student's current score is {score}/1000, at the 【Mastery Challenge】 stage. Please generate a high-difficulty, easy-to-mistake, multi-knowledge-point intersection challenge question. Difficulty coefficient must be set to (5)."
+            level_desc = f"The student's current score is {score}/1000, at the 【Mastery Challenge】 stage. Please generate {noun} high-difficulty, easy-to-mistake, multi-knowledge-point intersection challenge question{'s' if batch else ''}. Difficulty coefficient must be set to (5)."
         
+        # Misconception digests instead of raw wrong question history: the prompt stays the same size as history grows
         wrong_q_prompt = ""
         if topic:
-            wrong_qs = get_wrong_questions_by_topic(user_id, topic)
-            if wrong_qs:
-                details = "\n".join([
-                    f"- Original question: {q['question_content']}\n  (Student incorrectly chose: {q['student_answer']}, correct answer: {q['correct_answer']})" 
-                    for q in wrong_qs
-                ])
-                wrong_q_prompt = f"【Learning reference】The student has the following wrong question records in【{topic}】, please analyze their easily confused thinking pitfalls and create a new question to correct the error:\n{details}"
+            digests = get_topic_digests(user_id, topic)
+            if digests:
+                details = "\n".join(render_digest(d) for d in digests)
+                wrong_q_prompt = f"【Learning reference】The student's wrong answer history in【{topic}】is summarized below, please analyze their easily confused thinking pitfalls and create {f'{count} new questions, each aimed at a different pitfall,' if batch else 'a new question'} to correct the error:\n{details}"
             else:
-                wrong_q_prompt = f"【Learning reference】The student has no wrong question records in【{topic}】, please generate a regular test question that matches their current level."
+                wrong_q_prompt = f"【Learning reference】The student has no wrong question records in【{topic}】, please generate {f'{count} regular test questions covering different aspects of it that match' if batch else 'a regular test question that matches'} their current level."
         else:
-            weaknesses = get_user_weaknesses(user_id)
-            weak_prompt = f"[{'、'.join(weaknesses)}]" if weaknesses else "None yet"
-            wrong_q_prompt = f"【Learning reference】The student's historical weak points include: {weak_prompt}. Please prioritize selecting one of these weak points for the question."
+            weaknesses = get_top_digests(user_id)
+            weak_prompt = f"[{'、'.join(render_digest_line(d) for d in weaknesses)}]" if weaknesses else "None yet"
+            wrong_q_prompt = f"【Learning reference】The student's historical weak points include: {weak_prompt}. {'Please prioritize these weak points, spreading the questions across them.' if batch else 'Please prioritize selecting one of these weak points for the question.'}"
 
         ability_prompt = f"Current subject: {subject}.\nLevel assessment: {level_desc}"
-        topic_instruction = f"Please strictly focus on the knowledge point【{topic}】to generate the question." if topic else "Please automatically select an appropriate knowledge point from this subject to generate the question."
+        target = "the questions" if batch else "the question"
+        topic_instruction = f"Please strictly focus on the knowledge point【{topic}】to generate {target}." if topic else f"Please automatically select an appropriate knowledge point from this subject to generate {target}."
         
         retrieved_context = self.retrieve_background_knowledge(subject, topic)
         
-        prompt = f"""
-        You are a senior mentor in the field of【{subject}】. Based on the following learning situation, independently decide on the question:
+        return f"""
+        You are a senior mentor in the field of【{subject}】. Based on the following learning situation, independently decide on {f'a set of {count} questions that must not repeat each other in stem, angle or pitfall' if batch else 'the question'}:
         {ability_prompt}
         {wrong_q_prompt}
         {topic_instruction}
         
         【Reference knowledge base】(Please prioritize referring to the following real materials retrieved from the web to construct the question stem and options, ensuring factual accuracy and avoiding hallucinations):
         {retrieved_context}
-        
+        """
+
+    @traced("question.generate")
+    def generate_question(self, user_id, subject, topic=None, initial_score=None):
+        score = self.resolve_score(user_id, topic, initial_score)
+        prompt = self._question_context(user_id, subject, topic, score) + f"""
         Please output strictly according to the following JSON Schema, do not output any other content:
         {json.dumps(GeneratedQuestion.model_json_schema(), ensure_ascii=False)}
         """
-        response = self.client.chat.completions.create(
-            model=self.model_name,
-            messages=[{"role": "user", "content": prompt}],
-            response_format={ "type": "json_object" },
-            temperature=0.7
-        )
-        
-        raw_content = response.choices[0].message.content
-        match = re.search(r'\{.*\}', raw_content, re.DOTALL)
-        clean_content = match.group(0) if match else raw_content.strip()
-        
         try:
-            validated_data = GeneratedQuestion.model_validate_json(clean_content)
+            raw_content = self._chat("question", prompt, temperature=0.7, user_id=user_id)
+        except LLMOverloadedError:
+            raise
+        except Exception as e:
+            print(f"⚠️ Question generation request failed: {e}")
+            return None
+
+        try:
+            validated_data = self._parse("question", raw_content, GeneratedQuestion, user_id)
             return validated_data.model_dump()
+        except LLMOverloadedError:
+            raise
         except Exception as e:
             print(f"Failed to parse LLM generated question, validation error: {e}\nOriginal content: {raw_content}")
             return None
 
-    def evaluate_answer_by_llm(self, subject, question_data, user_ans, is_correct):
+    @traced("question.generate_batch")
+    def generate_question_batch(self, user_id, subject, topic=None, count=QUESTION_BATCH_SIZE, initial_score=None,
+                                priority=None) -> list:
+        """Generate up to `count` questions in one completion; invalid items are dropped, valid ones kept.
+        priority: scheduler class, PRIORITY_PREFETCH for background refills nobody is waiting on"""
+        score = self.resolve_score(user_id, topic, initial_score)
+        prompt = self._question_context(user_id, subject, topic, score, count=count) + f"""
+        The {count} questions must be distinct: no two items may share a stem, a near-identical stem with changed numbers, or the same tested pitfall.
+        Please output a JSON object of the form {{"questions": [...]}} containing exactly {count} items, each item strictly following this JSON Schema, do not output any other content:
+        {json.dumps(GeneratedQuestion.model_json_schema(), ensure_ascii=False)}
+        """
+        try:
+            raw_content = self._chat("question_batch", prompt, temperature=0.8, user_id=user_id, priority=priority)
+        except LLMOverloadedError:
+            raise
+        except Exception as e:
+            print(f"⚠️ Batch question generation request failed: {e}")
+            return []
+
+        try:
+            items = json.loads(repair_text(raw_content)).get("questions", [])
+        except Exception as e:
+            print(f"Failed to parse LLM generated question batch: {e}\nOriginal content: {raw_content}")
+            return []
+        if not isinstance(items, list):
+            return []
+
+        questions, seen = [], set()
+        for item in items[:count]:
+            try:
+                question = GeneratedQuestion.model_validate(coerce_fields(item, GeneratedQuestion)).model_dump()
+            except Exception as e:
+                print(f"Dropped one invalid question from batch: {e}")
+                continue
+            # The same stem twice would be served twice from the prefetch pool
+            stem = " ".join(str(question["content"]).split()).casefold()
+            if stem in seen:
+                print(f"Dropped one repeated question from batch: {question['content']}")
+                continue
+            seen.add(stem)
+            questions.append(question)
+        return questions
+
+    @traced("answer.feedback")
+    def evaluate_answer_by_llm(self, subject, question_data, user_ans, is_correct, user_id=None):
         # 👑 Optimized scoring prompt: LLM only provides base performance score, abandoning hard-coded complex logic
         prompt = f"""
         You are a senior mentor in the field of【{subject}】. Please perform dynamic scoring and growth feedback based on the student's answer situation.
@@ -210,19 +444,9 @@ class AdaptiveLearningSystem:
         Please output strictly according to the following JSON Schema, do not output any other content:
         {json.dumps(EvaluationFeedback.model_json_schema(), ensure_ascii=False)}
         """
-        response = self.client.chat.completions.create(
-            model=self.model_name,
-            messages=[{"role": "user", "content": prompt}],
-            response_format={ "type": "json_object" },
-            temperature=0.3
-        )
-        
-        raw_content = response.choices[0].message.content
-        match = re.search(r'\{.*\}', raw_content, re.DOTALL)
-        clean_content = match.group(0) if match else raw_content.strip()
-        
         try:
-            validated_data = EvaluationFeedback.model_validate_json(clean_content)
+            raw_content = self._chat("feedback", prompt, temperature=0.3, user_id=user_id)
+            validated_data = self._parse("feedback", raw_content, EvaluationFeedback, user_id)
             return validated_data.model_dump()
         except Exception as e:
             return {
@@ -231,10 +455,11 @@ class AdaptiveLearningSystem:
                 "improvement": "Keep steady progress"
             }
 
+    @traced("review.generate")
     def generate_phase_review(self, user_id, subject, current_score):
-        wrong_qs = get_wrong_questions_details(user_id)[:5] 
-        if wrong_qs:
-            wrong_context = "Recent wrong question review:\n" + "\n".join([f"- Knowledge point: {q['category']} | Original question: {q['question_content']}" for q in wrong_qs])
+        digests = get_top_digests(user_id, limit=5)
+        if digests:
+            wrong_context = "Wrong answer summary by knowledge point:\n" + "\n".join(f"- {render_digest_line(d)}" for d in digests)
         else:
             wrong_context = "Recent performance is perfect, no wrong question records."
 
@@ -253,19 +478,9 @@ class AdaptiveLearningSystem:
         Please output strictly according to the following JSON Schema, do not output any additional text or code blocks:
         {json.dumps(PhaseReviewResult.model_json_schema(), ensure_ascii=False)}
         """
-        response = self.client.chat.completions.create(
-            model=self.model_name,
-            messages=[{"role": "user", "content": prompt}],
-            response_format={ "type": "json_object" },
-            temperature=0.7
-        )
-        
-        raw_content = response.choices[0].message.content
-        match = re.search(r'\{.*\}', raw_content, re.DOTALL)
-        clean_content = match.group(0) if match else raw_content.strip()
-        
         try:
-            validated_data = PhaseReviewResult.model_validate_json(clean_content)
+            raw_content = self._chat("phase_review", prompt, temperature=0.7, user_id=user_id)
+            validated_data = self._parse("phase_review", raw_content, PhaseReviewResult, user_id)
             return validated_data.model_dump()
         except Exception as e:
             return None
@@ -278,12 +493,61 @@ global_system = AdaptiveLearningSystem(api_key=API_KEY, base_url=BASE_URL)
 current_question_state = {} 
 user_streaks = {}  
 user_total_answers = {}
+# (user_id, subject, topic) -> {"stage": ..., "questions": [...]} filled by batch generation
+prefetched_questions = {}
+_prefetch_lock = threading.Lock()
+_prefetch_refills = {}   # key -> background refill thread
+
+def _refill_prefetch(key, stage: str, score: int):
+    """Refill an emptied pool in the background at PRIORITY_PREFETCH, the first class shed under load"""
+    user_id, subject, topic = key
+    try:
+        batch = global_system.generate_question_batch(user_id, subject, topic, QUESTION_BATCH_SIZE,
+                                                      initial_score=score, priority=PRIORITY_PREFETCH)
+    except Exception as e:
+        print(f"⚠️ Question prefetch skipped: {e}")
+        batch = []
+    with _prefetch_lock:
+        _prefetch_refills.pop(key, None)
+        pool = prefetched_questions.get(key)
+        if batch and pool is not None and pool["stage"] == stage and not pool["questions"]:
+            pool["questions"] = batch
+
+def _next_question(user_id: int, subject: str, topic: str = None, initial_score: int = None):
+    if QUESTION_BATCH_SIZE <= 1:
+        return global_system.generate_question(user_id, subject, topic, initial_score)
+
+    key = (user_id, subject, topic)
+    score = global_system.resolve_score(user_id, topic, initial_score)
+    stage = score_stage(score)
+    with _prefetch_lock:
+        pool = prefetched_questions.get(key)
+        # Reuse a prefetched question only while the student is still in the stage it was generated for
+        if initial_score is None and pool and pool["stage"] == stage and pool["questions"]:
+            question = pool["questions"].pop(0)
+            if not pool["questions"] and key not in _prefetch_refills:
+                refill = _prefetch_refills[key] = threading.Thread(
+                    target=_refill_prefetch, args=(key, stage, score), daemon=True)
+                refill.start()
+            return question
+        prefetched_questions.pop(key, None)
+
+    batch = global_system.generate_question_batch(user_id, subject, topic, QUESTION_BATCH_SIZE, initial_score=score)
+    if not batch:
+        return global_system.generate_question(user_id, subject, topic, score)
+    with _prefetch_lock:
+        prefetched_questions[key] = {"stage": stage, "questions": batch[1:]}
+    return batch[0]
 
+@traced("question.fetch")
 def fetch_new_question(user_id: int, subject: str, topic: str = None, initial_score: int = None) -> dict:
     global current_question_state
     global user_total_answers
     
-    question_data = global_system.generate_question(user_id, subject, topic, initial_score)
+    try:
+        question_data = _next_question(user_id, subject, topic, initial_score)
+    except LLMOverloadedError as e:
+        return {"status": "error", "message": str(e)}
     if not question_data:
         return {"status": "error", "message": "LLM generated question format error, please retry"}
     
@@ -313,49 +577,15 @@ def fetch_new_question(user_id: int, subject: str, topic: str = None, initial_sc
         }
     }
 
-def evaluate_student_answer(payload: AnswerPayload) -> dict:
-    global current_question_state
-    global user_streaks
-    global user_total_answers
-    
-    user_id = payload.user_id
-    
-    if user_id not in current_question_state or not current_question_state[user_id]:
-        return {"status": "error", "message": "Please get a question first!"}
-        
-    if user_id not in user_total_answers:
-        user_total_answers[user_id] = 0
-    user_total_answers[user_id] += 1
-        
-    question_state = current_question_state[user_id]
-    user_ans = payload.answer.strip().upper()
-    correct_ans = question_state.get("correct_answer")
-    subject = question_state.get("subject", "General Subject")
-    category = question_state.get("category", "Uncategorized")
-    content = question_state.get("content", "")
-    difficulty = question_state.get("difficulty", 2)
-    
-    is_correct = (user_ans == correct_ans)
-    
-    evaluation_result = global_system.evaluate_answer_by_llm(
-        subject=subject,
-        question_data=question_state, 
-        user_ans=user_ans, 
-        is_correct=is_correct
-    )
-    
-    raw_score_change = evaluation_result.get("score_change", 0)
-    root_cause = evaluation_result.get("root_cause", "None")
-    improvement = evaluation_result.get("improvement", "None")
-    
+def score_answer(user_id: int, is_correct: bool, raw_score_change, difficulty: int, current_score: int):
+    """Difficulty weighting, streak bonus and Elo resistance for one answer; advances user_streaks.
+    Returns (score change, streak message)."""
     try:
         base_score_change = int(raw_score_change)
     except ValueError:
         base_score_change = 15 if is_correct else -15
         
-    # --- 1. Get current score and difficulty, apply difficulty weighting ---
-    current_score = get_topic_score(user_id, category)
-
+    # --- 1. Apply difficulty weighting ---
     if is_correct:
         # Correct: ensure base score is positive and add difficulty bonus
         base_score_change = abs(base_score_change) + (difficulty * 5)
@@ -402,12 +632,54 @@ def evaluate_student_answer(payload: AnswerPayload) -> dict:
         expected_score_change = 1
     elif not is_correct and expected_score_change >= 0:
         expected_score_change = -1
+    return expected_score_change, streak_msg
+
+@traced("answer.evaluate")
+def evaluate_student_answer(payload: AnswerPayload) -> dict:
+    global current_question_state
+    global user_streaks
+    global user_total_answers
+    
+    user_id = payload.user_id
+    
+    if user_id not in current_question_state or not current_question_state[user_id]:
+        return {"status": "error", "message": "Please get a question first!"}
+        
+    if user_id not in user_total_answers:
+        user_total_answers[user_id] = 0
+    user_total_answers[user_id] += 1
+        
+    question_state = current_question_state[user_id]
+    user_ans = payload.answer.strip().upper()
+    correct_ans = question_state.get("correct_answer")
+    subject = question_state.get("subject", "General Subject")
+    category = question_state.get("category", "Uncategorized")
+    content = question_state.get("content", "")
+    difficulty = question_state.get("difficulty", 2)
+    
+    is_correct = (user_ans == correct_ans)
+    
+    evaluation_result = global_system.evaluate_answer_by_llm(
+        subject=subject,
+        question_data=question_state, 
+        user_ans=user_ans, 
+        is_correct=is_correct,
+        user_id=user_id
+    )
+    
+    raw_score_change = evaluation_result.get("score_change", 0)
+    root_cause = evaluation_result.get("root_cause", "None")
+    improvement = evaluation_result.get("improvement", "None")
+    
+    current_score = get_topic_score(user_id, category)
+    expected_score_change, streak_msg = score_answer(user_id, is_correct, raw_score_change, difficulty, current_score)
 
     # Submit final score to database
     new_score = update_topic_score(user_id, category, expected_score_change)
     
     if not is_correct:
         record_wrong_question_to_db(user_id, category, content, user_ans, correct_ans, root_cause, improvement)
+    dashboard_hub.publish_answer(user_id, category, new_score, is_correct)
         
     review_data = None
     
@@ -1,15 +1,75 @@
 # main.py
-from fastapi import FastAPI
+import threading
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 import uvicorn
 import os
 from typing import Optional
 from pydantic import BaseModel
 
-from llm_service import AnswerPayload, fetch_new_question, evaluate_student_answer
+from database import (
+    create_user, verify_user_login, get_user_info, get_average_score, get_wrong_questions_details,
+    get_all_topic_scores, get_archived_category_counts, get_all_users_overview,
+    warm_pool, start_write_behind, close_write_behind, get_write_behind
+)
+from dashboard_feed import dashboard_hub, dashboard_events
+from llm_service import AnswerPayload, fetch_new_question, evaluate_student_answer, global_system
+from quiz_session import QuizStartPayload, QuizSubmitPayload, start_quiz, submit_quiz
+from wrong_question_archive import export_wrong_questions as export_rows
+from tracing import TracingMiddleware, tracer
+
+# ================= Startup / Warm-up =================
+
+HTML_FILES = {"student": "new.html", "teacher": "teacher.html"}
+html_cache = {}
+
+# Filled by the warm-up thread; /ready reports 503 until "ready" is True
+startup_state = {"ready": False, "started_at": None, "steps": {}, "errors": {}}
+
+def load_html(name: str) -> Optional[str]:
+    html_path = os.path.join(os.path.dirname(__file__), HTML_FILES[name])
+    if not os.path.exists(html_path):
+        return None
+    with open(html_path, "r", encoding="utf-8") as f:
+        return f.read()
+
+def preload_html():
+    for name in HTML_FILES:
+        html_cache[name] = load_html(name)
+    return {name: html is not None for name, html in html_cache.items()}
+
+def run_warm_up():
+    """Pay the cold-start costs before traffic arrives; a failed step is reported but does not block readiness"""
+    steps = [
+        ("db_pool", warm_pool),
+        ("write_behind", start_write_behind),
+        ("html", preload_html),
+        ("upstream_clients", global_system.warm_up),
+    ]
+    startup_state["started_at"] = time.time()
+    for name, step in steps:
+        start = time.perf_counter()
+        try:
+            result = step()
+            startup_state["steps"][name] = {"ms": round((time.perf_counter() - start) * 1000, 1), "result": result}
+        except Exception as e:
+            print(f"⚠️ Warm-up step '{name}' failed: {e}")
+            startup_state["errors"][name] = str(e)
+    startup_state["ready"] = True
+    print("✅ Warm-up finished, instance is ready.")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm up in the background so liveness checks answer immediately while /ready still says 503
+    threading.Thread(target=run_warm_up, name="warm-up", daemon=True).start()
+    yield
+    # Buffered wrong questions go to the database before the process exits
+    close_write_behind()
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -18,36 +78,45 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Server-Timing header on every response, slow request log and sampled profiles (see tracing.py)
+app.add_middleware(TracingMiddleware, tracer=tracer)
 
 class AuthPayload(BaseModel):
     username: str
     password: str
 
+@app.get("/ready")
+def readiness():
+    """Readiness probe for rolling restarts: 200 once warm-up has finished"""
+    status_code = 200 if startup_state["ready"] else 503
+    return JSONResponse(status_code=status_code, content={
+        "status": "ready" if startup_state["ready"] else "warming_up",
+        "steps": startup_state["steps"],
+        "errors": startup_state["errors"],
+    })
+
 # ================= Web Page Routes =================
 
 @app.get("/", response_class=HTMLResponse)
 def serve_frontend():
     """Serve student main page"""
-    html_path = os.path.join(os.path.dirname(__file__), "new.html")
-    if not os.path.exists(html_path):
+    html = html_cache.get("student") or load_html("student")
+    if html is None:
          return "❌ Cannot find new.html file, make sure it is in the same directory as main.py."
-    with open(html_path, "r", encoding="utf-8") as f:
-        return f.read()
+    return html
 
 @app.get("/teacher", response_class=HTMLResponse)
 def serve_teacher_frontend():
     """Serve teacher monitoring dashboard"""
-    html_path = os.path.join(os.path.dirname(__file__), "teacher.html")
-    if not os.path.exists(html_path):
+    html = html_cache.get("teacher") or load_html("teacher")
+    if html is None:
          return "❌ Cannot find teacher.html file, make sure it is in the same directory as main.py."
-    with open(html_path, "r", encoding="utf-8") as f:
-        return f.read()
+    return html
 
 # ================= Existing API Routes =================
 
 @app.post("/api/register")
 def register(payload: AuthPayload):
-    from database import create_user
     success, msg = create_user(payload.username, payload.password)
     if success:
         return {"status": "success", "message": msg}
@@ -55,7 +124,6 @@ def register(payload: AuthPayload):
 
 @app.post("/api/login")
 def login(payload: AuthPayload):
-    from database import verify_user_login, get_user_info, get_average_score
     user_id = verify_user_login(payload.username, payload.password)
     if user_id:
         user_info = get_user_info(user_id)
@@ -76,7 +144,6 @@ def get_topics(subject: str):
     """
     Receive subject name from frontend, call LLM to automatically generate 5 core knowledge points
     """
-    from llm_service import global_system
     try:
         topics = global_system.generate_topics_for_subject(subject)
         if topics and len(topics) > 0:
@@ -96,9 +163,16 @@ def receive_answer(payload: AnswerPayload):
     result = evaluate_student_answer(payload)
     return result
 
+@app.post("/api/quiz/start")
+def quiz_start(payload: QuizStartPayload):
+    return start_quiz(payload.user_id, payload.subject, payload.topic, payload.count, payload.initial_score)
+
+@app.post("/api/quiz/submit")
+def quiz_submit(payload: QuizSubmitPayload):
+    return submit_quiz(payload)
+
 @app.get("/api/stats")
 def get_stats(user_id: int):
-    from database import get_user_info, get_wrong_questions_details, get_all_topic_scores, get_average_score
     info = get_user_info(user_id)
     if not info:
          return {"status": "error", "message": "User not found"}
@@ -107,7 +181,8 @@ def get_stats(user_id: int):
     topic_scores = get_all_topic_scores(user_id)
     avg_score = get_average_score(user_id)
     
-    category_counts = {}
+    # Archived history only survives as per-category counts
+    category_counts = get_archived_category_counts(user_id)
     for w in wrong_q:
         cat = w['category']
         category_counts[cat] = category_counts.get(cat, 0) + 1
@@ -126,13 +201,68 @@ def get_stats(user_id: int):
 
 @app.get("/api/admin/dashboard")
 def get_dashboard():
-    from database import get_all_users_overview
     try:
-        data = get_all_users_overview()
+        # While a live feed is open the in-memory snapshot is current, skip the aggregate query
+        data = dashboard_hub.snapshot()
+        if data is None:
+            data = get_all_users_overview()
         return {"status": "success", "data": data}
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
+@app.get("/api/admin/dashboard/stream")
+async def stream_dashboard(request: Request):
+    """Server-Sent Events: an initial 'snapshot' event, then coalesced per-student 'delta' events"""
+    return StreamingResponse(
+        dashboard_events(dashboard_hub, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/admin/wrong_questions/export")
+def export_wrong_questions(user_ids: str = "", format: str = "ndjson", include_archive: bool = False):
+    """Stream the wrong question history of the given users (comma separated ids, empty = everyone)"""
+    try:
+        ids = [int(x) for x in user_ids.split(",") if x.strip()]
+    except ValueError:
+        return {"status": "error", "message": "user_ids must be comma separated integers"}
+    if format not in ("ndjson", "csv"):
+        return {"status": "error", "message": "format must be ndjson or csv"}
+
+    archive_dir = os.getenv("WRONG_QUESTION_ARCHIVE_DIR", "archive") if include_archive else None
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        export_rows(ids or None, format, archive_dir),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename=wrong_questions.{format}"}
+    )
+
+@app.get("/api/admin/metrics")
+def get_metrics():
+    """Upstream (LLM / Exa) latency, hedging, retry and circuit breaker counters, LLM queue depth and waits,
+    per call site JSON repair / fix-up rates, model endpoint health and latency, and the wrong question write-behind buffer"""
+    write_behind = get_write_behind()
+    return {"status": "success", "data": {
+        "upstream": global_system.resilience.snapshot(),
+        "scheduler": global_system.scheduler.snapshot(),
+        "models": global_system.router.snapshot(),
+        "structured_output": global_system.repair_stats.snapshot(),
+        "write_behind": write_behind.snapshot() if write_behind else None,
+    }}
+
+@app.get("/api/admin/slow_requests")
+def get_slow_requests(limit: int = 20):
+    """Most recent requests over SLOW_REQUEST_MS, with their full span trees"""
+    return {"status": "success", "data": {
+        "threshold_ms": tracer.slow_log.threshold_ms,
+        "requests": tracer.slow_log.entries()[:limit],
+    }}
+
+@app.get("/api/admin/profile")
+def get_profile(top: int = 50):
+    """Hottest stacks (flame graph folded format) over all sampled requests; PROFILE_SAMPLE_RATE enables sampling"""
+    return {"status": "success", "data": dict(tracer.sampler.snapshot(top), sample_rate=tracer.sample_rate)}
+
 if __name__ == "__main__":
     # Use 0.0.0.0 to allow LAN access
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
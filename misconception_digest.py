@@ -0,0 +1,246 @@
+# misconception_digest.py
+# Per (user, knowledge point) digests of wrong answers, folded in one wrong answer at a time, so prompts
+# carry a bounded summary instead of raw wrong question history:
+#   {"category", "wrong_count", "misconceptions": [{"text", "fix", "count"}], "examples": [{"q", "chose", "correct"}]}
+# Recurring root causes (the feedback LLM's diagnosis) are merged by token overlap and counted;
+# only a few misconceptions and the latest examples are kept, each truncated.
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from knowledge_index import tokenize
+
+MAX_MISCONCEPTIONS = 4     # Stored; the top 3 are rendered
+RENDERED_MISCONCEPTIONS = 3
+MAX_EXAMPLES = 2
+TEXT_LIMIT = 140
+QUESTION_LIMIT = 160
+MERGE_SIMILARITY = 0.5
+BACKFILL_ROWS = 20         # Newest raw rows folded when a digest is built from existing history
+CACHED_USERS = 5000
+CACHE_MAX_AGE = 60.0       # Seconds before a clean user is reloaded, picks up other workers' updates
+
+# Placeholder diagnoses written when the feedback call failed, they say nothing about the student
+PLACEHOLDER_ROOT_CAUSES = {"", "System judgment, please try again later"}
+
+
+def _clip(text, limit: int) -> str:
+    text = " ".join(str(text or "").split())
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+def _similarity(a: str, b: str) -> float:
+    ta, tb = set(tokenize(a)), set(tokenize(b))
+    if not ta or not tb:
+        return 1.0 if a == b else 0.0
+    return len(ta & tb) / len(ta | tb)
+
+
+def new_digest(category: str) -> dict:
+    return {"category": category, "wrong_count": 0, "misconceptions": [], "examples": [], "updated_at": None}
+
+def fold_wrong_answer(digest: dict, question: str, student_ans: str, correct_ans: str,
+                      root_cause: str = "", improvement: str = "", at: datetime = None) -> dict:
+    """Add one wrong answer to the digest in place; size stays bounded"""
+    digest["wrong_count"] += 1
+    digest["updated_at"] = (at or datetime.now()).replace(microsecond=0).isoformat(" ")
+
+    cause = _clip(root_cause, TEXT_LIMIT)
+    if cause not in PLACEHOLDER_ROOT_CAUSES:
+        misconceptions = digest["misconceptions"]
+        match = max(misconceptions, key=lambda m: _similarity(m["text"], cause), default=None)
+        if match is not None and _similarity(match["text"], cause) >= MERGE_SIMILARITY:
+            match["count"] += 1
+            match["text"] = cause                  # Latest wording of the same misconception
+            match["fix"] = _clip(improvement, TEXT_LIMIT)
+            misconceptions.remove(match)
+            misconceptions.insert(0, match)
+        else:
+            misconceptions.insert(0, {"text": cause, "fix": _clip(improvement, TEXT_LIMIT), "count": 1})
+        # Most frequent first, most recent first among equals (sort is stable)
+        misconceptions.sort(key=lambda m: -m["count"])
+        del misconceptions[MAX_MISCONCEPTIONS:]
+
+    digest["examples"].insert(0, {"q": _clip(question, QUESTION_LIMIT), "chose": _clip(student_ans, 20),
+                                  "correct": _clip(correct_ans, 20)})
+    del digest["examples"][MAX_EXAMPLES:]
+    return digest
+
+def render_digest(digest: dict) -> str:
+    """Multi-line block for a topic focused prompt"""
+    lines = [f"- 【{digest['category']}】answered wrong {digest['wrong_count']} time(s)."]
+    misconceptions = digest["misconceptions"][:RENDERED_MISCONCEPTIONS]
+    if misconceptions:
+        lines.append("  Recurring misconceptions: " + "; ".join(
+            f"{m['text']} (x{m['count']})" for m in misconceptions))
+    if digest["examples"]:
+        lines.append("  Latest slips: " + "; ".join(
+            f"\"{e['q']}\" chose {e['chose']}, correct {e['correct']}" for e in digest["examples"]))
+    return "\n".join(lines)
+
+def render_digest_line(digest: dict) -> str:
+    """One line per knowledge point, for overviews of all weak points"""
+    line = f"{digest['category']} (wrong {digest['wrong_count']}x"
+    if digest["misconceptions"]:
+        line += f", main misconception: {digest['misconceptions'][0]['text']}"
+    return line + ")"
+
+
+class DigestCache:
+    """Digests of recently active users, kept in memory and backed by the storage backend.
+
+    A user's digests are loaded on first use and reloaded after max_age seconds (unless they hold updates
+    not persisted yet), so updates saved by other worker processes show up; knowledge points whose stored
+    digest is missing or behind the database count (history from before digests existed, or updates lost
+    in a crash) are rebuilt from their newest raw rows. Loads run outside the cache lock, one at a time per
+    user. Wrong answers are folded in only once they are stored (or durably buffered), so a failed insert
+    never leaves a digest ahead of the database. Updates are persisted right away or, with persist=False,
+    by persist().
+    """
+
+    def __init__(self, get_storage, max_users: int = CACHED_USERS, max_age: float = CACHE_MAX_AGE):
+        self._get_storage = get_storage
+        self.max_users = max_users
+        self.max_age = max_age
+        self._users = OrderedDict()        # user_id -> {category: digest}, LRU
+        self._loaded_at = {}               # user_id -> monotonic load time
+        self._dirty = set()                # (user_id, category)
+        self._loaders = {}                 # user_id -> lock held while that user is loaded
+        self._lock = threading.RLock()
+
+    def _cached_locked(self, user_id):
+        digests = self._users.get(user_id)
+        if digests is None:
+            return None
+        stale = time.monotonic() - self._loaded_at[user_id] > self.max_age
+        if stale and not any(key[0] == user_id for key in self._dirty):
+            return None
+        self._users.move_to_end(user_id)
+        return digests
+
+    def _load(self, user_id):
+        """(digests, categories rebuilt from raw rows by this call)"""
+        with self._lock:
+            digests = self._cached_locked(user_id)
+            if digests is not None:
+                return digests, set()
+            loader = self._loaders.setdefault(user_id, threading.Lock())
+        with loader:
+            with self._lock:
+                digests = self._cached_locked(user_id)
+                if digests is not None:
+                    return digests, set()
+            digests, rebuilt, saved = self._read(user_id)
+            with self._lock:
+                if not saved:
+                    self._dirty.update((row[0], row[1]) for row in rebuilt)
+                self._users[user_id] = digests
+                self._users.move_to_end(user_id)
+                self._loaded_at[user_id] = time.monotonic()
+                self._loaders.pop(user_id, None)
+                self._evict_locked(user_id)
+        return digests, {row[1] for row in rebuilt}
+
+    def _read(self, user_id):
+        """Stored digests with stale ones rebuilt and saved: (digests, rebuilt rows, saved)"""
+        storage = self._get_storage()
+        digests = {row["category"]: json.loads(row["digest"]) for row in storage.get_misconception_digests(user_id)}
+        rebuilt = []
+        for category, count in storage.get_wrong_question_counts(user_id).items():
+            if category is None:
+                continue
+            digest = digests.get(category)
+            if digest is None or digest["wrong_count"] < count:
+                digest = new_digest(category)
+                rows = storage.get_recent_wrong_questions(user_id, category, BACKFILL_ROWS)
+                for row in reversed(rows):
+                    fold_wrong_answer(digest, row["question_content"], row["student_answer"], row["correct_answer"],
+                                      row["root_cause"], row["improvement"], row["created_at"])
+                digest["wrong_count"] = int(count)
+                digests[category] = digest
+                rebuilt.append((user_id, category, digest["wrong_count"], json.dumps(digest, ensure_ascii=False)))
+        if rebuilt:
+            try:
+                storage.save_misconception_digests(rebuilt)
+            except Exception as e:
+                print(f"⚠️ Failed to save rebuilt misconception digests: {e}")
+                return digests, rebuilt, False
+        return digests, rebuilt, True
+
+    def _evict_locked(self, keep):
+        """Drop the least recently used users, except ones with updates not persisted yet"""
+        dirty_users = {key[0] for key in self._dirty}
+        while len(self._users) > self.max_users:
+            victim = next((uid for uid in self._users if uid not in dirty_users and uid != keep), None)
+            if victim is None:
+                break
+            del self._users[victim]
+            del self._loaded_at[victim]
+
+    def warm(self, user_id):
+        """Load a user's digests before their next wrong answer is stored, so record() can fold it incrementally"""
+        self._load(user_id)
+
+    def record(self, rows: list, committed: bool, persist: bool = True):
+        """Fold stored wrong answers [(user_id, category, question, student_ans, correct_ans, root_cause, improvement)].
+        committed: the rows are in the database already, so a digest loaded after this call started contains them"""
+        loaded = {}
+        for user_id in dict.fromkeys(row[0] for row in rows):
+            loaded[user_id] = self._load(user_id)
+        with self._lock:
+            for user_id, category, question, student_ans, correct_ans, root_cause, improvement in rows:
+                digests, fresh = loaded[user_id]
+                current = self._users.get(user_id)
+                if current is None:
+                    # Evicted meanwhile, nothing newer was loaded
+                    self._users[user_id] = digests
+                    self._loaded_at[user_id] = time.monotonic()
+                elif current is not digests:
+                    # Reloaded by another thread after our load, so after committed rows were stored
+                    if committed:
+                        continue
+                    digests = current
+                if committed and category in fresh:
+                    continue
+                digest = digests.get(category) or new_digest(category)
+                digests[category] = fold_wrong_answer(digest, question, student_ans, correct_ans, root_cause, improvement)
+                self._dirty.add((user_id, category))
+        if persist:
+            self.persist()
+
+    def persist(self) -> int:
+        with self._lock:
+            rows = []
+            for user_id, category in self._dirty:
+                digest = self._users.get(user_id, {}).get(category)
+                if digest is not None:
+                    rows.append((user_id, category, digest["wrong_count"], json.dumps(digest, ensure_ascii=False)))
+            self._dirty.clear()
+        if rows:
+            try:
+                self._get_storage().save_misconception_digests(rows)
+            except Exception:
+                with self._lock:
+                    self._dirty.update((row[0], row[1]) for row in rows)
+                raise
+        return len(rows)
+
+    def for_topic(self, user_id, topic: str, limit: int = 2) -> list:
+        """Digests of knowledge points matching `topic` (substring, like the raw history lookup), most wrong first"""
+        user = self._load(user_id)[0]
+        with self._lock:
+            digests = [dict(d) for d in user.values() if topic.lower() in d["category"].lower()]
+        return sorted(digests, key=lambda d: -d["wrong_count"])[:limit]
+
+    def top(self, user_id, limit: int = 8) -> list:
+        user = self._load(user_id)[0]
+        with self._lock:
+            digests = [dict(d) for d in user.values()]
+        return sorted(digests, key=lambda d: (-d["wrong_count"], d["category"]))[:limit]
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+            self._loaded_at.clear()
+            self._dirty.clear()
@@ -0,0 +1,201 @@
+# model_router.py
+# Routes each LLM call site to one of several OpenAI-compatible endpoints / models.
+#
+# - Every call site has an allowed set of endpoints (its route); sites without a route may use all of them
+# - Per endpoint: a circuit breaker, a rolling error rate and per-call-site latency (LatencyTracker),
+#   since a tiny feedback completion and a long phase review take very different times on the same model
+# - Healthy endpoints are tried fastest first (median latency inflated by the error rate); an endpoint with
+#   too few samples is tried early so it gets measured, and a small share of calls explores the others
+# - A failed request falls back to the next endpoint within the same attempt deadline; every endpoint but the
+#   last gets a bounded share of it (its p95 for the site times SHARE_FACTOR), so a hanging one cannot use it all up
+# - A hedged or retried attempt starts one endpoint further down the ranking than the attempt before it
+import json
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+from openai import OpenAI
+
+from resilience import CircuitBreaker, CircuitOpenError, LatencyTracker
+
+MIN_SAMPLES = 3          # Latency samples before an endpoint is ranked by its measurements
+EXPLORE_RATE = 0.05      # Share of calls that try a random healthy endpoint first, keeps estimates fresh
+ERROR_WINDOW = 50
+SHARE_FACTOR = 3.0       # An endpoint may take its p95 latency times this before the call falls back
+MIN_SHARE = 1.0          # Seconds, lower bound of that share
+
+
+@dataclass
+class EndpointConfig:
+    name: str
+    base_url: Optional[str]
+    api_key: str
+    model: str
+
+
+class ModelEndpoint:
+
+    def __init__(self, config: EndpointConfig, breaker: CircuitBreaker = None):
+        self.config = config
+        self.breaker = breaker or CircuitBreaker(failure_threshold=5, reset_timeout=30.0)
+        self.latency = {}                      # call site -> LatencyTracker
+        self._outcomes = deque(maxlen=ERROR_WINDOW)
+        self._client = None
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "failures": 0, "fallbacks": 0}
+
+    @property
+    def name(self) -> str:
+        return self.config.name
+
+    @property
+    def model(self) -> str:
+        return self.config.model
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    # Retries are owned by the resilience layer (retry budget), not the SDK
+                    self._client = OpenAI(api_key=self.config.api_key, base_url=self.config.base_url, max_retries=0)
+        return self._client
+
+    def tracker(self, site: str) -> LatencyTracker:
+        with self._lock:
+            tracker = self.latency.get(site)
+            if tracker is None:
+                tracker = self.latency[site] = LatencyTracker()
+            return tracker
+
+    def error_rate(self) -> float:
+        with self._lock:
+            return self._outcomes.count(False) / len(self._outcomes) if self._outcomes else 0.0
+
+    def expected_latency(self, site: str) -> Optional[float]:
+        """Median latency for this site scaled by 1 / success rate; None until MIN_SAMPLES successes"""
+        tracker = self.tracker(site)
+        if len(tracker) < MIN_SAMPLES:
+            return None
+        return tracker.percentile(50) / max(0.1, 1.0 - self.error_rate())
+
+    def time_share(self, site: str) -> Optional[float]:
+        """How long a request for this site may take before falling back; None until MIN_SAMPLES successes"""
+        tracker = self.tracker(site)
+        if len(tracker) < MIN_SAMPLES:
+            return None
+        return max(MIN_SHARE, tracker.percentile(95) * SHARE_FACTOR)
+
+    def record(self, site: str, ok: bool, seconds: float = None):
+        with self._lock:
+            self._outcomes.append(ok)
+            self.stats["calls"] += 1
+            if not ok:
+                self.stats["failures"] += 1
+        if ok:
+            self.tracker(site).record(seconds)
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+
+
+class ModelRouter:
+
+    def __init__(self, endpoints: List[EndpointConfig], routes: Dict[str, List[str]] = None,
+                 explore_rate: float = EXPLORE_RATE, rng: random.Random = None):
+        if not endpoints:
+            raise ValueError("ModelRouter needs at least one endpoint")
+        self.endpoints = {config.name: ModelEndpoint(config) for config in endpoints}
+        # Unknown endpoint names in a route are dropped; a route left empty falls back to every endpoint
+        self.routes = {}
+        for site, names in (routes or {}).items():
+            allowed = [name for name in names if name in self.endpoints]
+            if allowed:
+                self.routes[site] = allowed
+        self.explore_rate = explore_rate
+        self._rng = rng or random.Random()
+        self._rng_lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, api_key: str, base_url: Optional[str], model: str,
+                      endpoints_json: str = "", routes: Dict[str, List[str]] = None) -> "ModelRouter":
+        """The "default" endpoint from the classic settings plus any in endpoints_json:
+        {"fast": {"base_url": ..., "api_key": ..., "model": ...}, ...}"""
+        configs = [EndpointConfig("default", base_url, api_key, model)]
+        for name, spec in (json.loads(endpoints_json) if endpoints_json else {}).items():
+            configs = [c for c in configs if c.name != name]
+            configs.append(EndpointConfig(name, spec.get("base_url"), spec.get("api_key", api_key), spec["model"]))
+        return cls(configs, routes)
+
+    def allowed(self, site: str) -> List[ModelEndpoint]:
+        return [self.endpoints[name] for name in self.routes.get(site, self.endpoints)]
+
+    def ranked(self, site: str) -> List[ModelEndpoint]:
+        """Endpoints of the site's route that are not tripped: unmeasured ones first (route order), then fastest first"""
+        allowed = [endpoint for endpoint in self.allowed(site) if endpoint.breaker.state != "open"]
+        unmeasured = [endpoint for endpoint in allowed if endpoint.expected_latency(site) is None]
+        measured = sorted((endpoint for endpoint in allowed if endpoint not in unmeasured),
+                          key=lambda endpoint: endpoint.expected_latency(site))
+        ranked = unmeasured + measured
+        if len(ranked) > 1:
+            with self._rng_lock:
+                explore = self._rng.random() < self.explore_rate
+                pick = self._rng.randrange(1, len(ranked))
+            if explore:
+                ranked.insert(0, ranked.pop(pick))
+        return ranked
+
+    def call(self, site: str, request: Callable[[ModelEndpoint, float], object], timeout: float, offset: int = 0):
+        """request(endpoint, timeout) on the best endpoint, falling back to the next ones until `timeout` is used up.
+        offset: start that many endpoints down the ranking (hedges and retries of the same call)"""
+        deadline = time.monotonic() + timeout
+        last_error = None
+        candidates = self.ranked(site)
+        if candidates:
+            offset %= len(candidates)
+            candidates = candidates[offset:] + candidates[:offset]
+        for i, endpoint in enumerate(candidates):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if not endpoint.breaker.allow():
+                continue
+            if last_error is not None:
+                with endpoint._lock:
+                    endpoint.stats["fallbacks"] += 1
+            budget = remaining
+            if i < len(candidates) - 1:
+                # Unmeasured endpoints split the time evenly with the ones still to come
+                budget = min(remaining, endpoint.time_share(site) or remaining / (len(candidates) - i))
+            start = time.monotonic()
+            try:
+                result = request(endpoint, budget)
+            except Exception as e:
+                endpoint.record(site, False)
+                print(f"⚠️ {site} call to endpoint '{endpoint.name}' failed, trying the next one: {e}")
+                last_error = e
+                continue
+            endpoint.record(site, True, time.monotonic() - start)
+            return result
+        if last_error is not None:
+            raise last_error
+        raise CircuitOpenError(f"No healthy model endpoint for {site}")
+
+    def warm_up(self) -> dict:
+        return {name: endpoint.client is not None for name, endpoint in self.endpoints.items()}
+
+    def snapshot(self) -> dict:
+        """Per-endpoint model, breaker state, error rate and per-site latency, for the admin metrics view"""
+        endpoints = {}
+        for name, endpoint in self.endpoints.items():
+            with endpoint._lock:
+                sites = dict(endpoint.latency)
+                stats = dict(endpoint.stats)
+            endpoints[name] = dict(stats, model=endpoint.model, breaker=endpoint.breaker.state,
+                                   error_rate=round(endpoint.error_rate(), 3),
+                                   latency={site: {"p50": t.percentile(50), "p95": t.percentile(95), "samples": len(t)}
+                                            for site, t in sites.items()})
+        return {"endpoints": endpoints, "routes": {site: [e.name for e in self.allowed(site)] for site in self.routes}}
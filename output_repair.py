@@ -0,0 +1,261 @@
+# output_repair.py
+# Tolerant parsing of LLM JSON output: repair common syntax slips and coerce field types locally,
+# and only fall back to a short targeted fix-up request (never a full regeneration) when that fails.
+import json
+import re
+import threading
+from typing import Callable, Optional, Type
+
+from pydantic import BaseModel, ValidationError
+
+SMART_QUOTES = str.maketrans({"“": '"', "”": '"', "„": '"', "‘": "'", "’": "'"})
+FENCE_RE = re.compile(r"```(?:json|JSON)?\s*(.*?)```", re.DOTALL)
+TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+OPTION_KEY_RE = re.compile(r"^\s*(?:option\s*)?\(?([A-Za-z])\s*[\.\)\]:：、]?\s*$", re.IGNORECASE)
+ANSWER_RE = re.compile(r"^\s*(?:option\s*|answer\s*[:：]?\s*)?\(?([A-Da-d])(?![A-Za-z])", re.IGNORECASE)
+INT_RE = re.compile(r"[-+]?\d+")
+
+
+class StructuredOutputError(Exception):
+    """Raised when the output could not be turned into the expected model, even after a fix-up request"""
+
+
+# ================= Text Level Repair =================
+
+def strip_fences(text: str) -> str:
+    match = FENCE_RE.search(text)
+    return match.group(1) if match else text
+
+def extract_object(text: str) -> str:
+    """The first balanced {...} block, or the whole [...] when the output is a bare top-level list; string aware.
+    Falls back to everything after the opening bracket."""
+    stripped = text.lstrip()
+    start = len(text) - len(stripped) if stripped.startswith("[") else text.find("{")
+    if start < 0:
+        return text.strip()
+    depth, in_string, escaped = 0, False, False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            depth += 1
+        elif ch in "}]":
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return text[start:]
+
+def _next_significant(text: str, i: int) -> str:
+    while i < len(text) and text[i] in " \t\r\n":
+        i += 1
+    return text[i] if i < len(text) else ""
+
+def fix_strings(text: str) -> str:
+    """Escape quotes and raw newlines inside string values, and close a truncated document.
+
+    A '"' inside a string only ends it when followed by , : } ] or the end of input;
+    anything else (e.g. 'the "pivot" element') is treated as an unescaped inner quote.
+    """
+    out = []
+    stack = []
+    in_string, escaped = False, False
+    for i, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                if _next_significant(text, i + 1) in (",", ":", "}", "]", ""):
+                    in_string = False
+                else:
+                    out.append('\\"')
+                    continue
+            elif ch == "\n":
+                out.append("\\n")
+                continue
+            elif ch == "\t":
+                out.append("\\t")
+                continue
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]" and stack:
+            stack.pop()
+        out.append(ch)
+    if in_string:
+        out.append('"')
+    out.extend(reversed(stack))
+    return "".join(out)
+
+def repair_text(raw: str) -> str:
+    text = extract_object(strip_fences(raw.translate(SMART_QUOTES)))
+    text = fix_strings(text)
+    text = TRAILING_COMMA_RE.sub(r"\1", text)
+    # Python literals occasionally leak into "JSON" answers
+    text = re.sub(r"(?<=[:\[,\s])(True|False|None)(?=\s*[,}\]])",
+                  lambda m: {"True": "true", "False": "false", "None": "null"}[m.group(1)], text)
+    return text
+
+
+# ================= Field Level Coercion =================
+
+def _to_int(value, low=None, high=None):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, float):
+        value = int(round(value))
+    elif isinstance(value, str):
+        match = INT_RE.search(value)
+        if not match:
+            return value
+        value = int(match.group(0))
+    if isinstance(value, int):
+        if low is not None:
+            value = max(low, value)
+        if high is not None:
+            value = min(high, value)
+    return value
+
+def _to_options(value):
+    if isinstance(value, list):
+        # ["A. foo", "B. bar"] or ["foo", "bar"]
+        options = {}
+        for i, item in enumerate(value):
+            text = str(item)
+            match = re.match(r"^\s*([A-Za-z])\s*[\.\)、:：]\s*(.*)$", text, re.DOTALL)
+            if match:
+                options[match.group(1).upper()] = match.group(2).strip()
+            else:
+                options[chr(ord("A") + i)] = text
+        return options
+    if isinstance(value, dict):
+        options = {}
+        for key, text in value.items():
+            match = OPTION_KEY_RE.match(str(key))
+            options[match.group(1).upper() if match else str(key)] = text if isinstance(text, str) else json.dumps(text, ensure_ascii=False)
+        return options
+    return value
+
+def _to_answer(value):
+    if isinstance(value, list) and value:
+        value = value[0]
+    if isinstance(value, str):
+        match = ANSWER_RE.match(value)
+        if match:
+            return match.group(1).upper()
+    return value
+
+def _to_str_list(value):
+    if isinstance(value, str):
+        return [part.strip(" -•") for part in re.split(r"[\n,，、;；]", value) if part.strip(" -•")]
+    if isinstance(value, list):
+        return [v if isinstance(v, str) else json.dumps(v, ensure_ascii=False) for v in value]
+    return value
+
+def _to_str(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    if value is None:
+        return ""
+    return value if isinstance(value, str) else str(value)
+
+# Field name -> normalizer, applied wherever the name appears in the expected model
+FIELD_COERCIONS = {
+    "difficulty": lambda v: _to_int(v, 1, 5),
+    "score_change": lambda v: _to_int(v),
+    "options": _to_options,
+    "correct_answer": _to_answer,
+    "topics": _to_str_list,
+    "practices": _to_str_list,
+}
+
+def coerce_fields(data, model_cls: Type[BaseModel]):
+    """Normalize common type slips in place of the expected model's fields, recursing into nested models"""
+    if not isinstance(data, dict):
+        return data
+    for name, field in model_cls.model_fields.items():
+        if name not in data:
+            continue
+        annotation = field.annotation
+        if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+            data[name] = coerce_fields(data[name], annotation)
+        elif name in FIELD_COERCIONS:
+            data[name] = FIELD_COERCIONS[name](data[name])
+        elif annotation is str:
+            data[name] = _to_str(data[name])
+    return data
+
+
+# ================= Pipeline =================
+
+class RepairStats:
+    """Per call site: how many outputs were clean, locally repaired, fixed by a fix-up request, or lost"""
+
+    OUTCOMES = ("clean", "repaired", "fixup", "failed")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+
+    def record(self, site: str, outcome: str):
+        with self._lock:
+            counts = self._counts.setdefault(site, dict.fromkeys(self.OUTCOMES, 0))
+            counts[outcome] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            result = {}
+            for site, counts in self._counts.items():
+                total = sum(counts.values())
+                result[site] = dict(counts,
+                                    repair_rate=round(counts["repaired"] / total, 3),
+                                    fixup_rate=round(counts["fixup"] / total, 3),
+                                    failure_rate=round(counts["failed"] / total, 3))
+            return result
+
+
+def try_parse(raw: str, model_cls: Type[BaseModel]):
+    """(model, outcome) or (None, error message). Outcome is 'clean' or 'repaired'."""
+    if not isinstance(raw, str):
+        return None, f"expected text output, got {type(raw).__name__}"
+    match = re.search(r'\{.*\}', raw, re.DOTALL)
+    try:
+        return model_cls.model_validate_json(match.group(0) if match else raw.strip()), "clean"
+    except ValidationError:
+        pass
+    try:
+        data = json.loads(repair_text(raw))
+        return model_cls.model_validate(coerce_fields(data, model_cls)), "repaired"
+    except (ValueError, ValidationError) as e:
+        return None, str(e)[:500]
+
+
+def parse_structured(raw: str, model_cls: Type[BaseModel], site: str, stats: RepairStats,
+                     fixup: Optional[Callable[[str, str], str]] = None) -> BaseModel:
+    """Parse `raw` into `model_cls`, repairing locally first and asking `fixup(raw, errors)` as a last resort"""
+    model, outcome = try_parse(raw, model_cls)
+    if model is not None:
+        stats.record(site, outcome)
+        return model
+
+    error = outcome
+    if fixup is not None and isinstance(raw, str):
+        try:
+            model, _ = try_parse(fixup(raw, error), model_cls)
+        except Exception as e:
+            error = f"{error}; fix-up request failed: {e}"
+        if model is not None:
+            stats.record(site, "fixup")
+            return model
+    stats.record(site, "failed")
+    raise StructuredOutputError(error)
@@ -0,0 +1,182 @@
+# quiz_session.py
+# Quiz sessions: N questions issued together and answered in one submission, instead of one
+# /api/question + /api/submit round trip per question.
+# - Questions come from one batched completion; items the batch did not deliver are generated in parallel
+# - Feedback for all answers is evaluated concurrently (the scheduler still caps and fair-queues the calls)
+# - Streak / Elo updates are applied in question order and committed in one transaction
+import contextvars
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+from dashboard_feed import dashboard_hub
+from database import get_all_topic_scores, get_average_score, record_quiz_results, set_topic_score
+from llm_scheduler import LLMOverloadedError
+from llm_service import global_system, score_answer, user_streaks, user_total_answers
+from tracing import traced
+
+QUIZ_MAX_QUESTIONS = int(os.getenv("QUIZ_MAX_QUESTIONS", "10"))
+QUIZ_SESSION_TTL = float(os.getenv("QUIZ_SESSION_TTL", "3600"))
+QUIZ_PARALLELISM = int(os.getenv("QUIZ_PARALLELISM", "8"))
+
+
+class QuizStartPayload(BaseModel):
+    user_id: int
+    subject: str = "Python Programming"
+    topic: Optional[str] = None
+    count: int = 5
+    initial_score: Optional[int] = None
+
+class QuizSubmitPayload(BaseModel):
+    user_id: int
+    session_id: str
+    answers: List[str]
+
+
+# session_id -> {"user_id", "subject", "questions", "created_at"}
+quiz_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def _in_parallel(fn, calls: list) -> list:
+    """fn(*args) for every args tuple, concurrently; results in call order.
+    Each task runs in a copy of the caller's context so its spans land in the request's trace."""
+    if len(calls) <= 1:
+        return [fn(*args) for args in calls]
+    with ThreadPoolExecutor(max_workers=min(len(calls), QUIZ_PARALLELISM)) as pool:
+        futures = [pool.submit(contextvars.copy_context().run, fn, *args) for args in calls]
+        return [future.result() for future in futures]
+
+def _expire_sessions_locked(now: float):
+    for session_id in [sid for sid, s in quiz_sessions.items() if now - s["created_at"] > QUIZ_SESSION_TTL]:
+        del quiz_sessions[session_id]
+
+def _generate_one(user_id, subject, topic, score):
+    try:
+        return global_system.generate_question(user_id, subject, topic, score)
+    except LLMOverloadedError:
+        return None
+
+
+@traced("quiz.start")
+def start_quiz(user_id: int, subject: str, topic: str = None, count: int = 5, initial_score: int = None) -> dict:
+    count = max(1, min(count, QUIZ_MAX_QUESTIONS))
+    score = global_system.resolve_score(user_id, topic, initial_score)
+    try:
+        questions = global_system.generate_question_batch(user_id, subject, topic, count, initial_score=score) if count > 1 else []
+    except LLMOverloadedError as e:
+        return {"status": "error", "message": str(e)}
+    missing = count - len(questions)
+    if missing:
+        questions += [q for q in _in_parallel(_generate_one, [(user_id, subject, topic, score)] * missing) if q]
+    if not questions:
+        return {"status": "error", "message": "LLM generated question format error, please retry"}
+
+    if initial_score is not None:
+        for category in {q.get("category", "Comprehensive") for q in questions}:
+            set_topic_score(user_id, category, initial_score)
+    scores = get_all_topic_scores(user_id)
+
+    session_id = uuid.uuid4().hex
+    now = time.time()
+    with _sessions_lock:
+        _expire_sessions_locked(now)
+        quiz_sessions[session_id] = {"user_id": user_id, "subject": subject, "questions": questions, "created_at": now}
+
+    return {
+        "status": "success",
+        "data": {
+            "session_id": session_id,
+            "questions": [{
+                "index": i,
+                "category": q.get("category", "Comprehensive"),
+                "difficulty": q.get("difficulty", 2),
+                "content": q.get("content", ""),
+                "options": q.get("options", {}),
+                "current_score": scores.get(q.get("category", "Comprehensive"), 500),
+            } for i, q in enumerate(questions)],
+        }
+    }
+
+
+@traced("quiz.submit")
+def submit_quiz(payload: QuizSubmitPayload) -> dict:
+    user_id = payload.user_id
+    with _sessions_lock:
+        _expire_sessions_locked(time.time())
+        session = quiz_sessions.get(payload.session_id)
+        if session is None or session["user_id"] != user_id:
+            return {"status": "error", "message": "Quiz session not found or expired, please start a new quiz!"}
+        if len(payload.answers) != len(session["questions"]):
+            return {"status": "error", "message": f"Please answer all {len(session['questions'])} questions!"}
+        # Taken out before evaluating, so a duplicate submission cannot score the quiz twice
+        del quiz_sessions[payload.session_id]
+
+    subject = session["subject"]
+    questions = session["questions"]
+    answers = [answer.strip().upper() for answer in payload.answers]
+    verdicts = [answer == q.get("correct_answer") for q, answer in zip(questions, answers)]
+
+    feedbacks = _in_parallel(
+        lambda q, answer, is_correct: global_system.evaluate_answer_by_llm(
+            subject=subject, question_data=q, user_ans=answer, is_correct=is_correct, user_id=user_id),
+        list(zip(questions, answers, verdicts)))
+
+    # In question order, each answer sees the streak and topic score left by the previous one
+    streak_before = user_streaks.get(user_id, 0)
+    scores = get_all_topic_scores(user_id)
+    score_changes, wrong_rows, streak_msgs = [], [], []
+    for q, answer, is_correct, feedback in zip(questions, answers, verdicts, feedbacks):
+        category = q.get("category", "Uncategorized")
+        current_score = scores.get(category, 500)
+        change, streak_msg = score_answer(user_id, is_correct, feedback.get("score_change", 0),
+                                          q.get("difficulty", 2), current_score)
+        scores[category] = max(0, min(1000, current_score + change))
+        score_changes.append((category, change))
+        streak_msgs.append(streak_msg)
+        if not is_correct:
+            wrong_rows.append((user_id, category, q.get("content", ""), answer, q.get("correct_answer"),
+                               feedback.get("root_cause", "None"), feedback.get("improvement", "None")))
+
+    try:
+        new_scores = record_quiz_results(user_id, score_changes, wrong_rows)
+    except Exception as e:
+        print(f"⚠️ Failed to save quiz results: {e}")
+        user_streaks[user_id] = streak_before
+        with _sessions_lock:
+            quiz_sessions[payload.session_id] = session   # Nothing was written, the quiz can be submitted again
+        return {"status": "error", "message": "Failed to save quiz results, please submit again"}
+
+    user_total_answers[user_id] = user_total_answers.get(user_id, 0) + len(questions)
+    results = []
+    for i, (q, answer, is_correct, feedback, (category, change), new_score, streak_msg) in enumerate(
+            zip(questions, answers, verdicts, feedbacks, score_changes, new_scores, streak_msgs)):
+        dashboard_hub.publish_answer(user_id, category, new_score, is_correct)
+        results.append({
+            "index": i,
+            "is_correct": is_correct,
+            "your_answer": answer,
+            "correct_answer": q.get("correct_answer"),
+            "current_topic": category,
+            "current_score": new_score,
+            "base_score_change": change,
+            "streak_msg": streak_msg,
+            "root_cause": feedback.get("root_cause", "None"),
+            "improvement": feedback.get("improvement", "None"),
+        })
+
+    review_data = global_system.generate_phase_review(user_id, subject, get_average_score(user_id))
+    if review_data:
+        review_data['count'] = user_total_answers[user_id]
+
+    return {
+        "status": "success",
+        "correct_count": sum(verdicts),
+        "results": results,
+        "review_data": review_data
+    }
@@ -0,0 +1,262 @@
+# resilience.py
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a call site does not produce a result before its deadline"""
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is skipped because the upstream circuit breaker is open"""
+
+
+@dataclass
+class CallPolicy:
+    timeout: float                 # Deadline in seconds for the whole call, retries and hedges included
+    hedge: bool = False            # Only enable for idempotent calls: a duplicate request may be fired
+    hedge_percentile: float = 95.0
+    min_hedge_delay: float = 0.5
+    max_retries: int = 0
+    breaker: Optional[str] = None  # Name of the circuit breaker guarding this call site
+    pool: Optional[str] = None     # Separate bounded worker pool, for clients that can't be given a timeout
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies"""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        with self._lock:
+            if not self._samples:
+                return None
+            ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def __len__(self):
+        return len(self._samples)
+
+
+class CircuitBreaker:
+    """closed -> open after N consecutive failures -> half_open after reset_timeout -> closed on success"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state_locked()
+
+    def _state_locked(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if self._clock() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self._state_locked()
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._probe_in_flight:
+                # Let exactly one probe through to test whether the upstream recovered
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = self._clock()
+
+
+class RetryBudget:
+    """Retries (and hedges) may use at most `ratio` of recent request volume, plus a small floor"""
+
+    def __init__(self, ratio: float = 0.2, min_per_window: int = 3, window: float = 10.0, clock=time.monotonic):
+        self.ratio = ratio
+        self.min_per_window = min_per_window
+        self.window = window
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._requests = deque()
+        self._retries = deque()
+
+    def _trim(self, now):
+        for q in (self._requests, self._retries):
+            while q and now - q[0] > self.window:
+                q.popleft()
+
+    def record_request(self):
+        with self._lock:
+            now = self._clock()
+            self._trim(now)
+            self._requests.append(now)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            now = self._clock()
+            self._trim(now)
+            if len(self._retries) >= self.min_per_window + self.ratio * len(self._requests):
+                return False
+            self._retries.append(now)
+            return True
+
+
+def _no_release():
+    pass
+
+
+class ResilientCaller:
+    """Runs upstream calls with per-call-site deadlines, hedging, retries and circuit breakers.
+
+    One deadline covers the whole call: every attempt and hedge only gets the time left before it.
+    The wrapped callable receives that remaining time so that it can be passed down to the
+    HTTP client, which is what actually frees the stuck socket.
+    """
+
+    def __init__(self, policies: Dict[str, CallPolicy], breakers: Dict[str, CircuitBreaker] = None,
+                 retry_budget: RetryBudget = None, max_workers: int = 32, pools: Dict[str, int] = None):
+        self.policies = policies
+        self.breakers = breakers or {}
+        self.retry_budget = retry_budget or RetryBudget()
+        self.latency = {site: LatencyTracker() for site in policies}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="upstream")
+        # A call that ignores its timeout keeps its thread after the deadline; in its own pool it can only
+        # exhaust that pool (later calls queue there and time out) instead of starving every other call site
+        self._pools = {name: ThreadPoolExecutor(max_workers=size, thread_name_prefix=f"upstream-{name}")
+                       for name, size in (pools or {}).items()}
+        self.stats = {site: {"calls": 0, "hedged": 0, "retries": 0, "timeouts": 0, "failures": 0, "short_circuited": 0}
+                      for site in policies}
+        self._stats_lock = threading.Lock()
+
+    def _bump(self, site, key):
+        with self._stats_lock:
+            self.stats[site][key] += 1
+
+    def hedge_delay(self, site: str) -> Optional[float]:
+        policy = self.policies[site]
+        tracker = self.latency[site]
+        if not policy.hedge or len(tracker) < 10:
+            # Not enough samples for a meaningful p95 yet, don't hedge blindly
+            return None
+        return max(policy.min_hedge_delay, tracker.percentile(policy.hedge_percentile))
+
+    def call(self, site: str, fn: Callable[[float], object], hedge_slot: Callable[[], Optional[Callable]] = None):
+        """fn(timeout) under the site's policy. hedge_slot: asked before firing a hedge, returns a release
+        function (called once the hedge finishes) or None to skip it, e.g. a free concurrency slot"""
+        policy = self.policies[site]
+        breaker = self.breakers.get(policy.breaker) if policy.breaker else None
+        self._bump(site, "calls")
+
+        if breaker is not None and not breaker.allow():
+            self._bump(site, "short_circuited")
+            raise CircuitOpenError(f"Circuit '{policy.breaker}' is open, skipping {site}")
+
+        self.retry_budget.record_request()
+        deadline = time.monotonic() + policy.timeout
+        attempt = 0
+        while True:
+            try:
+                result = self._attempt(site, policy, fn, deadline, hedge_slot)
+                if breaker is not None:
+                    breaker.record_success()
+                return result
+            except Exception:
+                if breaker is not None:
+                    breaker.record_failure()
+                attempt += 1
+                breaker_allows = breaker is None or breaker.allow()
+                out_of_time = time.monotonic() >= deadline
+                if attempt > policy.max_retries or out_of_time or not breaker_allows or not self.retry_budget.try_spend():
+                    self._bump(site, "failures")
+                    raise
+                self._bump(site, "retries")
+
+    def _attempt(self, site: str, policy: CallPolicy, fn, deadline: float, hedge_slot=None):
+        timeout = deadline - time.monotonic()
+        executor = self._pools[policy.pool] if policy.pool else self._executor
+        futures = {executor.submit(self._timed, fn, timeout)}
+
+        hedge_delay = self.hedge_delay(site)
+        if hedge_delay is not None and hedge_delay < timeout:
+            done, _ = wait(futures, timeout=hedge_delay)
+            release = None
+            if not done:
+                release = hedge_slot() if hedge_slot is not None else _no_release
+            if release is not None and self.retry_budget.try_spend():
+                self._bump(site, "hedged")
+                hedge = executor.submit(self._timed, fn, max(0.001, deadline - time.monotonic()))
+                hedge.add_done_callback(lambda _: release())
+                futures.add(hedge)
+            elif release is not None:
+                release()
+
+        last_error = None
+        pending = set(futures)
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result, elapsed = future.result()
+                except Exception as e:
+                    last_error = e
+                    continue
+                self.latency[site].record(elapsed)
+                return result
+
+        if last_error is not None and not pending:
+            raise last_error
+        for future in pending:
+            future.cancel()     # Still queued behind busy workers: never start it
+        self._bump(site, "timeouts")
+        raise DeadlineExceeded(f"{site} exceeded its {policy.timeout:.1f}s deadline")
+
+    @staticmethod
+    def _timed(fn, timeout):
+        start = time.monotonic()
+        result = fn(timeout)
+        return result, time.monotonic() - start
+
+    def snapshot(self) -> dict:
+        """Per-call-site counters, latency percentiles and breaker states, for the admin metrics view"""
+        with self._stats_lock:
+            stats = {site: dict(counters) for site, counters in self.stats.items()}
+        for site, tracker in self.latency.items():
+            stats[site]["p50"] = tracker.percentile(50)
+            stats[site]["p95"] = tracker.percentile(95)
+        return {
+            "sites": stats,
+            "breakers": {name: b.state for name, b in self.breakers.items()},
+        }
@@ -0,0 +1,166 @@
+# storage.py
+# Storage backend interface. database.py exposes these methods as module functions and picks the
+# backend from DB_BACKEND: "mysql" (storage_mysql.py) or "sqlite" (storage_sqlite.py, embedded, WAL).
+from abc import ABC, abstractmethod
+
+import bcrypt
+
+
+def hash_password(password: str) -> str:
+    salt = bcrypt.gensalt()
+    hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
+    return hashed.decode('utf-8')
+
+def verify_password(password: str, hashed: str) -> bool:
+    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+
+
+class Storage(ABC):
+    """Every backend implements the full function set with the same return shapes (rows are dicts)"""
+
+    name = "base"
+
+    # ---------- Lifecycle ----------
+
+    @abstractmethod
+    def ensure_schema(self):
+        """Create missing tables / columns needed by the application"""
+
+    @abstractmethod
+    def warm_up(self, size: int = None) -> int:
+        """Open up to `size` (default: the backend's pool size) connections ahead of the first request;
+        returns how many are ready"""
+
+    def close(self):
+        pass
+
+    @abstractmethod
+    def reset_all_data(self):
+        """Delete every user, score and wrong question and restart the ids (cleardata.py)"""
+
+    # ---------- Users ----------
+
+    @abstractmethod
+    def create_user(self, username: str, plain_password: str):
+        ...
+
+    @abstractmethod
+    def verify_user_login(self, username: str, plain_password: str):
+        ...
+
+    @abstractmethod
+    def get_user_info(self, user_id: int) -> dict:
+        ...
+
+    # ---------- Knowledge point scores ----------
+
+    @abstractmethod
+    def get_topic_score(self, user_id: int, topic: str) -> int:
+        ...
+
+    @abstractmethod
+    def update_topic_score(self, user_id: int, topic: str, score_change: int) -> int:
+        """Apply a delta clamped to [0, 1000], starting from 500; returns the new score"""
+
+    @abstractmethod
+    def get_all_topic_scores(self, user_id: int) -> dict:
+        ...
+
+    @abstractmethod
+    def get_average_score(self, user_id: int) -> int:
+        ...
+
+    @abstractmethod
+    def set_topic_score(self, user_id: int, topic: str, score: int):
+        ...
+
+    # ---------- Wrong questions ----------
+
+    @abstractmethod
+    def record_wrong_question_to_db(self, user_id: int, category: str, content: str, student_ans: str,
+                                    correct_ans: str, root_cause: str, improvement: str):
+        ...
+
+    @abstractmethod
+    def record_wrong_questions_batch(self, batch_id: str, rows: list) -> bool:
+        """Multi-row insert of [(user_id, category, content, student_ans, correct_ans, root_cause, improvement,
+        created_at)] in one transaction; False (nothing written) if batch_id was applied before"""
+
+    @abstractmethod
+    def record_quiz_results(self, user_id: int, score_changes: list, wrong_rows: list) -> list:
+        """One transaction for a submitted quiz: apply [(topic, delta)] in order like update_topic_score and
+        insert [(user_id, category, content, student_ans, correct_ans, root_cause, improvement)];
+        returns the score after each delta"""
+
+    @abstractmethod
+    def get_user_weaknesses(self, user_id: int) -> list:
+        ...
+
+    @abstractmethod
+    def get_wrong_questions_details(self, user_id: int) -> list:
+        ...
+
+    @abstractmethod
+    def get_wrong_questions_by_topic(self, user_id: int, topic: str, limit: int = 3) -> list:
+        ...
+
+    # ---------- Misconception digests ----------
+
+    @abstractmethod
+    def get_misconception_digests(self, user_id: int) -> list:
+        """[{category, wrong_count, digest (JSON text)}] of one user"""
+
+    @abstractmethod
+    def save_misconception_digests(self, rows: list):
+        """rows: [(user_id, category, wrong_count, digest JSON)], upserted in one transaction; a stored digest is
+        only replaced by one with a higher wrong_count, so a stale copy in another process never overwrites it"""
+
+    @abstractmethod
+    def get_wrong_question_counts(self, user_id: int) -> dict:
+        """category -> wrong answers, live and archived"""
+
+    @abstractmethod
+    def get_recent_wrong_questions(self, user_id: int, category: str, limit: int) -> list:
+        """Newest first, with the feedback diagnosis and timestamp"""
+
+    # ---------- Bulk operations ----------
+
+    @abstractmethod
+    def get_user_ids_by_usernames(self, usernames: list) -> dict:
+        ...
+
+    @abstractmethod
+    def bulk_create_users(self, rows: list, update_existing: bool = False) -> int:
+        ...
+
+    @abstractmethod
+    def bulk_set_topic_scores(self, rows: list) -> int:
+        ...
+
+    # ---------- Export / archive ----------
+
+    @abstractmethod
+    def iter_wrong_questions(self, user_ids: list = None, batch_size: int = 1000):
+        ...
+
+    @abstractmethod
+    def get_wrong_questions_older_than(self, cutoff, after_id: int = 0, limit: int = 1000) -> list:
+        ...
+
+    @abstractmethod
+    def count_wrong_questions_by_ids(self, ids: list) -> int:
+        ...
+
+    @abstractmethod
+    def archive_wrong_questions(self, ids: list, summary_rows: list):
+        ...
+
+    @abstractmethod
+    def get_archived_category_counts(self, user_id: int) -> dict:
+        ...
+
+    # ---------- Teacher side ----------
+
+    @abstractmethod
+    def get_all_users_overview(self) -> list:
+        ...
@@ -0,0 +1,624 @@
+# storage_mysql.py
+# MySQL backend: pooled pymysql connections, the original SQL of database.py.
+import queue
+import time
+import pymysql
+
+from storage import Storage, hash_password, verify_password
+
+# Idle connections older than this are pinged before reuse (MySQL drops them after wait_timeout)
+DB_POOL_PING_AFTER = 30.0
+
+MYSQL_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        username VARCHAR(255) NOT NULL UNIQUE,
+        password_hash VARCHAR(255) NOT NULL
+    ) CHARACTER SET utf8mb4
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS user_topic_scores (
+        user_id INT NOT NULL,
+        topic VARCHAR(255) NOT NULL,
+        score INT NOT NULL DEFAULT 500,
+        PRIMARY KEY (user_id, topic)
+    ) CHARACTER SET utf8mb4
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS wrong_questions (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        user_id INT NOT NULL,
+        category VARCHAR(255),
+        question_content TEXT,
+        student_answer TEXT,
+        correct_answer TEXT,
+        root_cause TEXT,
+        improvement TEXT,
+        created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        INDEX idx_wq_user (user_id),
+        INDEX idx_wq_created_at (created_at)
+    ) CHARACTER SET utf8mb4
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS wrong_question_archive_summary (
+        user_id INT NOT NULL,
+        category VARCHAR(255) NOT NULL,
+        archived_count INT NOT NULL DEFAULT 0,
+        last_archived_at DATETIME NULL,
+        PRIMARY KEY (user_id, category)
+    ) CHARACTER SET utf8mb4
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS misconception_digests (
+        user_id INT NOT NULL,
+        category VARCHAR(255) NOT NULL,
+        wrong_count INT NOT NULL DEFAULT 0,
+        digest TEXT NOT NULL,
+        updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        PRIMARY KEY (user_id, category)
+    ) CHARACTER SET utf8mb4
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS write_behind_batches (
+        batch_id VARCHAR(64) PRIMARY KEY,
+        applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+]
+
+
+class PooledConnection:
+    """Wraps a pymysql connection so that close() hands it back to the pool instead of disconnecting"""
+
+    def __init__(self, conn, pool):
+        self._conn = conn
+        self._pool = pool
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        try:
+            conn.rollback()  # Never hand out a connection with a half finished transaction
+            self._pool.put_nowait((conn, time.monotonic()))
+        except Exception:
+            conn.close()
+
+
+class MySQLStorage(Storage):
+
+    name = "mysql"
+
+    def __init__(self, config: dict, pool_size: int = 8):
+        self.config = config
+        self.pool_size = pool_size
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+
+    # ================= Connection Pool =================
+
+    def connection(self):
+        while True:
+            try:
+                conn, last_used = self._pool.get_nowait()
+            except queue.Empty:
+                return PooledConnection(pymysql.connect(**self.config), self._pool)
+            if time.monotonic() - last_used < DB_POOL_PING_AFTER:
+                return PooledConnection(conn, self._pool)
+            try:
+                conn.ping(reconnect=True)
+                return PooledConnection(conn, self._pool)
+            except Exception:
+                conn.close()
+
+    def warm_up(self, size: int = None) -> int:
+        """Pre-open pool connections so the first requests skip connection setup"""
+        opened = []
+        try:
+            for _ in range(size or self.pool_size):
+                opened.append(self.connection())
+        finally:
+            for conn in opened:
+                conn.close()
+        return self._pool.qsize()
+
+    def close(self):
+        while True:
+            try:
+                conn, _ = self._pool.get_nowait()
+            except queue.Empty:
+                return
+            conn.close()
+
+    def ensure_schema(self):
+        """Create missing tables and make sure wrong_questions carries a timestamp to age rows by"""
+        conn = self.connection()
+        try:
+            with conn.cursor() as cursor:
+                for ddl in MYSQL_SCHEMA:
+                    cursor.execute(ddl)
+                cursor.execute("""
+                    SELECT COUNT(*) AS n FROM information_schema.COLUMNS
+                    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'wrong_questions' AND COLUMN_NAME = 'created_at'
+                """)
+                if not cursor.fetchone()['n']:
+                    cursor.execute("ALTER TABLE wrong_questions ADD COLUMN created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP, ADD INDEX idx_wq_created_at (created_at)")
+            conn.commit()
+        finally:
+            conn.close()
+
+    def reset_all_data(self):
+        conn = self.connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+                for table in ("wrong_questions", "wrong_question_archive_summary", "user_topic_scores", "users", "write_behind_batches", "misconception_digests"):
+                    cursor.execute(f"TRUNCATE TABLE {table}")
+                cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+            conn.commit()
+        finally:
+            conn.close()
+
+    # ================= Users =================
+
+    def create_user(self, username, plain_password):
+        conn = self.connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT id FROM users WHERE username = %s", (username,))
+                if cursor.fetchone():
+                    return False, "Username already exists, please login directly or choose another username"
+
+                sql = "INSERT INTO users (username, password_hash) VALUES (%s, %s)"
+                cursor.execute(sql, (username, hash_password(plain_password)))
+            conn.commit() 
+            return True, "Registration successful"
+        except Exception as e:
+            return False, f"Registration failed: {e}"
+        finally:
+            conn.close()
+
+    def verify_user_login(self, username, plain_password):
+        conn = self.connection()
+        try:
+            with conn.cursor() as cursor:
+                sql = "SELECT id, password_hash FROM users WHERE username = %s"
+                cursor.execute(sql, (username,))
+                user = cursor.fetchone()
+                if user and verify_password(plain_password, user['password_hash']):
+                    return user['id']
+            return None
+        finally:
+            conn.close()
+
+    def get_user_info(self, user_id: int) -> dict:
+        conn = self.connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT id, username FROM users WHERE id = %s", (user_id,))
+                return cursor.fetchone()
+        finally:
+            conn.close()
+
+    # ================= Knowledge Point Score System =================
+
+    def get_topic_score(self, user_id: int, topic: str) -> int:
+        conn = self.connection()
+        try:
+            with conn.cursor() as cursor:
+                sql = "SELECT score FROM user_topic_scores WHERE user_id = %s AND topic = %s"
+                cursor.execute(sql, (user_id, topic))
+                result = cursor.fetchone()
+                return result['score'] if result else 500
+        finally:
+            conn.close()
+
+    def update_topic_score(self, user_id: int, topic: str, score_change: int) -> int:
+        conn = self.connection()
+        try:
+            with conn.cursor() as cursor:
+                sql_insert = "INSERT IGNORE INTO user_topic_scores (user_id, topic, score) VALUES (%s, %s, 500)"
+                cursor.execute(sql_insert, (user_id, topic))
+
+                sql_update = """
+                UPDATE user_topic_scores 
+                SET score = GREATEST(0, LEAST(1000, score + %s)) 
+                WHERE user_id = %s AND topic = %s
+                """
+                cursor.execute(sql_update, (score_change, user_id, topic))
+
+                sql_select = "SELECT score FROM user_topic_scores WHERE user_id = %s AND topic = %s"
+                cursor.execute(sql_select, (user_id, topic))
+                new_score = cursor.fetchone()['score']
+
+            conn.commit()
+            return new_score
+        finally:
+            conn.close()
+
+    def get_all_topic_scores(self, user_id: int) -> dict:
+        conn = self.connection()
+        try:
+            with conn.cursor() as cursor:
+                sql = "SELECT topic, score FROM user_topic_scores WHERE user_id = %s"
+                cursor.execute(sql, (user_id,))
+                results = cursor.fetchall()
+                return {row['topic']: row['score'] for row in results}
+        finally:
+            conn.close()
+
+    def get_average_score(self, user_id: int) -> int:
+        conn = self.connection()
+        try:
+            with conn.cursor() as cursor:
+                sql = "SELECT AVG(score) as avg_score FROM user_topic_scores WHERE user_id = %s"
+                cursor.execute(sql, (user_id,))
+                result = cursor.fetchone()
+                return int(result['avg_score']) if result and result['avg_score'] is not None else 500
+        finally:
+            conn.close()
+
+    # ✨ New: Score override function to forcefully set initial difficulty
+    def set_topic_score(self, user_id: int, topic: str, score: int):
+        conn = self.connection()
+        try:
+            with conn.cursor() as cursor:
+                sql = """
+                INSERT INTO user_topic_scores (user_id, topic, score) 
+                VALUES (%s, %s, %s)
+                ON DUPLICATE KEY UPDATE score = VALUES(score)
+                """
+                cursor.execute(sql, (user_id, topic, score))
+            conn.commit()
+        finally:
+            conn.close()
+
+    # ================= Wrong Question System =================
+
+    def record_wrong_question_to_db(self, user_id: int, category: str, content: str, student_ans: str, correct_ans: str, root_cause: str, improvement: str):
+        conn = self.connection()
+        try:
+            with conn.cursor() as cursor:
+                sql = """
+                INSERT INTO wrong_questions 
+                (user_id, category, question_content, student_answer, correct_answer, root_cause, improvement) 
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                """
+                cursor.execute(sql, (user_id, category, content, student_ans, correct_ans, root_cause, improvement))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def record_wrong_questions_batch(self, batch_id: str, rows: list) -> bool:
+        conn = self.connection()
+        try:
+            with conn.cursor() as cursor:
+                if not cursor.execute("INSERT IGNORE INTO write_behind_batches (batch_id) VALUES (%s)", (batch_id,)):
+                    return False
+                # pymysql rewrites executemany of an INSERT ... VALUES into multi-row inserts
+                sql = """
+                INSERT INTO wrong_questions 
+                (user_id, category, question_content, student_answer, correct_answer, root_cause, improvement, created_at) 
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                """
+                cursor.executemany(sql, rows)
+                cursor.execute("DELETE FROM write_behind_batches WHERE applied_at < NOW() - INTERVAL 7 DAY")
+            conn.commit()
+            return True
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def record_quiz_results(self, user_id: int, score_changes: list, wrong_rows: list) -> list:
+        conn = self.connection()
+        try:
+            scores = []
+            with conn.cursor() as cursor:
+                for topic, delta in score_changes:
+                    cursor.execute("INSERT IGNORE INTO user_topic_scores (user_id, topic, score) VALUES (%s, %s, 500)", (user_id, topic))
+                    sql_update = """
+                    UPDATE user_topic_scores 
+                    SET score = GREATEST(0, LEAST(1000, score + %s)) 
+                    WHERE user_id = %s AND topic = %s
+                    """
+                    cursor.execute(sql_update, (delta, user_id, topic))
+                    cursor.execute("SELECT score FROM user_topic_scores WHERE user_id = %s AND topic = %s", (user_id, topic))
+                    scores.append(cursor.fetchone()['score'])
+                if wrong_rows:
+                    sql = """
+                    INSERT INTO wrong_questions 
+                    (user_id, category, question_content, student_answer, correct_answer, root_cause, improvement) 
+                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                    """
+                    cursor.executemany(sql, wrong_rows)
+            conn.commit()
+            return scores
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def get_user_weaknesses(self, user_id: int) -> list:
+        conn = self.connection()
+        try:
+            with conn.cursor() as cursor:
+                # Archived rows keep counting as weaknesses through the archive summary
+                sql = """
+                SELECT category FROM wrong_questions WHERE user_id = %s
+                UNION
+                SELECT category FROM wrong_question_archive_summary WHERE user_id = %s
+                """
+                cursor.execute(sql, (user_id, user_id))
+                results = cursor.fetchall()
+                return [row['category'] for row in results]
+        finally:
+            conn.close()
+
+    def get_wrong_questions_details(self, user_id: int) -> list:
+        conn = self.connection()
+        try:
+            with conn.cursor() as cursor:
+                sql = """
+                SELECT category, question_content, student_answer, correct_answer, root_cause, improvement
+                FROM wrong_questions 
+                WHERE user_id = %s 
+                ORDER BY id DESC
+                """
+                cursor.execute(sql, (user_id,))
+                return cursor.fetchall()
+        finally:
+            conn.close()
+
+    def get_wrong_questions_by_topic(self, user_id: int, topic: str, limit: int = 3) -> list:
+        conn = self.connection()
+        try:
+            with conn.cursor() as cursor:
+                sql = """
+                SELECT question_content, student_answer, correct_answer 
+                FROM wrong_questions 
+                WHERE user_id = %s AND category LIKE %s
+                ORDER BY id DESC LIMIT %s
+                """
+                cursor.execute(sql, (user_id, f"%{topic}%", limit))
+                return cursor.fetchall()
+        finally:
+            conn.close()
+
+    # ================= Misconception Digests =================
+
+    def get_misconception_digests(self, user_id: int) -> list:
+        conn = self.connection()
+        try:
+            with conn.cursor() as cursor:
+                sql = "SELECT category, wrong_count, digest FROM misconception_digests WHERE user_id = %s"
+                cursor.execute(sql, (user_id,))
+                return cursor.fetchall()
+        finally:
+            conn.close()
+
+    def save_misconception_digests(self, rows: list):
+        if not rows:
+            return
+        conn = self.connection()
+        try:
+            with conn.cursor() as cursor:
+                sql = """
+                INSERT INTO misconception_digests (user_id, category, wrong_count, digest)
+                VALUES (%s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                    digest = IF(VALUES(wrong_count) > wrong_count, VALUES(digest), digest),
+                    wrong_count = GREATEST(wrong_count, VALUES(wrong_count))
+                """
+                cursor.executemany(sql, rows)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def get_wrong_question_counts(self, user_id: int) -> dict:
+        conn = self.connection()
+        try:
+            with conn.cursor() as cursor:
+                sql = """
+                SELECT category, SUM(n) AS n FROM (
+                    SELECT category, COUNT(*) AS n FROM wrong_questions WHERE user_id = %s GROUP BY category
+                    UNION ALL
+                    SELECT category, archived_count AS n FROM wrong_question_archive_summary WHERE user_id = %s
+                ) counts GROUP BY category
+                """
+                cursor.execute(sql, (user_id, user_id))
+                return {row['category']: int(row['n']) for row in cursor.fetchall()}
+        finally:
+            conn.close()
+
+    def get_recent_wrong_questions(self, user_id: int, category: str, limit: int) -> list:
+        conn = self.connection()
+        try:
+            with conn.cursor() as cursor:
+                sql = """
+                SELECT question_content, student_answer, correct_answer, root_cause, improvement, created_at
+                FROM wrong_questions
+                WHERE user_id = %s AND category = %s
+                ORDER BY id DESC LIMIT %s
+                """
+                cursor.execute(sql, (user_id, category, limit))
+                return cursor.fetchall()
+        finally:
+            conn.close()
+
+    # ================= Bulk Operations (bulk_import.py) =================
+
+    def get_user_ids_by_usernames(self, usernames: list) -> dict:
+        if not usernames:
+            return {}
+        conn = self.connection()
+        try:
+            with conn.cursor() as cursor:
+                placeholders = ", ".join(["%s"] * len(usernames))
+                cursor.execute(f"SELECT id, username FROM users WHERE username IN ({placeholders})", list(usernames))
+                return {row['username']: row['id'] for row in cursor.fetchall()}
+        finally:
+            conn.close()
+
+    def bulk_create_users(self, rows: list, update_existing: bool = False) -> int:
+        """rows: [(username, password_hash)], written in one transaction. Returns affected row count."""
+        if not rows:
+            return 0
+        conn = self.connection()
+        try:
+            with conn.cursor() as cursor:
+                if update_existing:
+                    sql = """
+                    INSERT INTO users (username, password_hash) VALUES (%s, %s)
+                    ON DUPLICATE KEY UPDATE password_hash = VALUES(password_hash)
+                    """
+                else:
+                    sql = "INSERT IGNORE INTO users (username, password_hash) VALUES (%s, %s)"
+                affected = cursor.executemany(sql, rows)
+            conn.commit()
+            return affected
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def bulk_set_topic_scores(self, rows: list) -> int:
+        """rows: [(user_id, topic, score)], upserted in one transaction. Returns affected row count."""
+        if not rows:
+            return 0
+        conn = self.connection()
+        try:
+            with conn.cursor() as cursor:
+                sql = """
+                INSERT INTO user_topic_scores (user_id, topic, score) 
+                VALUES (%s, %s, %s)
+                ON DUPLICATE KEY UPDATE score = VALUES(score)
+                """
+                affected = cursor.executemany(sql, rows)
+            conn.commit()
+            return affected
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    # ================= Wrong Question Export / Archive =================
+
+    def iter_wrong_questions(self, user_ids: list = None, batch_size: int = 1000):
+        """Stream wrong question rows (oldest first) through a server-side cursor, constant memory"""
+        conn = pymysql.connect(**{**self.config, 'cursorclass': pymysql.cursors.SSDictCursor})
+        try:
+            with conn.cursor() as cursor:
+                sql = """
+                SELECT wq.id, wq.user_id, u.username, wq.category, wq.question_content, wq.student_answer,
+                       wq.correct_answer, wq.root_cause, wq.improvement, wq.created_at
+                FROM wrong_questions wq JOIN users u ON u.id = wq.user_id
+                """
+                params = []
+                if user_ids:
+                    sql += f" WHERE wq.user_id IN ({', '.join(['%s'] * len(user_ids))})"
+                    params = list(user_ids)
+                cursor.execute(sql + " ORDER BY wq.id", params)
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield from rows
+        finally:
+            conn.close()
+
+    def get_wrong_questions_older_than(self, cutoff, after_id: int = 0, limit: int = 1000) -> list:
+        conn = self.connection()
+        try:
+            with conn.cursor() as cursor:
+                sql = """
+                SELECT wq.id, wq.user_id, u.username, wq.category, wq.question_content, wq.student_answer,
+                       wq.correct_answer, wq.root_cause, wq.improvement, wq.created_at
+                FROM wrong_questions wq LEFT JOIN users u ON u.id = wq.user_id
+                WHERE wq.created_at < %s AND wq.id > %s
+                ORDER BY wq.id LIMIT %s
+                """
+                cursor.execute(sql, (cutoff, after_id, limit))
+                return cursor.fetchall()
+        finally:
+            conn.close()
+
+    def count_wrong_questions_by_ids(self, ids: list) -> int:
+        if not ids:
+            return 0
+        conn = self.connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(f"SELECT COUNT(*) AS n FROM wrong_questions WHERE id IN ({', '.join(['%s'] * len(ids))})", list(ids))
+                return cursor.fetchone()['n']
+        finally:
+            conn.close()
+
+    def archive_wrong_questions(self, ids: list, summary_rows: list):
+        """Fold archived rows into the summary and delete them from the hot table in one transaction.
+
+        summary_rows: [(user_id, category, count)]
+        """
+        if not ids:
+            return
+        conn = self.connection()
+        try:
+            with conn.cursor() as cursor:
+                sql = """
+                INSERT INTO wrong_question_archive_summary (user_id, category, archived_count, last_archived_at)
+                VALUES (%s, %s, %s, NOW())
+                ON DUPLICATE KEY UPDATE archived_count = archived_count + VALUES(archived_count), last_archived_at = NOW()
+                """
+                cursor.executemany(sql, summary_rows)
+                cursor.execute(f"DELETE FROM wrong_questions WHERE id IN ({', '.join(['%s'] * len(ids))})", list(ids))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def get_archived_category_counts(self, user_id: int) -> dict:
+        conn = self.connection()
+        try:
+            with conn.cursor() as cursor:
+                sql = "SELECT category, archived_count FROM wrong_question_archive_summary WHERE user_id = %s"
+                cursor.execute(sql, (user_id,))
+                return {row['category']: row['archived_count'] for row in cursor.fetchall()}
+        finally:
+            conn.close()
+
+    # ================= Teacher Side / Admin Management =================
+
+    def get_all_users_overview(self) -> list:
+        conn = self.connection()
+        try:
+            with conn.cursor() as cursor:
+                # Combined query: get user ID, username, average score (default 500 if none), and total wrong question count
+                sql = """
+                SELECT 
+                    u.id, 
+                    u.username,
+                    IFNULL(CAST(AVG(uts.score) AS SIGNED), 500) as avg_score,
+                    CAST((SELECT COUNT(*) FROM wrong_questions wq WHERE wq.user_id = u.id)
+                      + (SELECT IFNULL(SUM(was.archived_count), 0) FROM wrong_question_archive_summary was WHERE was.user_id = u.id)
+                      AS SIGNED) as wrong_count
+                FROM users u
+                LEFT JOIN user_topic_scores uts ON u.id = uts.user_id
+                GROUP BY u.id, u.username
+                ORDER BY avg_score DESC
+                """
+                cursor.execute(sql)
+                return cursor.fetchall()
+        finally:
+            conn.close()
@@ -0,0 +1,430 @@
+# storage_sqlite.py
+# Embedded SQLite backend for single-classroom deployments, tests and benchmarks: no server, no network hop.
+#
+# - WAL journal + synchronous=NORMAL: readers never block the writer, commits don't fsync every time
+# - One connection per thread; statements are constant strings so sqlite3's per-connection statement
+#   cache keeps them prepared (id lists are passed as one JSON parameter instead of "IN (%s, %s, ...)")
+# - Multi-statement writes run in BEGIN IMMEDIATE so they take the write lock up front
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+from storage import Storage, hash_password, verify_password
+
+STATEMENT_CACHE_SIZE = 256
+BUSY_TIMEOUT = 30.0
+
+# created_at columns are declared TIMESTAMP and come back as datetime, like they do from MySQL
+sqlite3.register_converter("TIMESTAMP", lambda value: datetime.fromisoformat(value.decode()))
+
+SQLITE_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT NOT NULL UNIQUE,
+        password_hash TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS user_topic_scores (
+        user_id INTEGER NOT NULL,
+        topic TEXT NOT NULL,
+        score INTEGER NOT NULL DEFAULT 500,
+        PRIMARY KEY (user_id, topic)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS wrong_questions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        category TEXT,
+        question_content TEXT,
+        student_answer TEXT,
+        correct_answer TEXT,
+        root_cause TEXT,
+        improvement TEXT,
+        created_at TIMESTAMP NOT NULL DEFAULT (datetime('now', 'localtime'))
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_wq_user ON wrong_questions (user_id, id)",
+    "CREATE INDEX IF NOT EXISTS idx_wq_created_at ON wrong_questions (created_at)",
+    """
+    CREATE TABLE IF NOT EXISTS wrong_question_archive_summary (
+        user_id INTEGER NOT NULL,
+        category TEXT NOT NULL,
+        archived_count INTEGER NOT NULL DEFAULT 0,
+        last_archived_at TIMESTAMP NULL,
+        PRIMARY KEY (user_id, category)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS misconception_digests (
+        user_id INTEGER NOT NULL,
+        category TEXT NOT NULL,
+        wrong_count INTEGER NOT NULL DEFAULT 0,
+        digest TEXT NOT NULL,
+        updated_at TIMESTAMP NOT NULL DEFAULT (datetime('now', 'localtime')),
+        PRIMARY KEY (user_id, category)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS write_behind_batches (
+        batch_id TEXT PRIMARY KEY,
+        applied_at TIMESTAMP NOT NULL DEFAULT (datetime('now', 'localtime'))
+    ) WITHOUT ROWID
+    """,
+]
+
+
+def _dict_row(cursor, row):
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+def _timestamp(value) -> str:
+    return value.strftime("%Y-%m-%d %H:%M:%S") if isinstance(value, datetime) else value
+
+
+class SQLiteStorage(Storage):
+
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._schema_ready = False
+
+    # ================= Connections =================
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._open()
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+            if not self._schema_ready:
+                self._create_schema(conn)
+        return conn
+
+    def _open(self) -> sqlite3.Connection:
+        # isolation_level=None: autocommit, transactions are opened explicitly in _transaction()
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None,
+                               detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False,
+                               cached_statements=STATEMENT_CACHE_SIZE)
+        conn.row_factory = _dict_row
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        return conn
+
+    @contextmanager
+    def _transaction(self, conn: sqlite3.Connection = None):
+        conn = conn or self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def warm_up(self, size: int = None) -> int:
+        self.connection()
+        return len(self._connections)
+
+    def close(self):
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+    def ensure_schema(self):
+        self._create_schema(self.connection())
+
+    def _create_schema(self, conn: sqlite3.Connection):
+        with self._transaction(conn):
+            for ddl in SQLITE_SCHEMA:
+                conn.execute(ddl)
+        self._schema_ready = True
+
+    def reset_all_data(self):
+        with self._transaction() as conn:
+            for table in ("wrong_questions", "wrong_question_archive_summary", "user_topic_scores", "users", "write_behind_batches", "misconception_digests"):
+                conn.execute(f"DELETE FROM {table}")
+            conn.execute("DELETE FROM sqlite_sequence")
+
+    # ================= Users =================
+
+    def create_user(self, username, plain_password):
+        password_hash = hash_password(plain_password)   # bcrypt is slow, keep it outside the write lock
+        try:
+            with self._transaction() as conn:
+                if conn.execute("SELECT id FROM users WHERE username = ?", (username,)).fetchone():
+                    return False, "Username already exists, please login directly or choose another username"
+                conn.execute("INSERT INTO users (username, password_hash) VALUES (?, ?)", (username, password_hash))
+            return True, "Registration successful"
+        except Exception as e:
+            return False, f"Registration failed: {e}"
+
+    def verify_user_login(self, username, plain_password):
+        user = self.connection().execute("SELECT id, password_hash FROM users WHERE username = ?", (username,)).fetchone()
+        if user and verify_password(plain_password, user['password_hash']):
+            return user['id']
+        return None
+
+    def get_user_info(self, user_id: int) -> dict:
+        return self.connection().execute("SELECT id, username FROM users WHERE id = ?", (user_id,)).fetchone()
+
+    # ================= Knowledge Point Score System =================
+
+    def get_topic_score(self, user_id: int, topic: str) -> int:
+        result = self.connection().execute(
+            "SELECT score FROM user_topic_scores WHERE user_id = ? AND topic = ?", (user_id, topic)).fetchone()
+        return result['score'] if result else 500
+
+    def update_topic_score(self, user_id: int, topic: str, score_change: int) -> int:
+        # Single upsert instead of INSERT IGNORE + UPDATE + SELECT
+        sql = """
+        INSERT INTO user_topic_scores (user_id, topic, score) VALUES (?, ?, MAX(0, MIN(1000, 500 + ?)))
+        ON CONFLICT (user_id, topic) DO UPDATE SET score = MAX(0, MIN(1000, score + ?))
+        RETURNING score
+        """
+        rows = self.connection().execute(sql, (user_id, topic, score_change, score_change)).fetchall()
+        return rows[0]['score']
+
+    def get_all_topic_scores(self, user_id: int) -> dict:
+        rows = self.connection().execute("SELECT topic, score FROM user_topic_scores WHERE user_id = ?", (user_id,))
+        return {row['topic']: row['score'] for row in rows}
+
+    def get_average_score(self, user_id: int) -> int:
+        result = self.connection().execute(
+            "SELECT AVG(score) AS avg_score FROM user_topic_scores WHERE user_id = ?", (user_id,)).fetchone()
+        return int(result['avg_score']) if result and result['avg_score'] is not None else 500
+
+    def set_topic_score(self, user_id: int, topic: str, score: int):
+        sql = """
+        INSERT INTO user_topic_scores (user_id, topic, score) VALUES (?, ?, ?)
+        ON CONFLICT (user_id, topic) DO UPDATE SET score = excluded.score
+        """
+        self.connection().execute(sql, (user_id, topic, score))
+
+    # ================= Wrong Question System =================
+
+    def record_wrong_question_to_db(self, user_id: int, category: str, content: str, student_ans: str, correct_ans: str, root_cause: str, improvement: str):
+        sql = """
+        INSERT INTO wrong_questions
+        (user_id, category, question_content, student_answer, correct_answer, root_cause, improvement)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """
+        self.connection().execute(sql, (user_id, category, content, student_ans, correct_ans, root_cause, improvement))
+
+    def record_wrong_questions_batch(self, batch_id: str, rows: list) -> bool:
+        sql = """
+        INSERT INTO wrong_questions
+        (user_id, category, question_content, student_answer, correct_answer, root_cause, improvement, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """
+        with self._transaction() as conn:
+            if not conn.execute("INSERT OR IGNORE INTO write_behind_batches (batch_id) VALUES (?)", (batch_id,)).rowcount:
+                return False
+            conn.executemany(sql, [row[:7] + (_timestamp(row[7]),) for row in rows])
+            conn.execute("DELETE FROM write_behind_batches WHERE applied_at < datetime('now', 'localtime', '-7 days')")
+        return True
+
+    def record_quiz_results(self, user_id: int, score_changes: list, wrong_rows: list) -> list:
+        score_sql = """
+        INSERT INTO user_topic_scores (user_id, topic, score) VALUES (?, ?, MAX(0, MIN(1000, 500 + ?)))
+        ON CONFLICT (user_id, topic) DO UPDATE SET score = MAX(0, MIN(1000, score + ?))
+        RETURNING score
+        """
+        wrong_sql = """
+        INSERT INTO wrong_questions
+        (user_id, category, question_content, student_answer, correct_answer, root_cause, improvement)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """
+        scores = []
+        with self._transaction() as conn:
+            for topic, delta in score_changes:
+                scores.append(conn.execute(score_sql, (user_id, topic, delta, delta)).fetchall()[0]['score'])
+            conn.executemany(wrong_sql, wrong_rows)
+        return scores
+
+    def get_user_weaknesses(self, user_id: int) -> list:
+        sql = """
+        SELECT category FROM wrong_questions WHERE user_id = ?
+        UNION
+        SELECT category FROM wrong_question_archive_summary WHERE user_id = ?
+        """
+        return [row['category'] for row in self.connection().execute(sql, (user_id, user_id))]
+
+    def get_wrong_questions_details(self, user_id: int) -> list:
+        sql = """
+        SELECT category, question_content, student_answer, correct_answer, root_cause, improvement
+        FROM wrong_questions
+        WHERE user_id = ?
+        ORDER BY id DESC
+        """
+        return self.connection().execute(sql, (user_id,)).fetchall()
+
+    def get_wrong_questions_by_topic(self, user_id: int, topic: str, limit: int = 3) -> list:
+        sql = """
+        SELECT question_content, student_answer, correct_answer
+        FROM wrong_questions
+        WHERE user_id = ? AND category LIKE ?
+        ORDER BY id DESC LIMIT ?
+        """
+        return self.connection().execute(sql, (user_id, f"%{topic}%", limit)).fetchall()
+
+    # ================= Misconception Digests =================
+
+    def get_misconception_digests(self, user_id: int) -> list:
+        return self.connection().execute(
+            "SELECT category, wrong_count, digest FROM misconception_digests WHERE user_id = ?", (user_id,)).fetchall()
+
+    def save_misconception_digests(self, rows: list):
+        if not rows:
+            return
+        sql = """
+        INSERT INTO misconception_digests (user_id, category, wrong_count, digest) VALUES (?, ?, ?, ?)
+        ON CONFLICT (user_id, category) DO UPDATE SET
+            wrong_count = excluded.wrong_count, digest = excluded.digest, updated_at = datetime('now', 'localtime')
+        WHERE excluded.wrong_count > misconception_digests.wrong_count
+        """
+        with self._transaction() as conn:
+            conn.executemany(sql, rows)
+
+    def get_wrong_question_counts(self, user_id: int) -> dict:
+        sql = """
+        SELECT category, SUM(n) AS n FROM (
+            SELECT category, COUNT(*) AS n FROM wrong_questions WHERE user_id = ? GROUP BY category
+            UNION ALL
+            SELECT category, archived_count AS n FROM wrong_question_archive_summary WHERE user_id = ?
+        ) GROUP BY category
+        """
+        return {row['category']: row['n'] for row in self.connection().execute(sql, (user_id, user_id))}
+
+    def get_recent_wrong_questions(self, user_id: int, category: str, limit: int) -> list:
+        sql = """
+        SELECT question_content, student_answer, correct_answer, root_cause, improvement, created_at
+        FROM wrong_questions
+        WHERE user_id = ? AND category = ?
+        ORDER BY id DESC LIMIT ?
+        """
+        return self.connection().execute(sql, (user_id, category, limit)).fetchall()
+
+    # ================= Bulk Operations (bulk_import.py) =================
+
+    def get_user_ids_by_usernames(self, usernames: list) -> dict:
+        if not usernames:
+            return {}
+        sql = "SELECT id, username FROM users WHERE username IN (SELECT value FROM json_each(?))"
+        rows = self.connection().execute(sql, (json.dumps(list(usernames)),))
+        return {row['username']: row['id'] for row in rows}
+
+    def bulk_create_users(self, rows: list, update_existing: bool = False) -> int:
+        if not rows:
+            return 0
+        if update_existing:
+            sql = """
+            INSERT INTO users (username, password_hash) VALUES (?, ?)
+            ON CONFLICT (username) DO UPDATE SET password_hash = excluded.password_hash
+            """
+        else:
+            sql = "INSERT OR IGNORE INTO users (username, password_hash) VALUES (?, ?)"
+        with self._transaction() as conn:
+            return conn.executemany(sql, rows).rowcount
+
+    def bulk_set_topic_scores(self, rows: list) -> int:
+        if not rows:
+            return 0
+        sql = """
+        INSERT INTO user_topic_scores (user_id, topic, score) VALUES (?, ?, ?)
+        ON CONFLICT (user_id, topic) DO UPDATE SET score = excluded.score
+        """
+        with self._transaction() as conn:
+            return conn.executemany(sql, rows).rowcount
+
+    # ================= Wrong Question Export / Archive =================
+
+    def iter_wrong_questions(self, user_ids: list = None, batch_size: int = 1000):
+        """Oldest first; the cursor steps through the table so memory stays constant.
+        Runs on a connection of its own: a streaming response may advance the generator from different
+        threads, and the per-thread connection of whichever thread that is may be in use meanwhile."""
+        sql = """
+        SELECT wq.id, wq.user_id, u.username, wq.category, wq.question_content, wq.student_answer,
+               wq.correct_answer, wq.root_cause, wq.improvement, wq.created_at
+        FROM wrong_questions wq JOIN users u ON u.id = wq.user_id
+        """
+        if user_ids:
+            sql += " WHERE wq.user_id IN (SELECT value FROM json_each(?))"
+            params = (json.dumps(list(user_ids)),)
+        else:
+            params = ()
+        self.connection()   # Creates the schema on first use
+        conn = self._open()
+        try:
+            cursor = conn.execute(sql + " ORDER BY wq.id", params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            conn.close()
+
+    def get_wrong_questions_older_than(self, cutoff, after_id: int = 0, limit: int = 1000) -> list:
+        sql = """
+        SELECT wq.id, wq.user_id, u.username, wq.category, wq.question_content, wq.student_answer,
+               wq.correct_answer, wq.root_cause, wq.improvement, wq.created_at
+        FROM wrong_questions wq LEFT JOIN users u ON u.id = wq.user_id
+        WHERE wq.created_at < ? AND wq.id > ?
+        ORDER BY wq.id LIMIT ?
+        """
+        return self.connection().execute(sql, (_timestamp(cutoff), after_id, limit)).fetchall()
+
+    def count_wrong_questions_by_ids(self, ids: list) -> int:
+        if not ids:
+            return 0
+        sql = "SELECT COUNT(*) AS n FROM wrong_questions WHERE id IN (SELECT value FROM json_each(?))"
+        return self.connection().execute(sql, (json.dumps(list(ids)),)).fetchone()['n']
+
+    def archive_wrong_questions(self, ids: list, summary_rows: list):
+        if not ids:
+            return
+        sql = """
+        INSERT INTO wrong_question_archive_summary (user_id, category, archived_count, last_archived_at)
+        VALUES (?, ?, ?, datetime('now', 'localtime'))
+        ON CONFLICT (user_id, category) DO UPDATE SET
+            archived_count = archived_count + excluded.archived_count, last_archived_at = excluded.last_archived_at
+        """
+        with self._transaction() as conn:
+            conn.executemany(sql, summary_rows)
+            conn.execute("DELETE FROM wrong_questions WHERE id IN (SELECT value FROM json_each(?))", (json.dumps(list(ids)),))
+
+    def get_archived_category_counts(self, user_id: int) -> dict:
+        rows = self.connection().execute(
+            "SELECT category, archived_count FROM wrong_question_archive_summary WHERE user_id = ?", (user_id,))
+        return {row['category']: row['archived_count'] for row in rows}
+
+    # ================= Teacher Side / Admin Management =================
+
+    def get_all_users_overview(self) -> list:
+        # ROUND before the cast: MySQL's CAST(... AS SIGNED) rounds, SQLite's CAST truncates
+        sql = """
+        SELECT
+            u.id,
+            u.username,
+            IFNULL(CAST(ROUND(AVG(uts.score)) AS INTEGER), 500) AS avg_score,
+            CAST((SELECT COUNT(*) FROM wrong_questions wq WHERE wq.user_id = u.id)
+              + (SELECT IFNULL(SUM(was.archived_count), 0) FROM wrong_question_archive_summary was WHERE was.user_id = u.id)
+              AS INTEGER) AS wrong_count
+        FROM users u
+        LEFT JOIN user_topic_scores uts ON u.id = uts.user_id
+        GROUP BY u.id, u.username
+        ORDER BY avg_score DESC
+        """
+        return self.connection().execute(sql).fetchall()
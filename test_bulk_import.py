@@ -0,0 +1,99 @@
+# test_bulk_import.py
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from unittest.mock import patch
+
+import bulk_import
+import database
+from storage_sqlite import SQLiteStorage
+
+
+class TestBulkImport(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.storage = SQLiteStorage(os.path.join(self.directory, "tutor.db"))
+        self.previous = database.set_storage(self.storage)
+
+    def tearDown(self):
+        database.set_storage(self.previous)
+        self.storage.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def write(self, name, text):
+        path = os.path.join(self.directory, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        return path
+
+    def run_quietly(self, fn, *args, **kwargs):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            stats = fn(*args, **kwargs)
+        return stats, output.getvalue()
+
+    def test_parsing_csv_and_jsonl(self):
+        path = self.write("users.csv", "username,password\n alice ,pw1\nbob,pw2\n")
+        self.assertEqual(list(bulk_import.iter_records(path)),
+                         [(2, {"username": "alice", "password": "pw1"}), (3, {"username": "bob", "password": "pw2"})])
+        self.assertEqual(bulk_import.parse_score({"username": "alice", "topic": "Lists", "score": "700"}),
+                         ("alice", "Lists", 700))
+        for record in ({"username": "alice", "topic": "Lists", "score": "high"},
+                       {"username": "alice", "topic": "Lists", "score": 1001},
+                       {"username": "", "topic": "Lists", "score": 1}):
+            with self.assertRaises(bulk_import.RowError):
+                bulk_import.parse_score(record)
+        with self.assertRaises(bulk_import.RowError):
+            bulk_import.parse_user({"username": "alice", "password": ""})
+
+    def test_bad_rows_are_reported_per_line(self):
+        self.storage.bulk_create_users([("alice", "h")])
+        path = self.write("scores.jsonl", "\n".join([
+            '{"username": "alice", "topic": "Lists", "score": 700}',
+            '[1, 2]',
+            '"just a string"',
+            '{not json',
+            '{"username": "ghost", "topic": "Lists", "score": 100}',
+            '{"username": "alice", "topic": "Sets", "score": -5}',
+        ]) + "\n")
+        stats, output = self.run_quietly(bulk_import.import_scores, path, chunk_size=2)
+
+        self.assertEqual(stats, {"read": 6, "invalid": 4, "written": 1, "unknown_user": 1})
+        self.assertEqual(self.storage.get_all_topic_scores(1), {"Lists": 700})
+        self.assertIn("line 2: expected a JSON object, got list", output)
+        self.assertIn("line 3: expected a JSON object, got str", output)
+        # Every warning is on its own line, a following \r progress update cannot overwrite it
+        for line in output.split("\n"):
+            if "⚠️" in line:
+                self.assertTrue(line.startswith("  ⚠️") and "\r" not in line, repr(line))
+        self.assertTrue(output.endswith("\n"))
+
+    def test_reimport_is_idempotent(self):
+        users = self.write("users.csv", "username,password\nalice,pw1\nbob,pw2\nalice,pw3\n")
+        stats, _ = self.run_quietly(bulk_import.import_users, users, workers=1)
+        self.assertEqual((stats["created"], stats["skipped"]), (2, 0))
+        stats, _ = self.run_quietly(bulk_import.import_users, users, workers=1)
+        self.assertEqual((stats["created"], stats["skipped"]), (0, 2))
+        self.assertIsNotNone(database.verify_user_login("alice", "pw3"))
+
+        scores = self.write("scores.csv", "username,topic,score\nalice,Lists,700\nbob,Lists,300\n")
+        for _ in range(2):
+            stats, _ = self.run_quietly(bulk_import.import_scores, scores)
+            self.assertEqual(stats["written"], 2)
+        ids = self.storage.get_user_ids_by_usernames(["alice", "bob"])
+        self.assertEqual([self.storage.get_topic_score(ids[name], "Lists") for name in ("alice", "bob")], [700, 300])
+
+    def test_dry_run_writes_nothing_and_starts_no_processes(self):
+        users = self.write("users.jsonl", '{"username": "alice", "password": "pw"}\n')
+        with patch.object(bulk_import, "ProcessPoolExecutor", side_effect=AssertionError("pool started")):
+            stats, _ = self.run_quietly(bulk_import.import_users, users, dry_run=True)
+        self.assertEqual(stats["created"], 1)
+        self.assertEqual(self.storage.get_user_ids_by_usernames(["alice"]), {})
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=0)
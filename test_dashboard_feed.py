@@ -0,0 +1,130 @@
+# test_dashboard_feed.py
+import asyncio
+import json
+import threading
+import unittest
+
+from dashboard_feed import DashboardHub, dashboard_events
+
+
+class TestDashboardHub(unittest.TestCase):
+
+    def setUp(self):
+        self.overview_calls = 0
+        self.average_calls = []
+        self.hub = DashboardHub(
+            load_overview=self.load_overview,
+            load_average=self.load_average,
+            load_user=lambda uid: {"id": uid, "username": f"user{uid}"},
+            flush_interval=3600,  # Flushed by hand in the tests
+        )
+
+    def load_overview(self):
+        self.overview_calls += 1
+        return [
+            {"id": 1, "username": "alice", "avg_score": 600, "wrong_count": 2},
+            {"id": 2, "username": "bob", "avg_score": 400, "wrong_count": 5},
+        ]
+
+    def load_average(self, user_id):
+        self.average_calls.append(user_id)
+        return 450
+
+    def test_publish_without_watchers_is_free(self):
+        self.hub.publish_answer(1, "Optics", 520, True)
+        self.hub.flush()
+        self.assertEqual(self.overview_calls, 0)
+        self.assertEqual(self.average_calls, [])
+        self.assertIsNone(self.hub.snapshot())
+
+    def test_room_of_teachers_shares_snapshot_and_coalesced_deltas(self):
+        async def scenario():
+            loop = asyncio.get_running_loop()
+            subs = [self.hub.subscribe(loop) for _ in range(5)]
+            for i in range(20):
+                self.hub.publish_answer(2, "Optics", 400 - i, False)
+            self.hub.publish_answer(3, "Optics", 510, True)
+            self.hub.flush()
+            await asyncio.sleep(0)
+            batches = [sub.queue.get_nowait() for sub in subs]
+            for sub in subs:
+                self.hub.unsubscribe(sub)
+            return subs, batches
+
+        subs, batches = asyncio.run(scenario())
+        self.assertEqual(self.overview_calls, 1)
+        self.assertEqual(subs[0].snapshot[0]["username"], "alice")
+        self.assertEqual(sorted(self.average_calls), [2, 3])
+
+        batch = {d["user_id"]: d for d in batches[0]}
+        self.assertEqual(batch[2]["answers"], 20)
+        self.assertEqual(batch[2]["wrong_count"], 25)
+        self.assertEqual(batch[2]["topic_scores"], {"Optics": 381})
+        self.assertEqual(batch[3]["username"], "user3")
+        self.assertIsNone(self.hub.snapshot())
+
+    def test_overview_query_runs_outside_the_lock(self):
+        loading, release = threading.Event(), threading.Event()
+        load = self.hub._load_overview
+
+        def slow_overview():
+            loading.set()
+            release.wait(5)
+            return load()
+
+        self.hub._load_overview = slow_overview
+        loop = asyncio.new_event_loop()
+        subscriber = threading.Thread(target=self.hub.subscribe, args=(loop,))
+        subscriber.start()
+        self.assertTrue(loading.wait(5))
+        reader = threading.Thread(target=lambda: (self.hub.publish_answer(1, "Optics", 520, True), self.hub.snapshot()))
+        reader.start()
+        reader.join(1)
+        self.assertFalse(reader.is_alive())
+        release.set()
+        subscriber.join(5)
+        self.assertEqual(len(self.hub.snapshot()), 2)
+        loop.close()
+
+    def test_closed_loop_subscriber_is_dropped(self):
+        async def scenario():
+            return self.hub.subscribe(asyncio.get_running_loop())
+
+        gone = asyncio.run(scenario())      # The loop is closed afterwards, the subscription never unsubscribes
+        live_loop = asyncio.new_event_loop()
+        live = self.hub.subscribe(live_loop)
+        self.hub.publish_answer(1, "Optics", 520, True)
+        self.hub.flush()
+        live_loop.run_until_complete(asyncio.sleep(0))
+        self.assertEqual(live.queue.get_nowait()[0]["user_id"], 1)
+        self.assertNotIn(gone, self.hub._subscribers)
+
+        self.hub.publish_answer(1, "Optics", 530, True)
+        self.hub.flush()
+        self.hub.unsubscribe(live)
+        live_loop.close()
+        self.assertIsNone(self.hub.snapshot())
+
+    def test_sse_stream_starts_with_snapshot(self):
+        async def scenario():
+            disconnected = asyncio.Event()
+            stream = dashboard_events(self.hub, lambda: asyncio.sleep(0, disconnected.is_set()), keepalive=0.01)
+            first = await stream.__anext__()
+            self.hub.publish_answer(1, "Optics", 610, True)
+            self.hub.flush()
+            frame = await stream.__anext__()
+            while frame.startswith(":"):
+                frame = await stream.__anext__()
+            disconnected.set()
+            await stream.aclose()
+            return first, frame
+
+        first, frame = asyncio.run(scenario())
+        self.assertTrue(first.startswith("event: snapshot"))
+        self.assertTrue(frame.startswith("event: delta"))
+        delta = json.loads(frame.split("data: ", 1)[1])
+        self.assertEqual(delta[0]["topic_scores"], {"Optics": 610})
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=0)
@@ -0,0 +1,148 @@
+# test_knowledge_index.py
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from fake_upstream import FakeExa
+from knowledge_index import MAX_SEGMENTS, KnowledgeIndex, format_context, tokenize
+
+NOTES = [
+    {"title": "Newton's laws", "text": "Newton's second law: force equals mass times acceleration. Inertia and net force."},
+    {"title": "Kinematics", "text": "Velocity, displacement and acceleration for uniformly accelerated motion."},
+    {"title": "Optics", "text": "Refraction, reflection and lenses. Snell's law relates angles of incidence."},
+    {"title": "Python decorators", "text": "A decorator wraps a function. functools.wraps keeps the metadata."},
+]
+
+
+class TestKnowledgeIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_bm25_ranking_and_reload(self):
+        index = KnowledgeIndex.open(self.directory)
+        self.assertEqual(index.add_documents(NOTES), 4)
+        self.assertEqual(index.add_documents(NOTES[:1]), 0)  # Duplicates are skipped
+
+        hits = index.search("mass acceleration force", k=2)
+        self.assertEqual(hits[0].title, "Newton's laws")
+        self.assertEqual(hits[0].coverage, 1.0)
+
+        reopened = KnowledgeIndex.open(self.directory)
+        self.assertEqual(len(reopened), 4)
+        self.assertEqual(reopened.search("snell refraction")[0].title, "Optics")
+        self.assertTrue(format_context(hits).startswith("Source: Newton's laws\nContent Summary: "))
+
+    def test_incremental_segments_and_compaction(self):
+        index = KnowledgeIndex.open(self.directory)
+        for doc in NOTES:
+            index.add_documents([doc])
+        self.assertEqual(len(index._segments), 4)
+        before = [(h.title, round(h.score, 6)) for h in index.search("acceleration", k=3)]
+
+        index.compact()
+        self.assertEqual(len(index._segments), 1)
+        after = [(h.title, round(h.score, 6)) for h in index.search("acceleration", k=3)]
+        # Corpus statistics are global, so scores do not depend on how documents are split into segments
+        self.assertEqual(before, after)
+
+        reopened = KnowledgeIndex.open(self.directory)
+        self.assertEqual(len(reopened), 4)
+
+    def test_background_capture_compacts_and_unlinks_replaced_segments(self):
+        index = KnowledgeIndex.open(self.directory)
+        for i in range(MAX_SEGMENTS + 1):
+            index.add_documents([{"title": f"Note {i}", "text": f"momentum number{i}"}])
+        index.capture([{"title": "Captured", "text": "entropy of a heat engine"}])
+        self.assertTrue(index.wait_captured(5))
+
+        self.assertEqual(len(index._segments), 1)
+        self.assertEqual(len(index), MAX_SEGMENTS + 2)
+        segment_files = [f for f in os.listdir(self.directory) if f.startswith("seg-")]
+        self.assertEqual(sorted({f.split(".")[0] for f in segment_files}), [index._segments[0].name])
+        self.assertEqual(index.search("entropy")[0].title, "Captured")
+
+    def test_second_process_opens_read_only(self):
+        writer = KnowledgeIndex.open(self.directory)
+        writer.add_documents(NOTES[:2])
+        stray = os.path.join(self.directory, "seg-999999.lex")
+        open(stray, "w").close()   # Stands in for a segment another writer is still creating
+
+        reader = KnowledgeIndex.open(self.directory)
+        self.assertTrue(reader.read_only)
+        self.assertTrue(os.path.exists(stray))
+        self.assertEqual(len(reader), 2)
+        with self.assertRaises(RuntimeError):
+            reader.add_documents(NOTES[2:])
+        reader.capture(NOTES[2:])   # Silently skipped
+
+        writer.close()
+        self.assertFalse(KnowledgeIndex.open(self.directory).read_only)
+
+    def test_read_only_instance_follows_the_writer(self):
+        writer = KnowledgeIndex.open(self.directory)
+        writer.add_documents(NOTES[:1])
+        reader = KnowledgeIndex.open(self.directory)
+        self.assertTrue(reader.read_only)
+        self.assertEqual(len(reader), 1)
+
+        writer.add_documents(NOTES[1:])
+        self.assertEqual(len(reader), len(NOTES))
+        self.assertEqual(reader.search(NOTES[-1]["text"], k=1), writer.search(NOTES[-1]["text"], k=1))
+
+        # Compaction removes the segment files the reader had open, it switches to the merged one
+        before = [seg.name for seg in writer._segments]
+        writer.compact()
+        self.assertNotEqual([seg.name for seg in writer._segments], before)
+        self.assertEqual(reader.search(NOTES[0]["text"], k=1), writer.search(NOTES[0]["text"], k=1))
+        self.assertEqual([seg.name for seg in reader._segments], [seg.name for seg in writer._segments])
+        writer.close()
+
+    def test_query_latency(self):
+        index = KnowledgeIndex.open(self.directory)
+        words = ["force", "energy", "momentum", "wave", "field", "charge", "lens", "orbit", "heat", "pressure"]
+        docs = [{"title": f"Note {i}", "text": " ".join(words[(i * j) % 10] for j in range(60)) + f" unique{i}"}
+                for i in range(3000)]
+        index.add_documents(docs)
+
+        start = time.perf_counter()
+        reopened = KnowledgeIndex.open(self.directory)
+        load_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        for _ in range(20):
+            reopened.search("momentum unique42", k=2)
+        query_ms = (time.perf_counter() - start) * 1000 / 20
+        self.assertEqual(reopened.search("unique42", k=1)[0].title, "Note 42")
+        self.assertLess(load_ms, 200)
+        self.assertLess(query_ms, 10)
+
+    def test_cjk_bigrams(self):
+        self.assertEqual(tokenize("牛顿定律 Force"), ["牛顿", "顿定", "定律", "force"])
+
+    def test_local_first_retrieval(self):
+        from llm_service import AdaptiveLearningSystem
+
+        index = KnowledgeIndex.open(self.directory)
+        exa = FakeExa(results=[("Exa Thermo", "Entropy and the second law of thermodynamics."),
+                               ("Exa Heat", "Heat engines and thermodynamics efficiency.")])
+        system = AdaptiveLearningSystem(api_key="x", base_url="http://127.0.0.1:9/v1", exa_client=exa, knowledge_index=index)
+
+        # Empty index: Exa is used and its results are captured
+        self.assertIn("Exa Thermo", system.retrieve_background_knowledge("Physics", "thermodynamics"))
+        self.assertEqual(len(exa.queries), 1)
+        self.assertTrue(index.wait_captured(5))
+        self.assertEqual(len(index), 2)
+
+        # Second lookup is served locally
+        context = system.retrieve_background_knowledge("Physics", "thermodynamics")
+        self.assertIn("Content Summary:", context)
+        self.assertEqual(len(exa.queries), 1)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=0)
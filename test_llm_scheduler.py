@@ -0,0 +1,113 @@
+# test_llm_scheduler.py
+import threading
+import time
+import unittest
+
+from llm_scheduler import (
+    LLMScheduler, LLMOverloadedError, PRIORITY_INTERACTIVE, PRIORITY_GENERATION, PRIORITY_PREFETCH
+)
+from resilience import CallPolicy, ResilientCaller
+
+
+class TestLLMScheduler(unittest.TestCase):
+
+    def run_blocked(self, scheduler, jobs):
+        """Hold the single slot, queue `jobs` (priority, user, label) in order, then release and record run order"""
+        order = []
+        gate = threading.Event()
+        holder = threading.Thread(target=scheduler.run, args=(PRIORITY_GENERATION, "holder", gate.wait))
+        holder.start()
+        time.sleep(0.05)
+
+        threads = []
+        for priority, user, label in jobs:
+            t = threading.Thread(target=scheduler.run, args=(priority, user, lambda label=label: order.append(label)))
+            t.start()
+            threads.append(t)
+            time.sleep(0.02)  # Deterministic enqueue order
+
+        gate.set()
+        for t in [holder] + threads:
+            t.join(5)
+        return order
+
+    def test_priority_classes(self):
+        scheduler = LLMScheduler(max_concurrency=1)
+        order = self.run_blocked(scheduler, [
+            (PRIORITY_PREFETCH, 1, "prefetch"),
+            (PRIORITY_GENERATION, 1, "question"),
+            (PRIORITY_INTERACTIVE, 2, "feedback"),
+        ])
+        self.assertEqual(order, ["feedback", "question", "prefetch"])
+
+    def test_users_take_turns_within_a_class(self):
+        scheduler = LLMScheduler(max_concurrency=1)
+        order = self.run_blocked(scheduler, [
+            (PRIORITY_GENERATION, "burst", "b1"),
+            (PRIORITY_GENERATION, "burst", "b2"),
+            (PRIORITY_GENERATION, "burst", "b3"),
+            (PRIORITY_GENERATION, "other", "o1"),
+        ])
+        self.assertEqual(order, ["b1", "o1", "b2", "b3"])
+
+    def test_shed_after_deadline(self):
+        scheduler = LLMScheduler(max_concurrency=1, max_wait={PRIORITY_PREFETCH: 0.1})
+        gate = threading.Event()
+        holder = threading.Thread(target=scheduler.run, args=(PRIORITY_GENERATION, 1, gate.wait))
+        holder.start()
+        time.sleep(0.05)
+        with self.assertRaises(LLMOverloadedError):
+            scheduler.run(PRIORITY_PREFETCH, 2, lambda: None)
+        gate.set()
+        holder.join(5)
+
+        snapshot = scheduler.snapshot()
+        self.assertEqual(snapshot["classes"]["prefetch"]["shed"], 1)
+        self.assertEqual(snapshot["classes"]["prefetch"]["queued"], 0)
+        self.assertEqual(snapshot["running"], 0)
+
+    def test_queue_depth_limit(self):
+        scheduler = LLMScheduler(max_concurrency=1, max_queue=0)
+        gate = threading.Event()
+        holder = threading.Thread(target=scheduler.run, args=(PRIORITY_GENERATION, 1, gate.wait))
+        holder.start()
+        time.sleep(0.05)
+        with self.assertRaises(LLMOverloadedError):
+            scheduler.run(PRIORITY_INTERACTIVE, 2, lambda: None)
+        gate.set()
+        holder.join(5)
+
+    def test_hedges_count_against_the_concurrency_cap(self):
+        scheduler = LLMScheduler(max_concurrency=1)
+        caller = ResilientCaller({"question": CallPolicy(timeout=2.0, hedge=True, min_hedge_delay=0.05)})
+        for _ in range(50):
+            caller.latency["question"].record(0.01)
+        calls = []
+
+        def slow(timeout):
+            calls.append(timeout)
+            time.sleep(0.2)
+            return "ok"
+
+        hedge_slot = lambda: scheduler.release if scheduler.try_acquire(PRIORITY_INTERACTIVE, 1) else None
+        scheduler.acquire(PRIORITY_INTERACTIVE, 1)
+        try:
+            self.assertEqual(caller.call("question", slow, hedge_slot=hedge_slot), "ok")
+        finally:
+            scheduler.release()
+        # The only slot is taken by the first request, so no duplicate is fired
+        self.assertEqual((len(calls), caller.stats["question"]["hedged"]), (1, 0))
+
+        scheduler.max_concurrency = 2
+        scheduler.acquire(PRIORITY_INTERACTIVE, 1)
+        try:
+            self.assertEqual(caller.call("question", slow, hedge_slot=hedge_slot), "ok")
+        finally:
+            scheduler.release()
+        self.assertEqual(caller.stats["question"]["hedged"], 1)
+        time.sleep(0.3)
+        self.assertEqual(scheduler.snapshot()["running"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=0)
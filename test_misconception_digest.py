@@ -0,0 +1,150 @@
+# test_misconception_digest.py
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+import database
+from fake_upstream import FakeExa, FakeOpenAIServer
+from misconception_digest import DigestCache, fold_wrong_answer, new_digest, render_digest
+from storage_sqlite import SQLiteStorage
+
+QUESTION = {"stage": "Basic Introduction", "category": "Lists", "difficulty": 2,
+            "content": "Which method appends to a list?",
+            "options": {"A": "append", "B": "push", "C": "add", "D": "put"}, "correct_answer": "A"}
+
+
+class TestFold(unittest.TestCase):
+
+    def test_similar_root_causes_merge_and_size_stays_bounded(self):
+        digest = new_digest("Lists")
+        for i in range(200):
+            fold_wrong_answer(digest, f"Question {i} " + "x" * 500, "B", "A",
+                              "Confuses append with extend when adding lists", "Compare append and extend")
+            fold_wrong_answer(digest, f"Other {i}", "C", "A", f"Unrelated slip number {i} about slicing bounds {i}", "")
+        fold_wrong_answer(digest, "Last", "D", "A", "System judgment, please try again later", "")
+
+        self.assertEqual(digest["wrong_count"], 401)
+        self.assertEqual(digest["misconceptions"][0]["count"], 200)
+        self.assertLessEqual(len(digest["misconceptions"]), 4)
+        self.assertEqual(digest["examples"][0]["q"], "Last")
+        self.assertLess(len(render_digest(digest)), 800)
+        self.assertLess(len(json.dumps(digest)), 2000)
+
+
+class TestDigestStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "tutor.db")
+        self.storage = SQLiteStorage(self.path)
+        self.previous = database.set_storage(self.storage)
+        self.storage.bulk_create_users([("alice", "h")])
+
+    def tearDown(self):
+        database.set_storage(self.previous)
+        self.storage.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_incremental_updates_are_stored_and_reloaded(self):
+        for _ in range(3):
+            database.record_wrong_question_to_db(1, "Lists and Tuples", "Q", "B", "A", "Mixes up append and extend", "fix")
+        database.record_wrong_question_to_db(1, "Recursion", "Q", "B", "A", "Forgets the base case", "fix")
+
+        self.assertEqual([d["category"] for d in database.get_topic_digests(1, "lists")], ["Lists and Tuples"])
+        self.assertEqual([d["wrong_count"] for d in database.get_top_digests(1)], [3, 1])
+
+        # A fresh process sees the stored digests without touching raw history
+        reopened = SQLiteStorage(self.path)
+        database.set_storage(reopened)
+        self.assertEqual(database.get_top_digests(1)[0]["misconceptions"][0]["count"], 3)
+        database.set_storage(self.storage)
+        reopened.close()
+
+    def test_failed_insert_leaves_digest_unchanged(self):
+        database.record_wrong_question_to_db(1, "Loops", "Q1", "B", "A", "Off by one", "fix")
+        with patch.object(self.storage, "record_wrong_question_to_db", side_effect=ConnectionError("database down")):
+            with self.assertRaises(ConnectionError):
+                database.record_wrong_question_to_db(1, "Loops", "Q2", "B", "A", "Off by one", "fix")
+        self.assertEqual(database.get_top_digests(1)[0]["wrong_count"], 1)
+
+        # A cold cache folds a committed answer exactly once
+        database.get_digest_cache().clear()
+        database.record_wrong_question_to_db(1, "Loops", "Q3", "B", "A", "Off by one", "fix")
+        self.assertEqual(database.get_top_digests(1)[0]["wrong_count"], 2)
+
+    def test_stale_worker_does_not_overwrite_newer_digest(self):
+        database.record_wrong_question_to_db(1, "Loops", "Q1", "B", "A", "Off by one", "fix")
+        other_worker = DigestCache(lambda: self.storage, max_age=0)
+        self.assertEqual(other_worker.top(1)[0]["wrong_count"], 1)
+
+        database.record_wrong_question_to_db(1, "Loops", "Q2", "B", "A", "Off by one", "fix")
+        database.record_wrong_question_to_db(1, "Loops", "Q3", "B", "A", "Off by one", "fix")
+        stale = json.loads(self.storage.get_misconception_digests(1)[0]["digest"])
+        stale.update(wrong_count=2, examples=[])
+        self.storage.save_misconception_digests([(1, "Loops", 2, json.dumps(stale))])
+        stored = json.loads(self.storage.get_misconception_digests(1)[0]["digest"])
+        self.assertEqual((stored["wrong_count"], stored["examples"][0]["q"]), (3, "Q3"))
+
+        # Past max_age the other worker reloads instead of serving its stale copy
+        self.assertEqual(other_worker.top(1)[0]["wrong_count"], 3)
+
+    def test_slow_load_does_not_block_other_users(self):
+        self.storage.bulk_create_users([("bob", "h")])
+        database.record_wrong_question_to_db(2, "Sets", "Q", "B", "A", "Thinks sets keep order", "fix")
+        cache = DigestCache(lambda: self.storage)
+        loading, release = threading.Event(), threading.Event()
+        read_digests = self.storage.get_misconception_digests
+
+        def slow_digests(user_id):
+            if user_id == 1:
+                loading.set()
+                release.wait(5)
+            return read_digests(user_id)
+
+        with patch.object(self.storage, "get_misconception_digests", side_effect=slow_digests):
+            slow = threading.Thread(target=cache.top, args=(1,))
+            slow.start()
+            self.assertTrue(loading.wait(5))
+            self.assertEqual(cache.top(2)[0]["category"], "Sets")
+            release.set()
+            slow.join(5)
+
+    def test_existing_history_is_backfilled(self):
+        for i in range(30):
+            self.storage.record_wrong_question_to_db(1, "Loops", f"Q{i}", "B", "A", "Off by one in range()", "fix")
+        self.storage.archive_wrong_questions([1, 2], [(1, "Loops", 2), (1, "Sets", 5)])
+
+        digests = {d["category"]: d for d in database.get_top_digests(1)}
+        self.assertEqual(digests["Loops"]["wrong_count"], 30)
+        self.assertEqual(digests["Loops"]["examples"][0]["q"], "Q29")
+        self.assertEqual(digests["Sets"]["wrong_count"], 5)
+        self.assertEqual(len(self.storage.get_misconception_digests(1)), 2)
+
+    def test_prompt_size_is_bounded(self):
+        from llm_service import AdaptiveLearningSystem
+
+        def prompts():
+            with FakeOpenAIServer(responder=lambda body: json.dumps(QUESTION)) as server:
+                system = AdaptiveLearningSystem(api_key="x", base_url=server.base_url, exa_client=FakeExa())
+                system.generate_question(1, "Python Programming", "Lists", initial_score=200)
+                system.generate_question(1, "Python Programming", initial_score=200)
+            return [body["messages"][0]["content"] for body in server.received]
+
+        for i in range(5):
+            database.record_wrong_question_to_db(1, "Lists", f"Question {i} " + "y" * 300, "B", "A", f"Cause {i}", "fix")
+        short_history = prompts()
+        self.assertIn("Cause 4 (x1)", short_history[0])
+        for i in range(200):
+            database.record_wrong_question_to_db(1, f"Lists {i % 20}", f"Question {i} " + "y" * 300, "B", "A",
+                                                 f"Different cause {i}", "fix")
+        long_history = prompts()
+        for before, after in zip(short_history, long_history):
+            self.assertLess(len(after), len(before) + 1500)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=0)
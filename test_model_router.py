@@ -0,0 +1,129 @@
+# test_model_router.py
+import json
+import time
+import unittest
+from unittest.mock import patch
+
+from fake_upstream import FakeExa, FakeOpenAIServer, FaultPlan
+from model_router import EndpointConfig, ModelRouter
+from resilience import CircuitOpenError
+
+FEEDBACK = {"score_change": 15, "root_cause": "Knows append", "improvement": "Keep going"}
+
+
+def complete(endpoint, timeout):
+    response = endpoint.client.chat.completions.create(
+        model=endpoint.model, messages=[{"role": "user", "content": "hi"}], timeout=timeout)
+    return response.choices[0].message.content
+
+
+class TestModelRouter(unittest.TestCase):
+
+    def setUp(self):
+        self.servers = []
+
+    def tearDown(self):
+        for server in self.servers:
+            server.__exit__(None, None, None)
+
+    def server(self, name, **plan):
+        server = FakeOpenAIServer(responder=lambda body: json.dumps({"from": name}), plan=FaultPlan(**plan)).__enter__()
+        self.servers.append(server)
+        return EndpointConfig(name, server.base_url, "x", f"{name}-model"), server
+
+    def test_fastest_endpoint_in_route_wins(self):
+        slow, slow_server = self.server("slow", latency=0.1)
+        fast, fast_server = self.server("fast", latency=0.005)
+        router = ModelRouter([slow, fast], routes={"feedback": ["slow", "fast"]}, explore_rate=0)
+
+        answers = [json.loads(router.call("feedback", complete, 5.0))["from"] for _ in range(20)]
+        # Each endpoint is measured first, then every call goes to the fast one
+        self.assertEqual(answers[:6], ["slow"] * 3 + ["fast"] * 3)
+        self.assertEqual(set(answers[6:]), {"fast"})
+        self.assertEqual(fast_server.received[0]["model"], "fast-model")
+        self.assertEqual(router.snapshot()["endpoints"]["fast"]["latency"]["feedback"]["samples"], 17)
+
+    def test_failing_endpoint_falls_back_and_trips(self):
+        broken, broken_server = self.server("broken", error_rate=1.0)
+        healthy, _ = self.server("healthy")
+        router = ModelRouter([broken, healthy], explore_rate=0)
+
+        for _ in range(10):
+            self.assertEqual(json.loads(router.call("question", complete, 5.0))["from"], "healthy")
+        # The breaker opens after 5 consecutive failures, after that the broken endpoint is not tried at all
+        self.assertEqual(len(broken_server.received), 5)
+        snapshot = router.snapshot()["endpoints"]
+        self.assertEqual(snapshot["broken"]["breaker"], "open")
+        self.assertEqual(snapshot["healthy"]["fallbacks"], 5)
+
+    def test_route_limits_the_allowed_endpoints(self):
+        broken, _ = self.server("broken", error_rate=1.0)
+        spare, spare_server = self.server("spare")
+        router = ModelRouter([broken, spare], routes={"phase_review": ["broken", "unknown"]}, explore_rate=0)
+        with self.assertRaises(Exception):
+            router.call("phase_review", complete, 5.0)
+        self.assertEqual(spare_server.received, [])
+
+        for _ in range(4):
+            with self.assertRaises(Exception):
+                router.call("phase_review", complete, 5.0)
+        with self.assertRaises(CircuitOpenError):
+            router.call("phase_review", complete, 5.0)
+
+    def measured_router(self):
+        router = ModelRouter([EndpointConfig("a", None, "x", "a-model"), EndpointConfig("b", None, "x", "b-model")],
+                             explore_rate=0)
+        for _ in range(3):
+            router.endpoints["a"].record("feedback", True, 0.01)
+            router.endpoints["b"].record("feedback", True, 0.2)
+        return router
+
+    def test_hanging_endpoint_gets_a_bounded_share(self):
+        router = self.measured_router()
+        timeouts = []
+
+        def request(endpoint, timeout):
+            timeouts.append((endpoint.name, timeout))
+            if endpoint.name == "a":
+                time.sleep(timeout)
+                raise TimeoutError("hung")
+            return "b"
+
+        started = time.monotonic()
+        self.assertEqual(router.call("feedback", request, 30.0), "b")
+        self.assertLess(time.monotonic() - started, 3.0)
+        # a may take max(MIN_SHARE, p95 x SHARE_FACTOR), the last endpoint gets what is left
+        self.assertEqual(timeouts[0], ("a", 1.0))
+        self.assertGreater(timeouts[1][1], 28.0)
+        self.assertEqual(router.snapshot()["endpoints"]["b"]["fallbacks"], 1)
+
+    def test_offset_starts_further_down_the_ranking(self):
+        router = self.measured_router()
+        request = lambda endpoint, timeout: endpoint.name
+        self.assertEqual([router.call("feedback", request, 5.0, offset=n) for n in range(3)], ["a", "b", "a"])
+
+    def test_call_sites_use_their_routed_models(self):
+        from llm_service import AdaptiveLearningSystem
+
+        def responder(body):
+            return json.dumps(FEEDBACK)
+
+        with FakeOpenAIServer(responder=responder) as default, FakeOpenAIServer(responder=responder) as fast:
+            endpoints = json.dumps({"fast": {"base_url": fast.base_url, "model": "small-model"}})
+            router = ModelRouter.from_settings("x", default.base_url, "big-model", endpoints,
+                                               {"feedback": ["fast", "default"], "phase_review": ["default"],
+                                                "fixup": ["default"]})
+            router.explore_rate = 0
+            system = AdaptiveLearningSystem(api_key="x", exa_client=FakeExa(), router=router)
+            question = {"category": "Lists", "difficulty": 2, "content": "Q", "correct_answer": "A"}
+            self.assertEqual(system.evaluate_answer_by_llm("Python", question, "A", True, user_id=1), FEEDBACK)
+            with patch('llm_service.get_top_digests', return_value=[]):
+                system.generate_phase_review(1, "Python", 500)
+
+        self.assertEqual([body["model"] for body in fast.received], ["small-model"])
+        self.assertEqual(default.received[0]["model"], "big-model")
+        self.assertIn("phased review", default.received[0]["messages"][0]["content"])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=0)
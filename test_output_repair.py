@@ -0,0 +1,136 @@
+# test_output_repair.py
+import json
+import unittest
+from unittest.mock import patch
+
+from fake_upstream import FakeExa, FakeOpenAIServer
+from llm_service import EvaluationFeedback, GeneratedQuestion, PhaseReviewResult
+from output_repair import RepairStats, StructuredOutputError, parse_structured, repair_text, try_parse
+
+QUESTION = {
+    "stage": "Basic Introduction",
+    "category": "Lists",
+    "difficulty": 2,
+    "content": "Which method appends to a list?",
+    "options": {"A": "append", "B": "push", "C": "add", "D": "put"},
+    "correct_answer": "A",
+}
+
+
+class TestRepairText(unittest.TestCase):
+
+    def test_fences_trailing_commas_and_inner_quotes(self):
+        raw = 'Sure!\n```json\n{"root_cause": "Confused the "pivot" step", "improvement": "Redo it",\n "score_change": -15,}\n```'
+        data = json.loads(repair_text(raw))
+        self.assertEqual(data["root_cause"], 'Confused the "pivot" step')
+        self.assertEqual(data["score_change"], -15)
+
+    def test_truncated_output_is_closed(self):
+        data = json.loads(repair_text('{"topics": ["Loops", "Functions'))
+        self.assertEqual(data["topics"], ["Loops", "Functions"])
+
+    def test_raw_newlines_and_python_literals(self):
+        data = json.loads(repair_text('{"content": "line one\nline two", "flag": True}'))
+        self.assertEqual(data["content"], "line one\nline two")
+        self.assertIs(data["flag"], True)
+
+    def test_bare_list_is_kept_whole(self):
+        raw = '[{"q": "one"}, {"q": "two",}, {"q": "three"'
+        self.assertEqual(json.loads(repair_text(raw)), [{"q": "one"}, {"q": "two"}, {"q": "three"}])
+        self.assertEqual(json.loads(repair_text('Here you go: {"items": [1, 2]} [done]')), {"items": [1, 2]})
+
+
+class TestParseStructured(unittest.TestCase):
+
+    def setUp(self):
+        self.stats = RepairStats()
+
+    def test_clean_output(self):
+        parse_structured(json.dumps(QUESTION), GeneratedQuestion, "question", self.stats)
+        self.assertEqual(self.stats.snapshot()["question"]["clean"], 1)
+
+    def test_type_coercion(self):
+        sloppy = dict(QUESTION, difficulty="Level 7", correct_answer="a. append",
+                      options=["A. append", "B. push", "C. add", "D. put"])
+        question = parse_structured(json.dumps(sloppy), GeneratedQuestion, "question", self.stats)
+        self.assertEqual(question.difficulty, 5)
+        self.assertEqual(question.correct_answer, "A")
+        self.assertEqual(question.options["B"], "push")
+
+        sloppy = dict(QUESTION, options={"A.": "append", "b)": "push", "C": 3, "D": "put"})
+        question = parse_structured(json.dumps(sloppy), GeneratedQuestion, "question", self.stats)
+        self.assertEqual(question.options, {"A": "append", "B": "push", "C": "3", "D": "put"})
+
+        feedback = parse_structured('{"score_change": "+15分", "root_cause": "ok", "improvement": "ok"}',
+                                    EvaluationFeedback, "feedback", self.stats)
+        self.assertEqual(feedback.score_change, 15)
+        self.assertEqual(self.stats.snapshot()["question"]["repaired"], 2)
+
+    def test_fixup_only_when_repair_fails(self):
+        calls = []
+
+        def fixup(broken, errors):
+            calls.append(errors)
+            return json.dumps(QUESTION)
+
+        question = parse_structured('{"content": "missing most fields"}', GeneratedQuestion, "question",
+                                    self.stats, fixup=fixup)
+        self.assertEqual(question.correct_answer, "A")
+        self.assertEqual(len(calls), 1)
+        self.assertIn("stage", calls[0])
+
+        with self.assertRaises(StructuredOutputError):
+            parse_structured("no json here", GeneratedQuestion, "question", self.stats, fixup=lambda b, e: "still none")
+        self.assertEqual(self.stats.snapshot()["question"]["fixup"], 1)
+        self.assertEqual(self.stats.snapshot()["question"]["failed"], 1)
+
+    def test_missing_output_is_a_failed_parse(self):
+        self.assertEqual(try_parse(None, GeneratedQuestion), (None, "expected text output, got NoneType"))
+        with self.assertRaises(StructuredOutputError):
+            parse_structured(None, GeneratedQuestion, "question", self.stats, fixup=lambda b, e: json.dumps(QUESTION))
+        self.assertEqual(self.stats.snapshot()["question"]["failed"], 1)
+
+    def test_nested_phase_review(self):
+        raw = json.dumps({"gap": "Recursion", "mermaid_graph": "graph TD", "path_type": "Average Student",
+                          "content": {"practices": "1. warm up\n2. harder", "methodology_summary": ["a", "b"]}})
+        review = parse_structured(raw, PhaseReviewResult, "phase_review", self.stats)
+        self.assertEqual(review.content.practices, ["1. warm up", "2. harder"])
+        self.assertEqual(review.content.methodology_summary, '["a", "b"]')
+
+
+class TestFixupRequest(unittest.TestCase):
+
+    @patch('llm_service.get_topic_digests', return_value=[])
+    def test_generate_question_uses_short_fixup_instead_of_regenerating(self, mock_wrong):
+        from llm_service import AdaptiveLearningSystem
+
+        def responder(body):
+            prompt = body["messages"][0]["content"]
+            if "does not satisfy the required schema" in prompt:
+                return json.dumps(QUESTION)
+            return json.dumps({"content": "half a question"})
+
+        with FakeOpenAIServer(responder=responder) as server:
+            system = AdaptiveLearningSystem(api_key="x", base_url=server.base_url, exa_client=FakeExa())
+            question = system.generate_question(1, "Python Programming", "Lists", initial_score=200)
+
+        self.assertEqual(question["category"], "Lists")
+        self.assertEqual(len(server.received), 2)
+        fixup_prompt = server.received[1]["messages"][0]["content"]
+        self.assertNotIn("Reference knowledge base", fixup_prompt)
+        self.assertEqual(system.repair_stats.snapshot()["question"]["fixup"], 1)
+
+    def test_feedback_falls_back_without_a_fixup_request(self):
+        from llm_service import AdaptiveLearningSystem
+
+        with FakeOpenAIServer(responder=lambda body: json.dumps({"root_cause": "only half"})) as server:
+            system = AdaptiveLearningSystem(api_key="x", base_url=server.base_url, exa_client=FakeExa())
+            feedback = system.evaluate_answer_by_llm("Python", QUESTION, "B", False, user_id=1)
+
+        self.assertEqual(feedback["score_change"], -15)
+        self.assertEqual(len(server.received), 1)
+        self.assertEqual(system.repair_stats.snapshot()["feedback"]["failed"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=0)
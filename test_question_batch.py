@@ -0,0 +1,90 @@
+# test_question_batch.py
+import json
+import unittest
+from unittest.mock import patch
+
+from fake_upstream import FakeExa, FakeOpenAIServer
+from llm_scheduler import PRIORITY_PREFETCH
+
+
+def make_question(i, **overrides):
+    q = {
+        "stage": "Advanced Improvement",
+        "category": "Kinematics",
+        "difficulty": 3,
+        "content": f"Question {i}",
+        "options": {"A": "1", "B": "2", "C": "3", "D": "4"},
+        "correct_answer": "A",
+    }
+    q.update(overrides)
+    return q
+
+
+class TestQuestionBatch(unittest.TestCase):
+
+    def setUp(self):
+        import llm_service
+        llm_service.prefetched_questions.clear()
+        llm_service.current_question_state = {}
+        self.exa = FakeExa()
+
+    def make_system(self, server):
+        from llm_service import AdaptiveLearningSystem
+        return AdaptiveLearningSystem(api_key="x", base_url=server.base_url, exa_client=self.exa)
+
+    @patch('llm_service.get_topic_digests', return_value=[])
+    def test_partial_acceptance(self, mock_wrong):
+        items = [make_question(1), make_question(2, difficulty="very hard"), make_question(3, options=None)]
+        items.append(make_question(4))
+        responder = lambda body: json.dumps({"questions": items})
+        with FakeOpenAIServer(responder=responder) as server:
+            system = self.make_system(server)
+            questions = system.generate_question_batch(1, "Physics", "Kinematics", count=4, initial_score=500)
+
+        self.assertEqual([q["content"] for q in questions], ["Question 1", "Question 4"])
+        self.assertEqual(len(server.received), 1)
+        self.assertEqual(len(self.exa.queries), 1)
+        self.assertIn("4 distinct", server.received[0]["messages"][0]["content"])
+
+    @patch('llm_service.get_topic_digests', return_value=[])
+    def test_repeated_questions_are_dropped(self, mock_wrong):
+        items = [make_question(1), make_question(2), make_question(1, content="  question 1 "), make_question(3)]
+        responder = lambda body: json.dumps({"questions": items})
+        with FakeOpenAIServer(responder=responder) as server:
+            system = self.make_system(server)
+            questions = system.generate_question_batch(1, "Physics", "Kinematics", count=4, initial_score=500)
+
+        self.assertEqual([q["content"] for q in questions], ["Question 1", "Question 2", "Question 3"])
+        prompt = server.received[0]["messages"][0]["content"]
+        self.assertIn("a set of 4 questions that must not repeat each other", prompt)
+        self.assertIn("4 regular test questions covering different aspects", prompt)
+        self.assertNotIn("the question:", prompt)
+
+    @patch('llm_service.get_topic_digests', return_value=[])
+    @patch('llm_service.get_topic_score', return_value=500)
+    @patch('llm_service.set_topic_score')
+    def test_prefetch_pool_amortizes_calls(self, mock_set, mock_score, mock_wrong):
+        import llm_service
+        responder = lambda body: json.dumps({"questions": [make_question(i) for i in range(3)]})
+        with FakeOpenAIServer(responder=responder) as server:
+            with patch.object(llm_service, 'global_system', self.make_system(server)), \
+                 patch.object(llm_service, 'QUESTION_BATCH_SIZE', 3):
+                contents = []
+                for _ in range(4):
+                    contents.append(llm_service.fetch_new_question(1, "Physics", "Kinematics")["data"]["content"])
+                    for refill in list(llm_service._prefetch_refills.values()):
+                        refill.join(5)
+                # Taking the last prefetched question refilled the pool in the background, at prefetch priority
+                stats = llm_service.global_system.scheduler.stats
+                self.assertEqual(stats[PRIORITY_PREFETCH]["admitted"], 1)
+
+                # Dropping into a new stage invalidates the pool
+                mock_score.return_value = 800
+                llm_service.fetch_new_question(1, "Physics", "Kinematics")
+
+        self.assertEqual(contents, ["Question 0", "Question 1", "Question 2", "Question 0"])
+        self.assertEqual(len(server.received), 3)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=0)
@@ -0,0 +1,137 @@
+# test_quiz_session.py
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+import database
+import llm_service
+import quiz_session
+from fake_upstream import FakeExa, FakeOpenAIServer, FaultPlan
+from storage_sqlite import SQLiteStorage
+
+
+def make_question(i, category="Lists"):
+    return {"stage": "Advanced Improvement", "category": category, "difficulty": 3, "content": f"Question {i}",
+            "options": {"A": "1", "B": "2", "C": "3", "D": "4"}, "correct_answer": "A"}
+
+REVIEW = {"gap": "Mixes up methods", "mermaid_graph": "graph TD; A[\"Lists\"]", "path_type": "Average Student",
+          "content": {"core_concept_clarification": "append vs extend"}}
+
+
+def responder(body):
+    prompt = body["messages"][0]["content"]
+    if "Scoring and Feedback Rules" in prompt:
+        return json.dumps({"score_change": 15, "root_cause": "Confuses append with extend", "improvement": "Compare them"})
+    if "phased review" in prompt:
+        return json.dumps(REVIEW)
+    if '"questions"' in prompt:
+        # One item short, the missing question has to be generated separately
+        return json.dumps({"questions": [make_question(0), make_question(1, "Tuples"), make_question(2)]})
+    return json.dumps(make_question(3))
+
+
+class TestQuizSession(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.storage = SQLiteStorage(os.path.join(self.directory, "tutor.db"))
+        self.previous = database.set_storage(self.storage)
+        self.storage.bulk_create_users([("alice", "h"), ("bob", "h")])
+        llm_service.user_streaks.clear()
+        llm_service.user_total_answers.clear()
+        quiz_session.quiz_sessions.clear()
+        self.server = FakeOpenAIServer(responder=responder, plan=FaultPlan(latency=0.2)).__enter__()
+        system = llm_service.AdaptiveLearningSystem(api_key="x", base_url=self.server.base_url, exa_client=FakeExa())
+        self.patcher = patch.object(quiz_session, "global_system", system)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        self.server.__exit__(None, None, None)
+        database.set_storage(self.previous)
+        self.storage.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def start(self, user_id=1):
+        result = quiz_session.start_quiz(user_id, "Python Programming", "Lists", count=4)
+        self.assertEqual(result["status"], "success")
+        return result["data"]
+
+    def submit(self, session_id, answers, user_id=1):
+        return quiz_session.submit_quiz(quiz_session.QuizSubmitPayload(user_id=user_id, session_id=session_id, answers=answers))
+
+    def test_quiz_round_trip(self):
+        quiz = self.start()
+        self.assertEqual([q["content"] for q in quiz["questions"]], ["Question 0", "Question 1", "Question 2", "Question 3"])
+        self.assertNotIn("correct_answer", quiz["questions"][0])
+
+        self.server.received.clear()
+        started = time.perf_counter()
+        result = self.submit(quiz["session_id"], ["a", "A", "A", "B"])
+        elapsed = time.perf_counter() - started
+
+        # Four feedback calls in parallel plus the review, not five sequential calls
+        self.assertEqual(len(self.server.received), 5)
+        self.assertLess(elapsed, 0.2 * 4)
+        self.assertEqual(result["correct_count"], 3)
+        self.assertEqual([r["is_correct"] for r in result["results"]], [True, True, True, False])
+        self.assertEqual(result["results"][1]["current_topic"], "Tuples")
+        # The streak builds up in question order: the third correct answer earns the bonus
+        self.assertEqual(result["results"][1]["streak_msg"], "")
+        self.assertIn("3 consecutive correct", result["results"][2]["streak_msg"])
+        self.assertEqual(llm_service.user_streaks[1], -1)
+        self.assertEqual(result["review_data"]["count"], 4)
+
+        lists = [r for r in result["results"] if r["current_topic"] == "Lists"]
+        self.assertEqual(lists[-1]["current_score"], lists[0]["current_score"] + sum(r["base_score_change"] for r in lists[1:]))
+        self.assertEqual(self.storage.get_topic_score(1, "Lists"), lists[-1]["current_score"])
+        wrong = self.storage.get_wrong_questions_details(1)
+        self.assertEqual([(w["question_content"], w["student_answer"]) for w in wrong], [("Question 3", "B")])
+        self.assertEqual(database.get_top_digests(1)[0]["wrong_count"], 1)
+
+    def test_session_is_single_use_and_owned(self):
+        quiz = self.start()
+        self.assertEqual(self.submit(quiz["session_id"], ["A"] * 4, user_id=2)["status"], "error")
+        self.assertEqual(self.submit(quiz["session_id"], ["A"] * 3)["status"], "error")
+        self.assertEqual(self.submit(quiz["session_id"], ["A"] * 4)["status"], "success")
+        self.assertEqual(self.submit(quiz["session_id"], ["A"] * 4)["status"], "error")
+
+    def test_failed_commit_leaves_nothing_applied(self):
+        quiz = self.start()
+        with patch.object(quiz_session, "record_quiz_results", side_effect=ConnectionError("database down")):
+            self.assertEqual(self.submit(quiz["session_id"], ["A"] * 4)["status"], "error")
+        self.assertEqual(llm_service.user_streaks[1], 0)
+        self.assertEqual(self.storage.get_all_topic_scores(1), {})
+
+        result = self.submit(quiz["session_id"], ["A"] * 4)
+        self.assertEqual(result["status"], "success")
+        self.assertEqual(llm_service.user_streaks[1], 4)
+
+    def test_failed_storage_commit_does_not_touch_digests(self):
+        quiz = self.start()
+        with patch.object(self.storage, "record_quiz_results", side_effect=ConnectionError("database down")):
+            self.assertEqual(self.submit(quiz["session_id"], ["A", "A", "A", "B"])["status"], "error")
+        self.assertEqual(database.get_top_digests(1), [])
+
+        self.assertEqual(self.submit(quiz["session_id"], ["A", "A", "A", "B"])["status"], "success")
+        digest = database.get_top_digests(1)[0]
+        self.assertEqual((digest["wrong_count"], len(digest["examples"])), (1, 1))
+        database.get_digest_cache().clear()
+        self.assertEqual(database.get_top_digests(1)[0]["wrong_count"], 1)
+
+    def test_storage_applies_deltas_in_order_in_one_transaction(self):
+        scores = self.storage.record_quiz_results(1, [("Lists", 400), ("Lists", 300), ("Sets", -600), ("Lists", -50)],
+                                                  [(1, "Sets", "Q", "B", "A", "cause", "fix")])
+        self.assertEqual(scores, [900, 1000, 0, 950])
+        with self.assertRaises(Exception):
+            self.storage.record_quiz_results(1, [("Lists", -100)], [(1, "Sets", "Q", "B", "A", "cause")])
+        self.assertEqual(self.storage.get_topic_score(1, "Lists"), 950)
+        self.assertEqual(len(self.storage.get_wrong_questions_details(1)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=0)
@@ -0,0 +1,153 @@
+# test_resilience.py
+import time
+import unittest
+
+from openai import APITimeoutError, OpenAI
+
+from fake_upstream import FakeExa, FakeOpenAIServer, FaultPlan
+from resilience import (
+    CallPolicy, CircuitBreaker, CircuitOpenError, DeadlineExceeded, ResilientCaller, RetryBudget
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def chat_call(client):
+    def call(timeout):
+        response = client.chat.completions.create(
+            model="fake-model",
+            messages=[{"role": "user", "content": "ping"}],
+            timeout=timeout
+        )
+        return response.choices[0].message.content
+    return call
+
+
+class TestResilientCaller(unittest.TestCase):
+
+    def test_deadline_frees_stuck_request(self):
+        plan = FaultPlan(stall_rate=1.0, stall_seconds=5)
+        with FakeOpenAIServer(responder=lambda body: '{"ok": 1}', plan=plan) as server:
+            client = OpenAI(api_key="x", base_url=server.base_url, max_retries=0)
+            caller = ResilientCaller({"question": CallPolicy(timeout=0.5)})
+            start = time.monotonic()
+            with self.assertRaises((DeadlineExceeded, APITimeoutError)):
+                caller.call("question", chat_call(client))
+            self.assertLess(time.monotonic() - start, 2.0)
+
+    def test_hedge_beats_outlier(self):
+        plan = FaultPlan(stall_seconds=5)
+        with FakeOpenAIServer(responder=lambda body: '{"ok": 1}', plan=plan) as server:
+            client = OpenAI(api_key="x", base_url=server.base_url, max_retries=0)
+            caller = ResilientCaller({"question": CallPolicy(timeout=3.0, hedge=True, min_hedge_delay=0.1)},
+                                     retry_budget=RetryBudget(min_per_window=5))
+            for _ in range(10):
+                caller.call("question", chat_call(client))
+
+            plan.slow_first = plan.requests + 1  # The next request becomes a stalled outlier
+            start = time.monotonic()
+            self.assertEqual(caller.call("question", chat_call(client)), '{"ok": 1}')
+            self.assertLess(time.monotonic() - start, 2.0)
+            self.assertEqual(caller.stats["question"]["hedged"], 1)
+
+    def test_stuck_calls_without_timeout_stay_in_their_pool(self):
+        exa = FakeExa(plan=FaultPlan(stall_rate=1.0, stall_seconds=1.5))
+        caller = ResilientCaller({"exa_search": CallPolicy(timeout=0.2, pool="exa"), "feedback": CallPolicy(timeout=1.0)},
+                                 max_workers=1, pools={"exa": 1})
+        for _ in range(3):
+            # The client ignores the timeout: the first call keeps the only exa worker, the others queue and are cancelled
+            with self.assertRaises(DeadlineExceeded):
+                caller.call("exa_search", lambda timeout: exa.search_and_contents("optics"))
+        self.assertEqual(len(exa.queries), 1)
+        self.assertEqual(caller.call("feedback", lambda timeout: "ok"), "ok")
+
+    def test_retry_recovers_from_injected_errors(self):
+        plan = FaultPlan(error_rate=0.5, seed=3)
+        with FakeOpenAIServer(responder=lambda body: '{"ok": 1}', plan=plan) as server:
+            client = OpenAI(api_key="x", base_url=server.base_url, max_retries=0)
+            caller = ResilientCaller({"feedback": CallPolicy(timeout=2.0, max_retries=3)},
+                                     retry_budget=RetryBudget(ratio=1.0, min_per_window=50))
+            ok = 0
+            for _ in range(10):
+                try:
+                    caller.call("feedback", chat_call(client))
+                    ok += 1
+                except Exception:
+                    pass
+            self.assertGreaterEqual(ok, 9)
+            self.assertGreater(caller.stats["feedback"]["retries"], 0)
+
+    def test_retries_share_one_deadline(self):
+        calls = []
+
+        def flaky(timeout):
+            calls.append(timeout)
+            if len(calls) == 1:
+                time.sleep(0.3)
+                raise ConnectionError("reset")
+            time.sleep(timeout + 1)   # Ignores its timeout, only the caller's deadline ends it
+
+        caller = ResilientCaller({"feedback": CallPolicy(timeout=0.5, max_retries=3)},
+                                 retry_budget=RetryBudget(ratio=1.0, min_per_window=50))
+        start = time.monotonic()
+        with self.assertRaises(DeadlineExceeded):
+            caller.call("feedback", flaky)
+        self.assertLess(time.monotonic() - start, 0.7)
+        # The retry only got what was left of the first attempt's time, and was not retried past the deadline
+        self.assertEqual(len(calls), 2)
+        self.assertLess(calls[1], 0.25)
+
+    def test_retry_budget_caps_retries(self):
+        clock = FakeClock()
+        budget = RetryBudget(ratio=0.1, min_per_window=2, window=10, clock=clock)
+        for _ in range(10):
+            budget.record_request()
+        spent = sum(budget.try_spend() for _ in range(10))
+        self.assertEqual(spent, 3)
+        clock.now = 11
+        self.assertTrue(budget.try_spend())
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def test_open_half_open_close(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=clock)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "closed")
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+        self.assertFalse(breaker.allow())
+
+        clock.now = 31
+        self.assertTrue(breaker.allow())   # Single probe
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, "closed")
+
+    def test_exa_is_skipped_while_failing(self):
+        from llm_service import AdaptiveLearningSystem, EXA_DEGRADED_CONTEXT
+
+        exa = FakeExa(plan=FaultPlan(error_rate=1.0))
+        system = AdaptiveLearningSystem(api_key="x", base_url="http://127.0.0.1:9/v1", exa_client=exa)
+        for _ in range(6):
+            self.assertEqual(system.retrieve_background_knowledge("Physics", "Optics"), EXA_DEGRADED_CONTEXT)
+        # The breaker opened after 3 failures, later calls never reached Exa
+        self.assertEqual(len(exa.queries), 3)
+        self.assertEqual(system.resilience.stats["exa_search"]["short_circuited"], 3)
+        with self.assertRaises(CircuitOpenError):
+            system._search("exa_outline", "Physics course outline")
+
+        exa.plan.error_rate = 0.0
+        system.resilience.breakers["exa"]._opened_at -= 31
+        self.assertIn("Fake Source", system.retrieve_background_knowledge("Physics", "Optics"))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=0)
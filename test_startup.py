@@ -0,0 +1,174 @@
+# test_startup.py
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+import database
+import llm_service
+import main
+from fastapi.testclient import TestClient
+from storage_mysql import MySQLStorage
+from storage_sqlite import SQLiteStorage
+
+
+class TestReadiness(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.storage = SQLiteStorage(os.path.join(self.directory, "tutor.db"))
+        self.previous = database.set_storage(self.storage)
+        self.state = patch.dict(main.startup_state, {"ready": False, "started_at": None, "steps": {}, "errors": {}})
+        self.state.start()
+        self.client = TestClient(main.app)   # Not entered, so the lifespan warm-up thread does not start
+
+    def tearDown(self):
+        self.state.stop()
+        database.set_storage(self.previous)
+        self.storage.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_ready_only_after_warm_up(self):
+        response = self.client.get("/ready")
+        self.assertEqual((response.status_code, response.json()["status"]), (503, "warming_up"))
+
+        with patch.object(main.global_system, "warm_up", return_value={"llm_clients": {"default": True}}):
+            main.run_warm_up()
+        response = self.client.get("/ready")
+        self.assertEqual((response.status_code, response.json()["status"]), (200, "ready"))
+        steps = response.json()["steps"]
+        self.assertEqual(list(steps), ["db_pool", "write_behind", "html", "upstream_clients"])
+        self.assertEqual(steps["db_pool"]["result"], 1)
+        self.assertEqual(steps["write_behind"]["result"], {"enabled": False})
+
+    def test_failed_step_is_reported_without_blocking_readiness(self):
+        with patch.object(main.global_system, "warm_up", side_effect=RuntimeError("no route to LLM")):
+            main.run_warm_up()
+        response = self.client.get("/ready")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["errors"], {"upstream_clients": "no route to LLM"})
+        self.assertNotIn("upstream_clients", response.json()["steps"])
+
+
+class TestLazyConstruction(unittest.TestCase):
+
+    def setUp(self):
+        self.exa = patch.object(llm_service, "Exa", side_effect=lambda key: time.sleep(0.05) or MagicMock())
+        self.index = patch.object(llm_service, "KnowledgeIndex")
+        self.index_dir = patch.object(llm_service, "KNOWLEDGE_INDEX_DIR", "knowledge")
+        self.Exa, self.KnowledgeIndex = self.exa.start(), self.index.start()
+        self.index_dir.start()
+
+    def tearDown(self):
+        self.index_dir.stop()
+        self.index.stop()
+        self.exa.stop()
+
+    def test_clients_are_built_on_first_use(self):
+        system = llm_service.AdaptiveLearningSystem(api_key="x", base_url="http://127.0.0.1:9")
+        self.Exa.assert_not_called()
+        self.KnowledgeIndex.open.assert_not_called()
+        self.assertTrue(all(endpoint._client is None for endpoint in system.router.endpoints.values()))
+
+        clients = []
+        threads = [threading.Thread(target=lambda: clients.append(system.exa_client)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(self.Exa.call_count, 1)
+        self.assertEqual(len({id(client) for client in clients}), 1)
+
+        self.assertIs(system.knowledge_index, self.KnowledgeIndex.open.return_value)
+        self.KnowledgeIndex.open.assert_called_once_with("knowledge")
+
+    def test_warm_up_builds_every_client(self):
+        system = llm_service.AdaptiveLearningSystem(api_key="x", base_url="http://127.0.0.1:9")
+        self.assertEqual(system.warm_up(), {"llm_clients": {"default": True}, "exa_client": True, "knowledge_index": True})
+        self.assertIsNotNone(system.router.endpoints["default"]._client)
+        self.assertEqual((self.Exa.call_count, self.KnowledgeIndex.open.call_count), (1, 1))
+
+    def test_unavailable_index_falls_back_to_exa_only(self):
+        self.KnowledgeIndex.open.side_effect = FileNotFoundError("knowledge")
+        system = llm_service.AdaptiveLearningSystem(api_key="x", exa_client=MagicMock())
+        self.assertIsNone(system.knowledge_index)
+        self.assertIsNone(system.knowledge_index)
+        self.assertEqual(self.KnowledgeIndex.open.call_count, 1)
+
+
+class FakeMySQLConnection:
+
+    def __init__(self, fail_rollback=False):
+        self.fail_rollback = fail_rollback
+        self.rollbacks = 0
+        self.pings = 0
+        self.closed = False
+
+    def rollback(self):
+        self.rollbacks += 1
+        if self.fail_rollback:
+            raise ConnectionError("server has gone away")
+
+    def ping(self, reconnect=False):
+        self.pings += 1
+
+    def close(self):
+        self.closed = True
+
+
+class TestMySQLPool(unittest.TestCase):
+
+    def setUp(self):
+        self.opened = []
+        self.connect = patch("storage_mysql.pymysql.connect", side_effect=self.open)
+        self.connect.start()
+        self.storage = MySQLStorage({"host": "db"}, pool_size=2)
+
+    def tearDown(self):
+        self.connect.stop()
+
+    def open(self, **config):
+        conn = FakeMySQLConnection()
+        self.opened.append(conn)
+        return conn
+
+    def test_close_returns_the_connection_to_the_pool(self):
+        conn = self.storage.connection()
+        conn.close()
+        conn.close()   # A second close is a no-op
+        self.assertEqual((self.opened[0].rollbacks, self.storage._pool.qsize()), (1, 1))
+
+        again = self.storage.connection()
+        self.assertIs(again._conn, self.opened[0])
+        self.assertEqual(len(self.opened), 1)
+        again.close()
+
+    def test_broken_or_surplus_connections_are_closed(self):
+        conns = [self.storage.connection() for _ in range(3)]
+        for conn in conns:
+            conn.close()
+        # The pool holds two, the third is disconnected
+        self.assertEqual(self.storage._pool.qsize(), 2)
+        self.assertEqual([c.closed for c in self.opened], [False, False, True])
+
+        broken = self.storage.connection()
+        broken._conn.fail_rollback = True
+        underlying = broken._conn
+        broken.close()
+        self.assertTrue(underlying.closed)
+        self.assertEqual(self.storage._pool.qsize(), 1)
+
+    def test_warm_up_fills_the_pool_and_idle_connections_are_pinged(self):
+        self.assertEqual(self.storage.warm_up(), 2)
+        self.assertEqual(len(self.opened), 2)
+        conn, last_used = self.storage._pool.get_nowait()
+        self.storage._pool.put_nowait((conn, last_used - 3600))
+        self.storage.connection().close()
+        self.assertEqual(conn.pings, 1)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=0)
@@ -0,0 +1,133 @@
+# test_storage.py
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta
+
+import database
+from storage_sqlite import SQLiteStorage
+
+
+class TestSQLiteStorage(unittest.TestCase):
+    """The database.py function set, run through the facade against the embedded backend"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.storage = SQLiteStorage(os.path.join(self.directory, "tutor.db"))
+        self.previous = database.set_storage(self.storage)
+
+    def tearDown(self):
+        database.set_storage(self.previous)
+        self.storage.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_users_and_login(self):
+        self.assertEqual(database.create_user("alice", "pw1"), (True, "Registration successful"))
+        ok, message = database.create_user("alice", "other")
+        self.assertFalse(ok)
+        self.assertIn("already exists", message)
+
+        user_id = database.verify_user_login("alice", "pw1")
+        self.assertEqual(database.get_user_info(user_id), {"id": user_id, "username": "alice"})
+        self.assertIsNone(database.verify_user_login("alice", "wrong"))
+        self.assertIsNone(database.get_user_info(999))
+        self.assertEqual(self.storage.connection().execute("PRAGMA journal_mode").fetchone()["journal_mode"], "wal")
+
+    def test_scores_are_clamped_and_averaged(self):
+        database.create_user("bob", "pw")
+        user_id = database.get_user_ids_by_usernames(["bob", "ghost"])["bob"]
+
+        self.assertEqual(database.get_topic_score(user_id, "Loops"), 500)
+        self.assertEqual(database.update_topic_score(user_id, "Loops", 30), 530)
+        self.assertEqual(database.update_topic_score(user_id, "Loops", -900), 0)
+        self.assertEqual(database.update_topic_score(user_id, "Sets", 800), 1000)
+        database.set_topic_score(user_id, "Loops", 201)
+        self.assertEqual(database.get_all_topic_scores(user_id), {"Loops": 201, "Sets": 1000})
+        self.assertEqual(database.get_average_score(user_id), 600)
+        self.assertEqual(database.get_average_score(12345), 500)
+
+    def test_wrong_questions_archive_and_overview(self):
+        database.bulk_create_users([("carol", "h1"), ("dave", "h2")])
+        self.assertEqual(database.bulk_create_users([("carol", "h3")]), 0)
+        self.assertEqual(database.bulk_create_users([("carol", "h3")], update_existing=True), 1)
+        ids = database.get_user_ids_by_usernames(["carol", "dave"])
+        carol = ids["carol"]
+        database.bulk_set_topic_scores([(carol, "Loops", 700), (carol, "Recursion", 300), (ids["dave"], "Loops", 900)])
+
+        for topic in ("Loops", "Recursion basics", "Loops"):
+            database.record_wrong_question_to_db(carol, topic, "Q", "A", "B", "cause", "fix")
+        self.assertEqual(len(database.get_wrong_questions_details(carol)), 3)
+        self.assertEqual(len(database.get_wrong_questions_by_topic(carol, "Recursion")), 1)
+        self.assertEqual(sorted(database.get_user_weaknesses(carol)), ["Loops", "Recursion basics"])
+
+        rows = list(database.iter_wrong_questions([carol], batch_size=2))
+        self.assertEqual([row["username"] for row in rows], ["carol"] * 3)
+        self.assertIsInstance(rows[0]["created_at"], datetime)
+
+        old = database.get_wrong_questions_older_than(datetime.now() + timedelta(minutes=1))
+        self.assertEqual(database.count_wrong_questions_by_ids([row["id"] for row in old]), 3)
+        loops = [row["id"] for row in old if row["category"] == "Loops"]
+        database.archive_wrong_questions(loops, [(carol, "Loops", 2)])
+        self.assertEqual(database.get_archived_category_counts(carol), {"Loops": 2})
+        self.assertEqual(sorted(database.get_user_weaknesses(carol)), ["Loops", "Recursion basics"])
+
+        overview = database.get_all_users_overview()
+        self.assertEqual([row["username"] for row in overview], ["dave", "carol"])
+        self.assertEqual(overview[1], {"id": carol, "username": "carol", "avg_score": 500, "wrong_count": 3})
+
+        database.reset_all_data()
+        self.assertEqual(database.get_all_users_overview(), [])
+        database.create_user("erin", "pw")
+        self.assertEqual(database.verify_user_login("erin", "pw"), 1)
+
+    def test_concurrent_writers(self):
+        database.bulk_create_users([("frank", "h")])
+        user_id = database.get_user_ids_by_usernames(["frank"])["frank"]
+
+        def worker():
+            for _ in range(50):
+                database.update_topic_score(user_id, "Loops", 1)
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(database.get_topic_score(user_id, "Loops"), 700)
+        self.assertLess(elapsed, 5.0)
+
+
+    def test_export_stream_moves_between_threads(self):
+        database.create_user("erin", "pw")
+        for i in range(4):
+            database.record_wrong_question_to_db(1, "Loops", f"Q{i}", "A", "B", "cause", "fix")
+        rows = database.iter_wrong_questions(batch_size=1)
+        seen = []
+
+        def step():
+            # Like a worker thread of a streaming response that also serves other requests
+            database.update_topic_score(1, "Loops", 10)
+            seen.append(next(rows)["question_content"])
+
+        for _ in range(4):
+            worker = threading.Thread(target=step)
+            worker.start()
+            worker.join(5)
+        self.assertEqual(seen, ["Q0", "Q1", "Q2", "Q3"])
+        self.assertEqual(list(rows), [])
+        self.assertEqual(database.get_topic_score(1, "Loops"), 540)
+
+    def test_interface_is_abstract(self):
+        from storage import Storage
+        with self.assertRaises(TypeError):
+            Storage()
+        self.assertGreater(self.storage.warm_up(4), 0)
+
+if __name__ == '__main__':
+    unittest.main(verbosity=0)
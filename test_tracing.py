@@ -0,0 +1,189 @@
+# test_tracing.py
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import database
+from fake_upstream import FakeExa, FakeOpenAIServer
+from storage_sqlite import SQLiteStorage
+from tracing import SlowLog, StackSampler, Trace, Tracer, TracingMiddleware, span, traced
+
+QUESTION = {"stage": "Basic Introduction", "category": "Lists", "difficulty": 2,
+            "content": "Which method appends to a list?",
+            "options": {"A": "append", "B": "push", "C": "add", "D": "put"}, "correct_answer": "A"}
+
+
+def busy_loop(seconds):
+    deadline = time.perf_counter() + seconds
+    total = 0
+    while time.perf_counter() < deadline:
+        total += sum(range(200))
+    return total
+
+
+class TestSpans(unittest.TestCase):
+
+    def test_timings_do_not_double_count_nested_categories(self):
+        tracer = Tracer(slow_log=SlowLog(threshold_ms=0))
+        trace = tracer.start("GET /api/question")
+        with tracer.activate(trace):
+            with span("question.fetch"):
+                with span("db.get_topic_score"):
+                    with span("db.inner"):
+                        time.sleep(0.01)
+                with span("llm.question"):
+                    time.sleep(0.02)
+        tracer.finish(trace)
+
+        timings = trace.timings()
+        self.assertGreaterEqual(timings["llm"], 20)
+        self.assertLess(timings["db"], timings["llm"])
+        self.assertGreaterEqual(timings["question"], timings["db"] + timings["llm"])
+        self.assertTrue(trace.server_timing().startswith("db;dur="))
+        self.assertIn("total;dur=", trace.server_timing())
+
+        entry = tracer.slow_log.entries()[0]
+        self.assertEqual(entry["spans"][0]["children"][0]["children"][0]["name"], "db.inner")
+
+    def test_spans_outside_a_request_are_no_ops(self):
+        with span("db.anything") as current:
+            self.assertIsNone(current)
+        self.assertEqual(traced("db.x")(lambda: 7)(), 7)
+
+    def test_slow_log_is_a_ring_buffer(self):
+        log = SlowLog(threshold_ms=5, capacity=2)
+        fast = Trace("fast")
+        fast.finish()
+        self.assertFalse(log.offer(fast))
+        for name in ("a", "b", "c"):
+            trace = Trace(name)
+            time.sleep(0.006)
+            trace.finish()
+            log.offer(trace)
+        self.assertEqual([e["name"] for e in log.entries()], ["c", "b"])
+
+    def test_sampled_request_profile_finds_hot_function(self):
+        tracer = Tracer(sample_rate=1.0, sampler=StackSampler(interval=0.001))
+        trace = tracer.start("POST /api/submit")
+        with tracer.activate(trace):
+            with span("answer.evaluate"):
+                busy_loop(0.2)
+        tracer.finish(trace)
+        self.assertTrue(any("busy_loop" in stack for stack in trace.profile))
+        self.assertTrue(tracer.sampler.snapshot()["samples"] > 0)
+
+
+class TestMiddleware(unittest.TestCase):
+
+    def test_server_timing_header_covers_worker_thread_spans(self):
+        tracer = Tracer(slow_log=SlowLog(threshold_ms=0))
+        app = FastAPI()
+        app.add_middleware(TracingMiddleware, tracer=tracer)
+
+        @traced("db.lookup")
+        def lookup():
+            time.sleep(0.005)
+            return 1
+
+        @app.get("/ping")
+        def ping():   # Sync endpoint, runs in the worker thread pool
+            return {"value": lookup()}
+
+        response = TestClient(app).get("/ping")
+        self.assertEqual(response.json(), {"value": 1})
+        self.assertRegex(response.headers["server-timing"], r"^db;dur=\d+\.\d, total;dur=\d+\.\d$")
+        self.assertEqual(tracer.slow_log.entries()[0]["name"], "GET /ping")
+
+    def test_streamed_response_is_traced_to_the_last_chunk(self):
+        from fastapi.responses import StreamingResponse
+
+        tracer = Tracer(slow_log=SlowLog(threshold_ms=0))
+        app = FastAPI()
+        app.add_middleware(TracingMiddleware, tracer=tracer)
+
+        def rows():
+            for i in range(3):
+                with span("db.export_batch"):
+                    time.sleep(0.01)
+                yield f"{i}\n"
+
+        @app.get("/export")
+        def export():
+            return StreamingResponse(rows(), media_type="text/plain")
+
+        response = TestClient(app).get("/export")
+        self.assertEqual(response.text, "0\n1\n2\n")
+        entry = tracer.slow_log.entries()[0]
+        self.assertEqual([s["name"] for s in entry["spans"]], ["db.export_batch"] * 3)
+        self.assertGreaterEqual(entry["duration_ms"], 30)
+
+    def test_long_lived_streams_do_not_crowd_out_slow_requests(self):
+        from fastapi.responses import StreamingResponse
+
+        tracer = Tracer(slow_log=SlowLog(threshold_ms=20, capacity=2))
+        app = FastAPI()
+        app.add_middleware(TracingMiddleware, tracer=tracer)
+
+        @app.get("/slow")
+        def slow():
+            time.sleep(0.03)
+            return {}
+
+        def events():
+            for i in range(3):
+                time.sleep(0.02)
+                yield f"data: {i}\n\n"
+
+        @app.get("/stream")
+        def stream():
+            return StreamingResponse(events(), media_type="text/event-stream")
+
+        client = TestClient(app)
+        client.get("/slow")
+        for _ in range(3):
+            self.assertEqual(client.get("/stream").text.count("data:"), 3)
+        self.assertEqual([entry["name"] for entry in tracer.slow_log.entries()], ["GET /slow"])
+
+    def test_profile_is_frozen_once_finished(self):
+        trace = Trace("GET /x", sampled=True)
+        trace.add_sample("a.py:f")
+        trace.finish()
+        trace.add_sample("a.py:g")
+        self.assertEqual(trace.to_dict()["profile"], [{"stack": "a.py:f", "samples": 1}])
+
+
+class TestLLMServiceSpans(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.storage = SQLiteStorage(os.path.join(self.directory, "tutor.db"))
+        self.previous = database.set_storage(self.storage)
+
+    def tearDown(self):
+        database.set_storage(self.previous)
+        self.storage.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_generate_question_breakdown(self):
+        from llm_service import AdaptiveLearningSystem
+
+        tracer = Tracer()
+        with FakeOpenAIServer(responder=lambda body: json.dumps(QUESTION)) as server:
+            system = AdaptiveLearningSystem(api_key="x", base_url=server.base_url,
+                                            exa_client=FakeExa(results=[("Lists", "list.append adds an item")]))
+            trace = tracer.start("GET /api/question")
+            with tracer.activate(trace):
+                self.assertEqual(system.generate_question(1, "Python Programming", "Lists")["category"], "Lists")
+            tracer.finish(trace)
+
+        self.assertTrue({"question", "db", "retrieval", "exa", "queue", "llm", "parse"} <= set(trace.timings()))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=0)
@@ -0,0 +1,185 @@
+# test_write_behind.py
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import database
+from storage_sqlite import SQLiteStorage
+from write_behind import WrongQuestionWriteBehind
+
+
+def spooled(buffer):
+    return sorted(f for f in os.listdir(buffer.spool_dir) if f.endswith(".ndjson"))
+
+
+class TestWriteBehind(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.spool = os.path.join(self.directory, "spool")
+        self.storage = SQLiteStorage(os.path.join(self.directory, "tutor.db"))
+        self.previous = database.set_storage(self.storage)
+        self.storage.bulk_create_users([("alice", "h"), ("bob", "h")])
+        self.buffers = []
+
+    def tearDown(self):
+        database.set_write_behind(None)
+        for buffer in self.buffers:
+            buffer.close()
+        database.set_storage(self.previous)
+        self.storage.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def make_buffer(self, write_batch=None, **kwargs):
+        buffer = WrongQuestionWriteBehind(write_batch or self.storage.record_wrong_questions_batch, self.spool,
+                                          flush_interval=kwargs.pop("flush_interval", 60), **kwargs)
+        self.buffers.append(buffer)
+        return buffer
+
+    def db_rows(self):
+        return self.storage.connection().execute("SELECT * FROM wrong_questions").fetchall()
+
+    def test_buffered_records_are_visible_before_and_after_flush(self):
+        database.set_write_behind(self.make_buffer())
+        for topic in ("Loops", "Recursion", "Loops"):
+            database.record_wrong_question_to_db(1, topic, "Q", "A", "B", "cause", "fix")
+        database.record_wrong_question_to_db(2, "Sets", "Q", "A", "B", "cause", "fix")
+        self.assertEqual(self.db_rows(), [])
+
+        def reads():
+            return (len(database.get_wrong_questions_details(1)),
+                    sorted(database.get_user_weaknesses(1)),
+                    len(database.get_wrong_questions_by_topic(1, "loops")),
+                    {row['username']: row['wrong_count'] for row in database.get_all_users_overview()})
+
+        before = reads()
+        self.assertEqual(before, (3, ["Loops", "Recursion"], 2, {"alice": 3, "bob": 1}))
+        self.assertEqual(database.get_write_behind().flush(), 4)
+        self.assertEqual(len(self.db_rows()), 4)
+        self.assertEqual(reads(), before)
+        self.assertEqual(spooled(database.get_write_behind()), [])
+
+    def test_size_trigger_flushes_one_multi_row_batch(self):
+        batches = []
+
+        def write_batch(batch_id, rows):
+            batches.append(len(rows))
+            return self.storage.record_wrong_questions_batch(batch_id, rows)
+
+        buffer = self.make_buffer(write_batch, max_batch=5)
+        for i in range(5):
+            buffer.add(1, "Loops", f"Q{i}", "A", "B", "cause", "fix")
+        deadline = time.monotonic() + 5
+        while not buffer.snapshot()["flushed_batches"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(batches, [5])
+        self.assertEqual(len(self.db_rows()), 5)
+
+    def test_spool_replay_after_crash_is_exactly_once(self):
+        def database_down(batch_id, rows):
+            raise ConnectionError("database down")
+
+        crashed = self.make_buffer(database_down)
+        for i in range(3):
+            crashed.add(1, "Loops", f"Q{i}", "A", "B", "cause", "fix")
+        self.assertEqual(crashed.flush(), 0)
+        self.assertEqual(crashed.snapshot()["failed_flushes"], 1)
+        self.buffers.remove(crashed)
+        crashed._owner_lock.close()    # The process dies here, the spool file stays behind
+
+        # Crash right after the commit but before the spool file was removed: replaying it must not duplicate rows
+        spool_file = spooled(crashed)[0]
+        shutil.copy(os.path.join(crashed.spool_dir, spool_file), os.path.join(crashed.spool_dir, "wq-0-copy.ndjson"))
+        self.storage.record_wrong_questions_batch("wq-0-copy", [(1, "Loops", "Q0", "A", "B", "c", "f", "2026-01-01 08:00:00")])
+
+        restarted = self.make_buffer()
+        self.assertEqual(restarted.snapshot()["replayed_batches"], 2)
+        self.assertEqual(restarted.flush(), 3)
+        rows = self.db_rows()
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(spooled(restarted), [])
+        self.assertFalse(os.path.exists(crashed.spool_dir))
+
+    def test_live_processes_keep_their_own_spools(self):
+        first = self.make_buffer()
+        first.add(1, "Loops", "Q0", "A", "B", "cause", "fix")
+        second = self.make_buffer()
+        self.assertEqual(second.snapshot()["replayed_batches"], 0)
+        self.assertEqual(second.flush(), 0)
+        self.assertEqual(first.flush(), 1)
+        self.assertEqual(len(self.db_rows()), 1)
+
+    def test_failing_batch_is_quarantined_without_blocking_others(self):
+        outage = threading.Event()
+
+        def write_batch(batch_id, rows):
+            if outage.is_set() or any(row[2] == "poison" for row in rows):
+                raise ValueError("rejected")
+            return self.storage.record_wrong_questions_batch(batch_id, rows)
+
+        buffer = self.make_buffer(write_batch, max_attempts=3)
+        buffer.add(1, "Loops", "poison", "A", "B", "cause", "fix")
+        with buffer._cond:
+            buffer._seal_locked()
+
+        # While the database is down every batch fails; that does not count against the batches
+        outage.set()
+        for i in range(5):
+            buffer.add(1, "Loops", f"down{i}", "A", "B", "cause", "fix")
+            self.assertEqual(buffer.flush(), 0)
+        self.assertEqual(buffer.snapshot()["quarantined_batches"], 0)
+        outage.clear()
+
+        self.assertEqual(buffer.flush(), 5)
+        for i in range(2):
+            buffer.add(1, "Loops", f"Q{i}", "A", "B", "cause", "fix")
+            self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(buffer.snapshot()["quarantined_batches"], 1)
+        self.assertEqual(buffer.snapshot()["pending"], 0)
+        self.assertEqual(len(os.listdir(os.path.join(self.spool, "quarantine"))), 1)
+        self.assertEqual(len(self.db_rows()), 7)
+
+    def test_read_during_a_stuck_flush_returns_storage_only(self):
+        buffer = self.make_buffer(read_wait=0.05)
+        buffer.add(1, "Loops", "Q0", "A", "B", "cause", "fix")
+        with buffer._cond:
+            buffer._generation += 1    # A batch write that does not finish
+        self.assertEqual(buffer.read_through(lambda: ["stored"], 1), ([], ["stored"]))
+        with buffer._cond:
+            buffer._generation += 1
+        self.assertEqual(len(buffer.read_through(lambda: [], 1)[0]), 1)
+
+    def test_reads_during_flush_never_duplicate_or_miss(self):
+        def slow_write(batch_id, rows):
+            time.sleep(0.02)
+            return self.storage.record_wrong_questions_batch(batch_id, rows)
+
+        buffer = self.make_buffer(slow_write)
+        database.set_write_behind(buffer)
+        errors = []
+
+        def reader():
+            for _ in range(200):
+                count = len(database.get_wrong_questions_details(1))
+                if count != 60:
+                    errors.append(count)
+
+        threads = [threading.Thread(target=reader) for _ in range(3)]
+        for i in range(60):
+            buffer.add(1, "Loops", f"Q{i}", "A", "B", "cause", "fix")
+            if i % 20 == 19:
+                with buffer._cond:
+                    buffer._seal_locked()   # Three sealed batches, written one after another
+        for thread in threads:
+            thread.start()
+        self.assertEqual(buffer.flush(), 60)
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=0)
@@ -0,0 +1,143 @@
+# test_wrong_question_archive.py
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import database
+import wrong_question_archive as archive
+from storage_sqlite import SQLiteStorage
+
+
+class TestWrongQuestionArchive(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.archive_dir = os.path.join(self.directory, "archive")
+        self.storage = SQLiteStorage(os.path.join(self.directory, "tutor.db"))
+        self.previous = database.set_storage(self.storage)
+        self.storage.bulk_create_users([("alice", "h"), ("bob", "h")])
+        old = datetime.now() - timedelta(days=400)
+        rows = [(1, "Loops", f"old {i}", "B", "A", "cause", "fix", old + timedelta(days=40 * (i % 2))) for i in range(4)]
+        rows += [(2, "Sets", "old bob", "B", "A", "cause", "fix", old)]
+        self.storage.record_wrong_questions_batch("seed", rows)
+        database.record_wrong_question_to_db(1, "Recursion", "new", "B", "A", "cause", "fix")
+
+    def tearDown(self):
+        database.set_storage(self.previous)
+        self.storage.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def archive(self, **kwargs):
+        with redirect_stdout(io.StringIO()):
+            return archive.archive_older_than(180, self.archive_dir, **kwargs)
+
+    def export(self, user_ids=None, fmt="ndjson", archive_dir=None):
+        text = "".join(archive.export_wrong_questions(user_ids, fmt, archive_dir))
+        if fmt == "csv":
+            return list(csv.DictReader(io.StringIO(text)))
+        return [json.loads(line) for line in text.splitlines()]
+
+    def test_archive_moves_old_rows_into_monthly_parts(self):
+        self.assertEqual(self.archive(dry_run=True), {"archived": 5, "parts": 0})
+        self.assertEqual(len(self.storage.get_wrong_questions_details(1)), 5)
+
+        stats = self.archive(batch_size=2)
+        self.assertEqual(stats["archived"], 5)
+        index = archive.load_index(self.archive_dir)
+        self.assertEqual(len(index["months"]), 2)
+        self.assertEqual(sum(entry["rows"] for entry in index["months"].values()), 5)
+        parts = [part for entry in index["months"].values() for part in entry["parts"]]
+        self.assertTrue(all(part["status"] == "committed" and "ids" not in part for part in parts))
+        self.assertEqual([r["question_content"] for r in self.storage.get_wrong_questions_details(1)], ["new"])
+
+        # Summary counts keep weaknesses and dashboard counts intact
+        self.assertEqual(self.storage.get_archived_category_counts(1), {"Loops": 4})
+        self.assertEqual(sorted(database.get_user_weaknesses(1)), ["Loops", "Recursion"])
+        overview = {row["username"]: row["wrong_count"] for row in database.get_all_users_overview()}
+        self.assertEqual(overview, {"alice": 5, "bob": 1})
+        # An int, not a Decimal: the dashboard feed adds deltas to it and sends it as a JSON number
+        self.assertEqual({type(count) for count in overview.values()}, {int})
+        self.assertEqual(self.archive(), {"archived": 0, "parts": 0})
+
+    def test_export_includes_the_archive(self):
+        before = self.export([1], "csv")
+        self.archive()
+        self.assertEqual([r["question_content"] for r in self.export([1])], ["new"])
+
+        rows = self.export([1], archive_dir=self.archive_dir)
+        self.assertEqual(sorted(r["question_content"] for r in rows), sorted(r["question_content"] for r in before))
+        self.assertEqual(rows[-1]["question_content"], "new")
+        self.assertEqual({r["username"] for r in rows}, {"alice"})
+        self.assertEqual(len(self.export(archive_dir=self.archive_dir)), 6)
+        self.assertEqual(list(before[0]), archive.EXPORT_FIELDS)
+
+    def test_interrupted_run_is_resumed(self):
+        # Crash after the first part was written but before its delete committed
+        with patch.object(archive, "archive_wrong_questions", side_effect=ConnectionError("database down")):
+            with self.assertRaises(ConnectionError):
+                self.archive()
+        index = archive.load_index(self.archive_dir)
+        pending = [p for entry in index["months"].values() for p in entry["parts"]]
+        self.assertEqual([p["status"] for p in pending], ["pending"])
+
+        self.assertEqual(self.archive()["archived"], 5)
+        index = archive.load_index(self.archive_dir)
+        parts = [p for entry in index["months"].values() for p in entry["parts"]]
+        self.assertEqual([p["status"] for p in parts], ["committed", "committed"])
+        self.assertEqual(sum(entry["rows"] for entry in index["months"].values()), 5)
+        on_disk = sorted(os.path.join(month, name) for month in index["months"]
+                         for name in os.listdir(os.path.join(self.archive_dir, month)))
+        self.assertEqual(on_disk, sorted(p["file"] for p in parts))
+        self.assertEqual(len(self.export(archive_dir=self.archive_dir)), 6)
+
+    def test_part_whose_delete_committed_is_kept(self):
+        # Crash after the delete committed but before the index said so
+        save_index = archive.save_index
+        saves = []
+
+        def crash_on_commit(archive_dir, index):
+            saves.append(1)
+            if len(saves) == 3:     # recover, first part pending, then first part committed
+                raise OSError("disk gone")
+            save_index(archive_dir, index)
+
+        with patch.object(archive, "save_index", side_effect=crash_on_commit):
+            with self.assertRaises(OSError):
+                self.archive()
+        index = archive.load_index(self.archive_dir)
+        first = [p for entry in index["months"].values() for p in entry["parts"]]
+        self.assertEqual([(p["status"], p["rows"]) for p in first], [("pending", 3)])
+
+        # The rows are gone from the database, so the part is committed and only the other month is left
+        self.assertEqual(self.archive()["archived"], 2)
+        index = archive.load_index(self.archive_dir)
+        self.assertEqual(sum(entry["rows"] for entry in index["months"].values()), 5)
+        self.assertEqual(len(self.export(archive_dir=self.archive_dir)), 6)
+
+    def test_export_endpoint_streams_hot_and_archived_rows(self):
+        from fastapi.testclient import TestClient
+        import main
+
+        self.archive()
+        client = TestClient(main.app)
+        with patch.dict(os.environ, {"WRONG_QUESTION_ARCHIVE_DIR": self.archive_dir}):
+            response = client.get("/api/admin/wrong_questions/export", params={"user_ids": "1", "include_archive": "true"})
+            self.assertEqual(response.headers["content-type"], "application/x-ndjson")
+            self.assertEqual(len(response.text.splitlines()), 5)
+
+            response = client.get("/api/admin/wrong_questions/export", params={"format": "csv"})
+            self.assertEqual([r["question_content"] for r in csv.DictReader(io.StringIO(response.text))], ["new"])
+
+        self.assertEqual(client.get("/api/admin/wrong_questions/export", params={"user_ids": "x"}).json()["status"], "error")
+        self.assertEqual(client.get("/api/admin/wrong_questions/export", params={"format": "xml"}).json()["status"], "error")
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=0)
@@ -0,0 +1,329 @@
+# tracing.py
+# Lightweight per-request span tracing.
+#
+# - span("llm.question") / @traced("db.get_topic_score") record a span tree for the current request
+#   (context variables, so spans opened in FastAPI's worker threads land in the request's trace)
+# - TracingMiddleware adds a Server-Timing header: time per span category (the part of the name
+#   before the first dot), e.g. "db;dur=4.1, exa;dur=812.0, llm;dur=6120.4, total;dur=6990.2"
+# - Requests slower than SLOW_REQUEST_MS keep their full span tree in a ring-buffered slow log; SSE streams
+#   and file downloads are ranked by their time to the response headers, not by how long they stayed open
+# - PROFILE_SAMPLE_RATE (default 0, off) profiles that fraction of requests by sampling the stacks
+#   of the threads working inside their spans every PROFILE_INTERVAL seconds
+import functools
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "2000"))
+SLOW_LOG_SIZE = int(os.getenv("SLOW_LOG_SIZE", "100"))
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL = 0.005
+PROFILE_MAX_DEPTH = 48
+
+_current_trace = ContextVar("current_trace", default=None)
+_current_span = ContextVar("current_span", default=None)
+
+
+class Span:
+    __slots__ = ("name", "attrs", "start", "end", "children", "error")
+
+    def __init__(self, name: str, attrs: dict = None):
+        self.name = name
+        self.attrs = attrs or {}
+        self.start = time.perf_counter()
+        self.end = None
+        self.children = []
+        self.error = None
+
+    @property
+    def category(self) -> str:
+        return self.name.split(".", 1)[0]
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end or time.perf_counter()) - self.start) * 1000
+
+    def to_dict(self, origin: float) -> dict:
+        result = {"name": self.name, "start_ms": round((self.start - origin) * 1000, 2),
+                  "duration_ms": round(self.duration_ms, 2)}
+        if self.attrs:
+            result["attrs"] = self.attrs
+        if self.error:
+            result["error"] = self.error
+        if self.children:
+            result["children"] = [child.to_dict(origin) for child in list(self.children)]
+        return result
+
+
+class Trace:
+
+    def __init__(self, name: str, sampled: bool = False):
+        self.root = Span(name)
+        self.started_at = time.time()
+        self.sampled = sampled
+        self.profile = Counter()
+        self.finished = False
+        self.headers_ms = None   # Set for long-lived streams, what the slow log judges them by
+        self._active_threads = Counter()   # thread id -> open span depth, what the sampler looks at
+        self._lock = threading.Lock()
+
+    @property
+    def duration_ms(self) -> float:
+        return self.root.duration_ms
+
+    def finish(self) -> bool:
+        """End the root span; False if it was already finished"""
+        with self._lock:
+            if self.finished:
+                return False
+            self.finished = True
+            self.root.end = time.perf_counter()
+            return True
+
+    def _enter_thread(self):
+        with self._lock:
+            self._active_threads[threading.get_ident()] += 1
+
+    def _exit_thread(self):
+        with self._lock:
+            ident = threading.get_ident()
+            self._active_threads[ident] -= 1
+            if self._active_threads[ident] <= 0:
+                del self._active_threads[ident]
+
+    def active_threads(self) -> list:
+        with self._lock:
+            return list(self._active_threads)
+
+    def add_sample(self, stack: str):
+        """Called by the sampler thread; samples arriving after finish() are dropped"""
+        with self._lock:
+            if not self.finished:
+                self.profile[stack] += 1
+
+    def timings(self) -> dict:
+        """Milliseconds per category; a span nested inside a span of the same category is not counted twice"""
+        totals = {}
+
+        def walk(node, open_categories):
+            if node.category not in open_categories:
+                totals[node.category] = totals.get(node.category, 0.0) + node.duration_ms
+            for child in list(node.children):
+                walk(child, open_categories | {node.category})
+
+        for child in list(self.root.children):
+            walk(child, frozenset())
+        return totals
+
+    def server_timing(self) -> str:
+        parts = [f"{category};dur={ms:.1f}" for category, ms in sorted(self.timings().items())]
+        parts.append(f"total;dur={self.duration_ms:.1f}")
+        return ", ".join(parts)
+
+    def to_dict(self) -> dict:
+        result = {"name": self.root.name, "started_at": self.started_at,
+                  "duration_ms": round(self.duration_ms, 2),
+                  **({"headers_ms": round(self.headers_ms, 2)} if self.headers_ms is not None else {}),
+                  "timings": {k: round(v, 2) for k, v in self.timings().items()},
+                  "spans": [child.to_dict(self.root.start) for child in list(self.root.children)]}
+        if self.sampled:
+            with self._lock:
+                top = self.profile.most_common(20)
+            result["profile"] = [{"stack": stack, "samples": n} for stack, n in top]
+        return result
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Record a span in the current request's trace; a no-op outside a traced request"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    current = Span(name, attrs)
+    (_current_span.get() or trace.root).children.append(current)
+    token = _current_span.set(current)
+    trace._enter_thread()
+    try:
+        yield current
+    except BaseException as e:
+        current.error = type(e).__name__
+        raise
+    finally:
+        current.end = time.perf_counter()
+        trace._exit_thread()
+        _current_span.reset(token)
+
+def traced(name: str):
+    """Decorator form of span()"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def current_trace():
+    return _current_trace.get()
+
+
+# ================= Slow Log / Profiler =================
+
+class SlowLog:
+    """The last `capacity` requests slower than `threshold_ms`, with their span trees"""
+
+    def __init__(self, threshold_ms: float = SLOW_REQUEST_MS, capacity: int = SLOW_LOG_SIZE):
+        self.threshold_ms = threshold_ms
+        self._entries = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+
+    def offer(self, trace: Trace) -> bool:
+        duration_ms = trace.duration_ms if trace.headers_ms is None else trace.headers_ms
+        if duration_ms < self.threshold_ms:
+            return False
+        entry = trace.to_dict()
+        with self._lock:
+            self._entries.append(entry)
+        return True
+
+    def entries(self) -> list:
+        """Newest first"""
+        with self._lock:
+            return list(reversed(self._entries))
+
+
+def fold_stack(frame, max_depth: int = PROFILE_MAX_DEPTH) -> str:
+    """'file:function;file:function' from the outermost frame in, flame graph 'folded' format"""
+    names = []
+    while frame is not None and len(names) < max_depth:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class StackSampler:
+    """One background thread samples every registered trace; it sleeps while there is nothing to profile"""
+
+    def __init__(self, interval: float = PROFILE_INTERVAL):
+        self.interval = interval
+        self.totals = Counter()
+        self.samples = 0
+        self._traces = set()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def register(self, trace: Trace):
+        with self._cond:
+            self._traces.add(trace)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def unregister(self, trace: Trace):
+        with self._cond:
+            self._traces.discard(trace)
+
+    def _run(self):
+        own = threading.get_ident()
+        while True:
+            with self._cond:
+                while not self._traces:
+                    self._cond.wait()
+                traces = list(self._traces)
+            frames = sys._current_frames()
+            for trace in traces:
+                for ident in trace.active_threads():
+                    frame = frames.get(ident)
+                    if frame is None or ident == own:
+                        continue
+                    stack = fold_stack(frame)
+                    trace.add_sample(stack)
+                    with self._cond:
+                        self.totals[stack] += 1
+                        self.samples += 1
+            del frames
+            time.sleep(self.interval)
+
+    def snapshot(self, top: int = 50) -> dict:
+        with self._cond:
+            return {"samples": self.samples,
+                    "stacks": [{"stack": stack, "samples": n} for stack, n in self.totals.most_common(top)]}
+
+
+class Tracer:
+
+    def __init__(self, sample_rate: float = PROFILE_SAMPLE_RATE, slow_log: SlowLog = None,
+                 sampler: StackSampler = None):
+        self.sample_rate = sample_rate
+        self.slow_log = slow_log or SlowLog()
+        self.sampler = sampler or StackSampler()
+
+    def start(self, name: str) -> Trace:
+        trace = Trace(name, sampled=self.sample_rate > 0 and random.random() < self.sample_rate)
+        if trace.sampled:
+            self.sampler.register(trace)
+        return trace
+
+    def finish(self, trace: Trace):
+        if not trace.finish():
+            return
+        if trace.sampled:
+            self.sampler.unregister(trace)
+        self.slow_log.offer(trace)
+
+    @contextmanager
+    def activate(self, trace: Trace):
+        token = _current_trace.set(trace)
+        try:
+            yield trace
+        finally:
+            _current_trace.reset(token)
+
+
+def is_long_lived(headers) -> bool:
+    """An SSE stream or a download, whose duration is set by the client rather than by the server"""
+    headers = {name.lower(): value for name, value in headers}
+    return (headers.get(b"content-type", b"").startswith(b"text/event-stream")
+            or headers.get(b"content-disposition", b"").startswith(b"attachment"))
+
+
+class TracingMiddleware:
+    """ASGI middleware: one trace per HTTP request, finished with the last body chunk, so streamed responses
+    (SSE, exports) are covered; the Server-Timing header carries the timings up to the response headers"""
+
+    def __init__(self, app, tracer: Tracer):
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        trace = self.tracer.start(f"{scope['method']} {scope['path']}")
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                if is_long_lived(message.get("headers", [])):
+                    trace.headers_ms = trace.duration_ms
+                headers = list(message.get("headers", [])) + [(b"server-timing", trace.server_timing().encode("latin-1"))]
+                message = dict(message, headers=headers)
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                self.tracer.finish(trace)
+
+        with self.tracer.activate(trace):
+            try:
+                await self.app(scope, receive, send_with_timing)
+            finally:
+                self.tracer.finish(trace)
+
+
+tracer = Tracer()
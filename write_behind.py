@@ -0,0 +1,283 @@
+# write_behind.py
+# Optional write-behind buffer for wrong question inserts (WRONG_QUESTION_WRITE_BEHIND=1).
+#
+# Every record is appended to a spool file first, then flushed to the database as one multi-row
+# insert when the batch is full or the flush interval elapses. A flush seals the current spool file
+# and inserts it under its file name as batch id; the storage backend remembers applied batch ids in
+# the same transaction, so replaying a spool file after a crash never inserts a row twice.
+#
+# Reads merge the not yet flushed records through read_through(), which retries around flushes
+# (seqlock: the generation is odd while a batch is being written) so a row is never seen twice or missed.
+#
+# Every process spools into its own proc-<host>-<pid>-<random> subdirectory, locked while the process lives.
+# On start a process adopts the spool files of subdirectories whose owner is gone (lock free) and replays them.
+# A batch that keeps failing while the batches behind it go through is moved to quarantine/ after
+# MAX_ATTEMPTS failures, so one bad batch cannot hold up the rest.
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from file_lock import try_lock
+
+SPOOL_SUFFIX = ".ndjson"
+PROCESS_PREFIX = "proc-"
+OWNER_LOCK = "owner.lock"
+QUARANTINE_DIR = "quarantine"
+MAX_ATTEMPTS = 5
+
+FIELDS = ("user_id", "category", "question_content", "student_answer", "correct_answer", "root_cause", "improvement")
+
+
+class _Batch:
+    __slots__ = ("batch_id", "path", "records", "attempts")
+
+    def __init__(self, batch_id, path, records):
+        self.batch_id = batch_id
+        self.path = path
+        self.records = records
+        self.attempts = 0
+
+
+class WrongQuestionWriteBehind:
+
+    def __init__(self, write_batch, spool_dir: str, max_batch: int = 200, flush_interval: float = 1.0,
+                 fsync: bool = False, read_wait: float = 2.0, max_attempts: int = MAX_ATTEMPTS):
+        """write_batch(batch_id, rows) -> bool inserts rows atomically, False if batch_id was already applied"""
+        self.write_batch = write_batch
+        self.spool_root = spool_dir
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.read_wait = read_wait
+        self.max_attempts = max_attempts
+        os.makedirs(spool_dir, exist_ok=True)
+        self.spool_dir = os.path.join(spool_dir, f"{PROCESS_PREFIX}{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}")
+        os.makedirs(self.spool_dir)
+        self._owner_lock = try_lock(os.path.join(self.spool_dir, OWNER_LOCK))
+
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._generation = 0
+        self._current = None          # _Batch being appended to
+        self._current_file = None
+        self._sealed = []             # _Batch waiting to be written, oldest first
+        self._closed = False
+        self.stats = {"buffered": 0, "flushed_batches": 0, "flushed_rows": 0, "replayed_batches": 0,
+                      "failed_flushes": 0, "quarantined_batches": 0, "last_error": None}
+
+        self._recover()
+        self._thread = threading.Thread(target=self._flush_loop, name="wrong-question-write-behind", daemon=True)
+        self._thread.start()
+
+    # ---------- Writing ----------
+
+    def add(self, user_id: int, category: str, content: str, student_ans: str, correct_ans: str,
+            root_cause: str, improvement: str):
+        record = {"user_id": user_id, "category": category, "question_content": content,
+                  "student_answer": student_ans, "correct_answer": correct_ans, "root_cause": root_cause,
+                  "improvement": improvement, "created_at": datetime.now().replace(microsecond=0)}
+        line = json.dumps(dict(record, created_at=record["created_at"].isoformat(" ")), ensure_ascii=False) + "\n"
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("write-behind buffer is closed")
+            if self._current is None:
+                batch_id = f"wq-{time.time_ns()}-{uuid.uuid4().hex[:8]}"
+                path = os.path.join(self.spool_dir, batch_id + SPOOL_SUFFIX)
+                self._current = _Batch(batch_id, path, [])
+                self._current_file = open(path, "a", encoding="utf-8")
+            self._current_file.write(line)
+            self._current_file.flush()          # Survives a process crash
+            if self.fsync:
+                os.fsync(self._current_file.fileno())   # Survives a power loss too
+            self._current.records.append(record)
+            self.stats["buffered"] += 1
+            if len(self._current.records) >= self.max_batch:
+                self._cond.notify_all()
+
+    def flush(self) -> int:
+        """Seal the current spool file and write every pending batch; returns rows written"""
+        with self._flush_lock:
+            with self._cond:
+                self._seal_locked()
+                batches = list(self._sealed)
+            written = 0
+            failed = []
+            succeeded = previous_failed = False
+            for batch in batches:
+                with self._cond:
+                    self._generation += 1      # Odd: a batch may become visible in the database any moment
+                try:
+                    applied = self.write_batch(batch.batch_id, [self._row(r) for r in batch.records])
+                except Exception as e:
+                    with self._cond:
+                        self._generation += 1
+                        self.stats["failed_flushes"] += 1
+                        self.stats["last_error"] = str(e)
+                        self._cond.notify_all()
+                    print(f"⚠️ Wrong question write-behind flush failed, will retry: {e}")
+                    if previous_failed:
+                        break       # Two failures in a row: the database is down, retry later
+                    failed.append(batch)
+                    previous_failed = True
+                    continue        # Probe the next batch to tell a bad batch from an outage
+                with self._cond:
+                    self._sealed.remove(batch)
+                    self._generation += 1
+                    if applied:
+                        self.stats["flushed_batches"] += 1
+                        self.stats["flushed_rows"] += len(batch.records)
+                    self._cond.notify_all()
+                written += len(batch.records) if applied else 0
+                succeeded, previous_failed = True, False
+                os.remove(batch.path)
+            if succeeded:
+                # Other batches went through, so these failures are about the batches themselves
+                for batch in failed:
+                    batch.attempts += 1
+                    if batch.attempts >= self.max_attempts:
+                        self._quarantine(batch)
+            return written
+
+    def close(self):
+        """Stop the flush thread and write everything still pending (shutdown)"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout=self.flush_interval + 5)
+        self.flush()
+        with self._cond:
+            leftover = bool(self._sealed)
+        if self._owner_lock is not None:
+            self._owner_lock.close()
+            self._owner_lock = None
+        if not leftover:
+            # Nothing left to replay, the directory goes away with the process
+            try:
+                os.remove(os.path.join(self.spool_dir, OWNER_LOCK))
+                os.rmdir(self.spool_dir)
+            except OSError:
+                pass
+
+    def _quarantine(self, batch: _Batch):
+        directory = os.path.join(self.spool_root, QUARANTINE_DIR)
+        os.makedirs(directory, exist_ok=True)
+        with self._cond:
+            self._sealed.remove(batch)
+            self._generation += 2      # The pending view changes, concurrent readers retry
+            self.stats["quarantined_batches"] += 1
+            self._cond.notify_all()
+        os.replace(batch.path, os.path.join(directory, os.path.basename(batch.path)))
+        print(f"❌ Wrong question batch {batch.batch_id} failed {batch.attempts} times, moved to {directory} for manual replay")
+
+    def _seal_locked(self):
+        if self._current is None:
+            return
+        self._current_file.close()
+        self._sealed.append(self._current)
+        self._current, self._current_file = None, None
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.flush_interval
+                while not self._closed and self._pending_count_locked() < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if self._closed:
+                    return
+                if not self._pending_count_locked():
+                    continue
+            self.flush()
+
+    @staticmethod
+    def _row(record: dict) -> tuple:
+        return tuple(record[field] for field in FIELDS) + (record["created_at"],)
+
+    def _adopt_orphans(self):
+        """Move spool files of processes that are gone (their owner lock is free) into our directory"""
+        sources = [self.spool_root]    # Files at the top level come from versions without per-process directories
+        for name in os.listdir(self.spool_root):
+            directory = os.path.join(self.spool_root, name)
+            if name.startswith(PROCESS_PREFIX) and directory != self.spool_dir and os.path.isdir(directory):
+                sources.append(directory)
+        for directory in sources:
+            lock = None
+            if directory != self.spool_root:
+                try:
+                    lock = try_lock(os.path.join(directory, OWNER_LOCK))
+                except OSError:
+                    continue    # Adopted and removed by another process meanwhile
+                if lock is None:
+                    continue    # The owner is alive
+            try:
+                for filename in os.listdir(directory):
+                    if filename.endswith(SPOOL_SUFFIX):
+                        try:
+                            os.replace(os.path.join(directory, filename), os.path.join(self.spool_dir, filename))
+                        except FileNotFoundError:
+                            pass    # Another process adopted it first
+                if lock is not None:
+                    os.remove(os.path.join(directory, OWNER_LOCK))
+                    os.rmdir(directory)
+            except OSError:
+                pass
+            finally:
+                if lock is not None:
+                    lock.close()
+
+    def _recover(self):
+        """Spool files left by processes that are gone become sealed batches, flushed by the first flush"""
+        self._adopt_orphans()
+        for filename in sorted(os.listdir(self.spool_dir)):
+            if not filename.endswith(SPOOL_SUFFIX):
+                continue
+            path = os.path.join(self.spool_dir, filename)
+            records = []
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue    # Torn last line of a crash mid-append
+                    record["created_at"] = datetime.fromisoformat(record["created_at"])
+                    records.append(record)
+            self._sealed.append(_Batch(filename[:-len(SPOOL_SUFFIX)], path, records))
+            self.stats["replayed_batches"] += 1
+
+    # ---------- Reading ----------
+
+    def _pending_count_locked(self) -> int:
+        return sum(len(b.records) for b in self._sealed) + (len(self._current.records) if self._current else 0)
+
+    def _pending_locked(self, user_id=None) -> list:
+        batches = self._sealed + ([self._current] if self._current else [])
+        return [dict(r) for b in batches for r in b.records if user_id is None or r["user_id"] == user_id]
+
+    def read_through(self, query, user_id=None):
+        """(pending records of user_id oldest first, query()) as one consistent view: a record is either
+        still pending or already returned by the query, never both or neither.
+        If a batch write is still in flight after read_wait, only query() is returned (pending is [])."""
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.read_wait
+                while self._generation % 2 and time.monotonic() < deadline:
+                    self._cond.wait(deadline - time.monotonic())
+                if self._generation % 2:
+                    break
+                generation = self._generation
+                pending = self._pending_locked(user_id)
+            result = query()
+            with self._cond:
+                if self._generation == generation:
+                    return pending, result
+        return [], query()
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            return dict(self.stats, pending=self._pending_count_locked(), sealed_batches=len(self._sealed))
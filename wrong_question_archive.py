@@ -0,0 +1,213 @@
+# wrong_question_archive.py
+# Streaming export and archival of the wrong question history.
+#
+#   python wrong_question_archive.py export --users alice,bob --format csv --out class.csv
+#   python wrong_question_archive.py archive --days 180 --dir archive
+#
+# Archived rows are moved into gzip NDJSON parts grouped per month (archive/<YYYY-MM>/part-*.ndjson.gz)
+# and listed in archive/index.json. Their per-(user, category) counts are folded into
+# wrong_question_archive_summary so weaknesses and dashboard counts stay correct.
+import argparse
+import csv
+import gzip
+import io
+import json
+import os
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+from database import (
+    iter_wrong_questions, get_user_ids_by_usernames, get_wrong_questions_older_than,
+    count_wrong_questions_by_ids, archive_wrong_questions, ensure_schema
+)
+
+EXPORT_FIELDS = ["id", "user_id", "username", "category", "question_content", "student_answer",
+                 "correct_answer", "root_cause", "improvement", "created_at"]
+INDEX_FILE = "index.json"
+
+
+# ================= Export =================
+
+def _json_default(value):
+    return value.isoformat(sep=" ") if isinstance(value, datetime) else str(value)
+
+def render_rows(rows, fmt: str = "ndjson"):
+    """Turn an iterable of row dicts into NDJSON or CSV text chunks, one row at a time"""
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({k: _json_default(v) if isinstance(v, datetime) else v for k, v in row.items()})
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+    else:
+        for row in rows:
+            yield json.dumps(row, ensure_ascii=False, default=_json_default) + "\n"
+
+def iter_archived_rows(archive_dir: str, user_ids: list = None):
+    """Replay rows from committed archive parts, only opening parts that contain the requested users"""
+    index = load_index(archive_dir)
+    wanted = set(user_ids) if user_ids else None
+    for month in sorted(index["months"]):
+        for part in index["months"][month]["parts"]:
+            if part["status"] != "committed" or (wanted and not wanted.intersection(part["users"])):
+                continue
+            with gzip.open(os.path.join(archive_dir, part["file"]), "rt", encoding="utf-8") as f:
+                for line in f:
+                    row = json.loads(line)
+                    if not wanted or row["user_id"] in wanted:
+                        yield row
+
+def export_wrong_questions(user_ids: list = None, fmt: str = "ndjson", archive_dir: str = None):
+    """Text chunks for the whole history of the given users: archived parts first, then the hot table"""
+    def rows():
+        if archive_dir and os.path.exists(os.path.join(archive_dir, INDEX_FILE)):
+            yield from iter_archived_rows(archive_dir, user_ids)
+        yield from iter_wrong_questions(user_ids)
+    return render_rows(rows(), fmt)
+
+
+# ================= Archive =================
+
+def load_index(archive_dir: str) -> dict:
+    path = os.path.join(archive_dir, INDEX_FILE)
+    if not os.path.exists(path):
+        return {"months": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_index(archive_dir: str, index: dict):
+    # Write-then-rename so a crash never leaves a half written index behind
+    tmp_path = os.path.join(archive_dir, INDEX_FILE + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, indent=1)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(archive_dir, INDEX_FILE))
+
+def recover_pending_parts(archive_dir: str, index: dict):
+    """A part is 'pending' between writing its file and committing the DB delete. After a crash,
+    rows still present in MySQL mean the delete never committed, so the part is discarded."""
+    for month, entry in index["months"].items():
+        for part in list(entry["parts"]):
+            if part["status"] != "pending":
+                continue
+            if count_wrong_questions_by_ids(part["ids"]):
+                entry["parts"].remove(part)
+                path = os.path.join(archive_dir, part["file"])
+                if os.path.exists(path):
+                    os.remove(path)
+            else:
+                part["status"] = "committed"
+                part.pop("ids")
+                entry["rows"] += part["rows"]
+    save_index(archive_dir, index)
+
+def _write_part(archive_dir: str, month: str, rows: list) -> str:
+    os.makedirs(os.path.join(archive_dir, month), exist_ok=True)
+    name = os.path.join(month, f"part-{time.strftime('%Y%m%d%H%M%S')}-{rows[0]['id']}.ndjson.gz")
+    with gzip.open(os.path.join(archive_dir, name), "wt", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False, default=_json_default) + "\n")
+    with open(os.path.join(archive_dir, name), "rb") as f:
+        os.fsync(f.fileno())
+    return name
+
+def archive_older_than(days: int, archive_dir: str = "archive", batch_size: int = 1000, dry_run: bool = False) -> dict:
+    cutoff = datetime.now() - timedelta(days=days)
+    os.makedirs(archive_dir, exist_ok=True)
+    index = load_index(archive_dir)
+    recover_pending_parts(archive_dir, index)
+
+    stats = {"archived": 0, "parts": 0}
+    after_id = 0
+    while True:
+        rows = get_wrong_questions_older_than(cutoff, after_id, batch_size)
+        if not rows:
+            break
+        after_id = rows[-1]["id"]
+        by_month = defaultdict(list)
+        for row in rows:
+            by_month[row["created_at"].strftime("%Y-%m")].append(row)
+
+        for month, month_rows in by_month.items():
+            stats["archived"] += len(month_rows)
+            if dry_run:
+                continue
+            ids = [row["id"] for row in month_rows]
+            part = {
+                "file": _write_part(archive_dir, month, month_rows),
+                "rows": len(month_rows),
+                "min_id": ids[0],
+                "max_id": ids[-1],
+                "ids": ids,
+                "users": sorted({row["user_id"] for row in month_rows}),
+                "status": "pending",
+            }
+            entry = index["months"].setdefault(month, {"rows": 0, "parts": []})
+            entry["parts"].append(part)
+            save_index(archive_dir, index)
+
+            summary = Counter((row["user_id"], row["category"]) for row in month_rows)
+            archive_wrong_questions(ids, [(uid, category, n) for (uid, category), n in summary.items()])
+
+            part["status"] = "committed"
+            part.pop("ids")  # Only needed for crash recovery, keeps the index small
+            entry["rows"] += part["rows"]
+            save_index(archive_dir, index)
+            stats["parts"] += 1
+        print(f"\r📦 archived {stats['archived']} rows into {stats['parts']} parts", end="", flush=True)
+    print()
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Wrong question history export and archival tool")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export = sub.add_parser("export", help="Stream wrong question history as NDJSON or CSV")
+    export.add_argument("--users", default="", help="Comma separated usernames (default: everyone)")
+    export.add_argument("--format", choices=["ndjson", "csv"], default="ndjson")
+    export.add_argument("--out", default="-", help="Output file, '-' for stdout")
+    export.add_argument("--archive-dir", default=None, help="Also include rows from this archive")
+
+    archive = sub.add_parser("archive", help="Move rows older than N days into compressed monthly files")
+    archive.add_argument("--days", type=int, required=True)
+    archive.add_argument("--dir", default="archive")
+    archive.add_argument("--batch-size", type=int, default=1000)
+    archive.add_argument("--dry-run", action="store_true")
+
+    args = parser.parse_args(argv)
+    ensure_schema()
+
+    if args.command == "export":
+        usernames = [u.strip() for u in args.users.split(",") if u.strip()]
+        user_ids = None
+        if usernames:
+            found = get_user_ids_by_usernames(usernames)
+            missing = set(usernames) - set(found)
+            if missing:
+                print(f"⚠️ Unknown usernames skipped: {', '.join(sorted(missing))}", file=sys.stderr)
+            user_ids = list(found.values())
+            if not user_ids:
+                return 1
+        out = sys.stdout if args.out == "-" else open(args.out, "w", encoding="utf-8", newline="")
+        try:
+            for chunk in export_wrong_questions(user_ids, args.format, args.archive_dir):
+                out.write(chunk)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+    else:
+        stats = archive_older_than(args.days, args.dir, args.batch_size, args.dry_run)
+        print(f"✅ {'Would archive' if args.dry_run else 'Archived'} {stats['archived']} wrong question rows.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())